@@ -0,0 +1,134 @@
+"""
+Admission control for CPU-heavy detection jobs.
+
+AdmissionController lets at most max_in_flight jobs run at once. Further
+requests wait in a bounded queue ordered by priority (lower number first,
+FIFO within a priority); when the queue is full, or a request has waited
+longer than its timeout, it is rejected with Saturated, which carries a
+Retry-After estimate based on recent job durations.
+
+RateLimiter is a per-key (per-camera) token bucket. Buckets that have refilled
+completely are dropped, so the number of keys only grows with recent traffic.
+"""
+
+import heapq
+import itertools
+import math
+import threading
+import time
+
+
+class Rejected(Exception):
+    def __init__(self, reason, retry_after):
+        super().__init__(reason)
+        self.reason = reason
+        self.retry_after = max(1, int(math.ceil(retry_after)))
+
+
+class Saturated(Rejected):
+    label = "saturated"
+
+
+class RateLimited(Rejected):
+    label = "rate_limited"
+
+
+class AdmissionController:
+    def __init__(self, max_in_flight=2, max_queue=8, default_job_seconds=30.0):
+        self.max_in_flight = max_in_flight
+        self.max_queue = max_queue
+        self._cond = threading.Condition()
+        self._in_flight = 0
+        self._waiting = []  # heap of (priority, seq)
+        self._seq = itertools.count()
+        # 最近任务耗时的滑动平均，用于估算 Retry-After
+        self._avg_job_seconds = default_job_seconds
+
+    @property
+    def in_flight(self):
+        return self._in_flight
+
+    @property
+    def queued(self):
+        return len(self._waiting)
+
+    def estimated_wait(self, position=None):
+        """Seconds until a request queued at position (default: at the end) would start."""
+        if position is None:
+            position = len(self._waiting)
+        return self._avg_job_seconds * (position // self.max_in_flight + 1)
+
+    def acquire(self, priority=0, timeout=None):
+        """
+        Wait for a job slot.
+
+        Raises:
+            Saturated: If the queue is full or no slot frees up within timeout.
+        """
+        with self._cond:
+            if self._in_flight < self.max_in_flight and not self._waiting:
+                self._in_flight += 1
+                return
+            if len(self._waiting) >= self.max_queue:
+                raise Saturated("Job queue is full", self.estimated_wait())
+
+            entry = (priority, next(self._seq))
+            heapq.heappush(self._waiting, entry)
+            deadline = None if timeout is None else time.monotonic() + timeout
+            try:
+                while not (self._in_flight < self.max_in_flight and self._waiting[0] == entry):
+                    remaining = None if deadline is None else deadline - time.monotonic()
+                    if remaining is not None and remaining <= 0:
+                        position = sorted(self._waiting).index(entry)
+                        raise Saturated("Timed out waiting for a job slot", self.estimated_wait(position))
+                    self._cond.wait(remaining)
+            except BaseException:
+                self._waiting.remove(entry)
+                heapq.heapify(self._waiting)
+                self._cond.notify_all()
+                raise
+            heapq.heappop(self._waiting)
+            self._in_flight += 1
+            # 队首变化后让下一个等待者检查能否开始
+            self._cond.notify_all()
+
+    def release(self, job_seconds=None):
+        with self._cond:
+            self._in_flight -= 1
+            if job_seconds is not None:
+                self._avg_job_seconds = 0.8 * self._avg_job_seconds + 0.2 * job_seconds
+            self._cond.notify_all()
+
+
+class RateLimiter:
+    """Token bucket per key: rate_per_minute sustained, up to burst at once."""
+
+    def __init__(self, rate_per_minute, burst):
+        self.rate = rate_per_minute / 60.0
+        self.burst = burst
+        self._buckets = {}  # key -> (tokens, last_refill)
+        self._lock = threading.Lock()
+        # 空闲这么久的桶已经回满，与不存在等价，可以删除
+        self._idle_seconds = burst / self.rate if self.rate > 0 else None
+        self._last_sweep = time.monotonic()
+
+    def check(self, key):
+        """
+        Take one token for key.
+
+        Raises:
+            RateLimited: If key has no token left.
+        """
+        if self.rate <= 0:
+            return
+        now = time.monotonic()
+        with self._lock:
+            if now - self._last_sweep >= self._idle_seconds:
+                self._buckets = {k: v for k, v in self._buckets.items() if now - v[1] < self._idle_seconds}
+                self._last_sweep = now
+            tokens, last = self._buckets.get(key, (self.burst, now))
+            tokens = min(self.burst, tokens + (now - last) * self.rate)
+            if tokens < 1:
+                self._buckets[key] = (tokens, now)
+                raise RateLimited(f"Rate limit exceeded for {key}", (1 - tokens) / self.rate)
+            self._buckets[key] = (tokens - 1, now)
@@ -1,18 +1,70 @@
 from datetime import datetime
-import cv2
 import uuid
-import csv
 import os
-from flask import Flask, request, jsonify, send_file
+import io
+import csv
+import json
+import logging
+import re
+import time
+import zlib
+from flask import Flask, request, jsonify, send_file, Response, stream_with_context
 from gtts import gTTS
-from yolo_tracker import YOLOByteTrackWrapper, estimate_speed_by_length
-from license import extract_vehicle_features
+from yolo_tracker import DetectionSettings, YOLOVehicleDetector
+from inference_scheduler import InferenceScheduler
+from pipeline import process_video
+from artifacts import ArtifactWriter
+from storage.camera_registry import get_registry
+from storage.incident_store import open_store, INCIDENT_FIELDS
+from storage.incident_writer import get_writer
+import metrics
+import cpu_resources
+from profiling import JobProfiler, parse_mode
+from admission import AdmissionController, RateLimiter, Rejected
 import random
 
 app = Flask(__name__, static_folder=".", static_url_path="/")
-tracker = YOLOByteTrackWrapper()
-print(f"[DEBUG] Loaded model type: {type(tracker.model)}")
+# 在加载模型之前划分 CPU 核心（ICT_CPU_PLAN，见 cpu_resources.py）
+cpu_plan = cpu_resources.configure()
+# 所有请求的帧在这里合批，一次前向推理服务多路视频
+detector = InferenceScheduler(YOLOVehicleDetector(), max_batch=8, max_latency=0.01)
+print(f"[DEBUG] Loaded model type: {type(detector.model)}")
 SPEED_LIMIT = 60.0  # km/h
+PAGE_SIZE = 1000
+MAX_PAGE_SIZE = 10000
+# 按比例随机抽取请求做性能剖析（0 表示只剖析显式要求的请求）
+PROFILE_SAMPLE_RATE = 0.0
+JOB_ID_PATTERN = re.compile(r"^[0-9a-f]{32}$")
+# 解码放在独立进程，帧经共享内存环形缓冲传入，不经过 pickle；
+# 处理完后保留上传的视频（默认删除，片段和快照已另存）
+KEEP_UPLOADS = False
+# 解码进程通过管道传递槽位，依赖 select()，Windows 上不启用
+DECODE_IN_SUBPROCESS = os.name != "nt"
+# 准入控制：同时运行的任务数、排队上限与等待时间、单摄像头频率、上传大小
+MAX_IN_FLIGHT_JOBS = 2
+MAX_QUEUED_JOBS = 8
+QUEUE_TIMEOUT = 30.0  # seconds
+CAMERA_RATE_PER_MINUTE = 30
+CAMERA_BURST = 5
+MAX_UPLOAD_BYTES = 512 * 1024 * 1024
+# 数值越小越优先：实时摄像头先于仪表盘手动上传
+PRIORITIES = {"live": 0, "camera": 0, "manual": 10, "dashboard": 10}
+DEFAULT_PRIORITY = "manual"
+CAMERA_FILE = os.path.join("speed_monitor_dashboard", "data", "cameras.csv")
+INCIDENT_CSV = os.path.join("speed_monitor_dashboard", "data", "incidents.csv")
+INCIDENT_DB = os.path.join("speed_monitor_dashboard", "data", "incidents.db")
+camera_registry = get_registry(CAMERA_FILE)
+artifact_writer = ArtifactWriter(root="uploads")
+incident_store = open_store(INCIDENT_DB, incidents_csv=INCIDENT_CSV, cameras_csv=CAMERA_FILE)
+incident_writer = get_writer(incident_store)
+metrics.QUEUE_DEPTH.set_function(detector.pending, queue="inference")
+metrics.QUEUE_DEPTH.set_function(incident_writer.pending, queue="incident_writer")
+metrics.QUEUE_DEPTH.set_function(artifact_writer.pending, queue="snapshots")
+# 超出 MAX_CONTENT_LENGTH 时 werkzeug 在读取请求体的过程中就中止并返回 413
+app.config["MAX_CONTENT_LENGTH"] = MAX_UPLOAD_BYTES
+admission = AdmissionController(max_in_flight=MAX_IN_FLIGHT_JOBS, max_queue=MAX_QUEUED_JOBS)
+camera_rate_limiter = RateLimiter(CAMERA_RATE_PER_MINUTE, CAMERA_BURST)
+metrics.QUEUE_DEPTH.set_function(lambda: admission.queued, queue="admission")
 
 def generate_bd_license_plate():
     city = "DHAKA"
@@ -21,134 +73,93 @@ def generate_bd_license_plate():
     number = str(random.randint(1, 9999)).zfill(4)
     return f"{city} {vehicle_type} {year}-{number}"
 
+def _reject(error):
+    metrics.ADMISSION_REJECTED.inc(reason=error.label)
+    response = jsonify({"error": error.reason, "retry_after": error.retry_after})
+    response.status_code = 429
+    response.headers["Retry-After"] = str(error.retry_after)
+    return response
+
+
+@app.errorhandler(413)
+def upload_too_large(e):
+    metrics.ADMISSION_REJECTED.inc(reason="too_large")
+    return jsonify({"error": f"Upload exceeds {MAX_UPLOAD_BYTES} bytes"}), 413
+
+
 @app.route("/detect", methods=["POST"])
 def violation_detect():
-    camera_id = request.form.get("camera_id")
+    if request.content_length is not None and request.content_length > MAX_UPLOAD_BYTES:
+        return upload_too_large(None)
+
+    # camera_id 与优先级可放在查询参数或请求头里，这样被拒绝或排队的请求不会先收完整个视频
+    priority = (request.headers.get("X-Priority") or request.args.get("priority") or DEFAULT_PRIORITY).lower()
+    if priority not in PRIORITIES:
+        return jsonify({"error": f"Unknown priority: {priority}"}), 400
+    camera_id = request.args.get("camera_id") or request.headers.get("X-Camera-Id") or request.form.get("camera_id")
     if not camera_id:
         return jsonify({"error": "Missing camera_id"}), 400
+    try:
+        camera = camera_registry.get(camera_id)
+    except FileNotFoundError:
+        return jsonify({"error": "cameras.csv not found"}), 500
+    # 未登记的摄像头共用一个限流桶和指标标签，客户端无法通过随意的 camera_id 让它们无限增长
+    camera_key = camera_id if camera is not None else metrics.UNKNOWN_CAMERA
+
+    try:
+        camera_rate_limiter.check(camera_key)
+        admission.acquire(PRIORITIES[priority], timeout=QUEUE_TIMEOUT)
+    except Rejected as e:
+        return _reject(e)
+    started = time.monotonic()
+    try:
+        return _run_detection(camera_id, camera, camera_key)
+    finally:
+        admission.release(time.monotonic() - started)
+
+
+def _run_detection(camera_id, camera, camera_key):
+    cpu_resources.pin("pipeline")
     if 'video' not in request.files:
         return jsonify({"error": "No video file provided"}), 400
 
-    camera_info = {}
-    camera_file_path = os.path.join("speed_monitor_dashboard", "data", "cameras.csv")
-    if os.path.isfile(camera_file_path):
-        with open(camera_file_path, "r", encoding="utf-8") as f:
-            reader = csv.DictReader(f)
-            for row in reader:
-                if row["camera_id"] == camera_id:
-                    camera_info = row
-                    break
-    else:
-        return jsonify({"error": "cameras.csv not found"}), 500
-
-    latitude = camera_info.get("latitude", "")
-    longitude = camera_info.get("longitude", "")
-    speed_limit = float(camera_info.get("speed_limit", SPEED_LIMIT))
+    latitude = camera.latitude if camera and camera.latitude is not None else ""
+    longitude = camera.longitude if camera and camera.longitude is not None else ""
+    speed_limit = camera.speed_limit if camera and camera.speed_limit is not None else SPEED_LIMIT
+    # tune_cameras.py 写入 cameras.csv 的每摄像头检测参数
+    settings = DetectionSettings.from_config(camera.extra) if camera else None
 
+    # 每个请求一个唯一的 job_id，所有产物都以它命名，避免不同请求互相覆盖
+    job_id = uuid.uuid4().hex
     video_file = request.files['video']
-    os.makedirs("uploads", exist_ok=True)
-    video_path = os.path.join("uploads", video_file.filename)
+    video_path = artifact_writer.upload_path(job_id, video_file.filename)
+    os.makedirs(os.path.dirname(video_path), exist_ok=True)
     video_file.save(video_path)
 
-    cap = cv2.VideoCapture(video_path)
-    output_path = os.path.join("uploads", "annotated_output.mp4")
-    fourcc = cv2.VideoWriter_fourcc(*'mp4v')
-    out_writer = cv2.VideoWriter(output_path, fourcc, cap.get(cv2.CAP_PROP_FPS) or 30, (int(cap.get(3)), int(cap.get(4))))
-    fps = cap.get(cv2.CAP_PROP_FPS) or 30
-
-    snapshot_dir = os.path.join("uploads", "snapshots")
-    os.makedirs(snapshot_dir, exist_ok=True)
-
-    track_data = {}
-    frame_id = 0
-
-    while cap.isOpened():
-        ret, frame = cap.read()
-        if not ret:
-            break
-        frame_id += 1
-
-        tracked_vehicles = tracker.detect_and_track(frame)
-        for vehicle in tracked_vehicles:
-            x, y, w, h = vehicle["bbox"]
-            track_id = vehicle["id"]
-            class_name = vehicle["class_name"]
-
-            if track_id not in track_data:
-                track_data[track_id] = {
-                    "positions": [], "bboxes": [], "class": class_name,
-                    "features": extract_vehicle_features(frame, (x, y, w, h), class_name),
-                    "snapshot_frame": None
-                }
-
-            cx, cy = x + w // 2, y + h
-            track_data[track_id]["positions"].append((frame_id, (cx, cy)))
-            track_data[track_id]["bboxes"].append((x, y, w, h))
-            track_data[track_id]["bbox"] = (x, y, w, h)
-            track_data[track_id]["snapshot_frame"] = frame.copy()
-            track_data[track_id]["speed"] = estimate_speed_by_length(
-                track_data[track_id]["positions"],
-                track_data[track_id]["bboxes"],
-                fps,
-                class_name
+    # 通过请求头 X-Profile 或表单字段 profile 开启（1/cprofile/sample）
+    profile_mode = parse_mode(request.headers.get("X-Profile") or request.form.get("profile"))
+    if profile_mode is None and PROFILE_SAMPLE_RATE and random.random() < PROFILE_SAMPLE_RATE:
+        profile_mode = "sample"
+    profiler = JobProfiler(job_id, profile_mode, artifact_writer.profile_path(job_id))
+
+    # 检测模型全局共享，跟踪器与轨迹状态每个请求独立，ID 不会在请求间串号
+    started = time.perf_counter()
+    metrics.ACTIVE_JOBS.inc(kind="detect")
+    try:
+        with profiler:
+            _, overspeed_vehicles = process_video(
+                video_path, detector, camera_id, speed_limit, latitude, longitude,
+                artifact_writer=artifact_writer, job_id=job_id, decode_process=DECODE_IN_SUBPROCESS,
+                settings=settings, metrics_label=camera_key
             )
+    finally:
+        metrics.ACTIVE_JOBS.dec(kind="detect")
+        if not KEEP_UPLOADS:
+            os.remove(video_path)
+    metrics.JOB_SECONDS.observe(time.perf_counter() - started)
 
-            color = (0, 255, 0) if track_data[track_id]['speed'] <= SPEED_LIMIT else (0, 0, 255)
-            label = f"{class_name} {track_data[track_id]['speed']:.1f} km/h ID:{track_id}"
-            cv2.rectangle(frame, (x, y), (x + w, y + h), color, 2)
-            cv2.putText(frame, label, (x, y - 10), cv2.FONT_HERSHEY_SIMPLEX, 0.5, color, 1)
-
-        out_writer.write(frame)
-
-    cap.release()
-    out_writer.release()
-
-    overspeed_vehicles = []
-    db_path = os.path.join("speed_monitor_dashboard", "data", "incidents.csv")
-    os.makedirs(os.path.dirname(db_path), exist_ok=True)
-    file_exists = os.path.isfile(db_path)
-
-    if file_exists:
-        with open(db_path, "rb+") as f:
-            f.seek(-1, os.SEEK_END)
-            if f.read(1) != b'\n':
-                f.write(b'\n')
-
-    with open(db_path, "a", newline="", encoding="utf-8") as csvfile:
-        writer = csv.DictWriter(csvfile, fieldnames=[
-            "timestamp", "camera_id", "license_plate", "latitude", "longitude",
-            "speed_limit", "actual_speed", "speed_difference", "image_url"
-        ])
-        if not file_exists:
-            writer.writeheader()
-
-        for car_id, info in track_data.items():
-            speed = info.get("speed", 0.0)
-            if speed > speed_limit:
-                snapshot_path = os.path.join(snapshot_dir, f"{car_id}.jpg")
-                snapshot = info.get("snapshot_frame")
-                if snapshot is not None:
-                    x, y, w, h = info.get("bbox", (0, 0, 0, 0))
-                    cv2.rectangle(snapshot, (x, y), (x + w, y + h), (0, 0, 255), 2)
-                    label = f"{speed:.1f} km/h"
-                    plate = info["features"].get("plate", car_id)
-                    cv2.putText(snapshot, f"{label}", (x, y - 10), cv2.FONT_HERSHEY_SIMPLEX, 0.6, (0, 0, 255), 2)
-                    cv2.putText(snapshot, f"Plate: {plate}", (x, y + h + 20), cv2.FONT_HERSHEY_SIMPLEX, 0.6, (255, 0, 0), 2)
-                    cv2.imwrite(snapshot_path, snapshot)
-
-                row = {
-                    "timestamp": datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
-                    "camera_id": camera_id,
-                    "license_plate": plate,
-                    "latitude": latitude,
-                    "longitude": longitude,
-                    "speed_limit": speed_limit,
-                    "actual_speed": speed,
-                    "speed_difference": speed - speed_limit,
-                    "image_url": f"../uploads/snapshots/{car_id}.jpg"
-                }
-                writer.writerow(row)
-                overspeed_vehicles.append(row)
+    # 交给后台写线程批量提交，请求线程不等待磁盘
+    incident_writer.submit_many(overspeed_vehicles)
 
     if overspeed_vehicles:
         lines = [
@@ -159,17 +170,173 @@ def violation_detect():
     else:
         tts_text = "No overspeeding vehicles detected."
 
-    tts = gTTS(tts_text)
-    audio_path = os.path.join("uploads", "overspeed_alert.mp3")
-    tts.save(audio_path)
+    # 音频在内存中生成，并发请求不会共用同一个 mp3 文件
+    audio = io.BytesIO()
+    with metrics.stage("tts"):
+        gTTS(tts_text).write_to_fp(audio)
+    audio.seek(0)
 
     # 返回音频文件作为流媒体（不返回 JSON）
-    return send_file(
-        audio_path,
+    response = send_file(
+        audio,
         mimetype="audio/mpeg",
         as_attachment=False,
         download_name="overspeed_alert.mp3"
     )
+    response.headers["X-Job-Id"] = job_id
+    if profiler.enabled:
+        response.headers["X-Profile-Url"] = f"/profiles/{job_id}"
+    return response
+
+def _parse_incident_filters(args):
+    """Read camera/time/speed filters and the keyset cursor from query args."""
+    filters = {
+        "camera_id": args.get("camera_id") or None,
+        "start": args.get("start") or None,
+        "end": args.get("end") or None,
+        "min_speed": args.get("min_speed", type=float),
+        "max_speed": args.get("max_speed", type=float),
+    }
+    for key in ("start", "end"):
+        if filters[key] is not None:
+            filters[key] = datetime.fromisoformat(filters[key])
+    cursor = args.get("cursor", default=0, type=int)
+    limit = args.get("limit", type=int)
+    if limit is not None and limit <= 0:
+        raise ValueError("limit must be positive")
+    return filters, cursor, limit
+
+
+def _gzip_stream(chunks):
+    compressor = zlib.compressobj(6, zlib.DEFLATED, 31)  # wbits=31 -> gzip 格式
+    for chunk in chunks:
+        data = compressor.compress(chunk.encode("utf-8"))
+        if data:
+            yield data
+    yield compressor.flush()
+
+
+def _ndjson_chunks(rows, rows_per_chunk=500):
+    buffer = []
+    for row in rows:
+        buffer.append(json.dumps(row))
+        if len(buffer) >= rows_per_chunk:
+            yield "\n".join(buffer) + "\n"
+            buffer = []
+    if buffer:
+        yield "\n".join(buffer) + "\n"
+
+
+def _csv_chunks(rows, rows_per_chunk=500):
+    fieldnames = ["id"] + INCIDENT_FIELDS
+    out = io.StringIO()
+    writer = csv.DictWriter(out, fieldnames=fieldnames)
+    writer.writeheader()
+    for i, row in enumerate(rows, 1):
+        writer.writerow(row)
+        if i % rows_per_chunk == 0:
+            yield out.getvalue()
+            out.seek(0)
+            out.truncate()
+    yield out.getvalue()
+
+
+def _incident_response(**extra_filters):
+    """Serve incidents as a JSON page (default) or a streamed NDJSON/CSV export.
+
+    Pagination is keyset-based: pass the returned next_cursor (the last id seen)
+    as ?cursor= to continue. Streamed exports start after ?cursor= and run to the
+    end (or ?limit= rows); every row carries its id so clients can resume.
+    """
+    try:
+        filters, cursor, limit = _parse_incident_filters(request.args)
+    except ValueError as e:
+        return jsonify({"error": f"Invalid query parameter: {e}"}), 400
+    for key, value in extra_filters.items():
+        if value is not None and filters.get(key) is None:
+            filters[key] = value
+
+    fmt = request.args.get("format", "json")
+    if fmt == "json":
+        page_size = min(limit or PAGE_SIZE, MAX_PAGE_SIZE)
+        # 多取一行用于判断是否还有下一页
+        items = list(incident_store.iter_by_id(after_id=cursor, limit=page_size + 1, **filters))
+        has_more = len(items) > page_size
+        items = items[:page_size]
+        next_cursor = items[-1]["id"] if has_more else None
+        return jsonify({"items": items, "next_cursor": next_cursor})
+
+    if fmt == "ndjson":
+        mimetype, encode = "application/x-ndjson", _ndjson_chunks
+    elif fmt == "csv":
+        mimetype, encode = "text/csv", _csv_chunks
+    else:
+        return jsonify({"error": f"Unsupported format: {fmt}"}), 400
+
+    chunks = encode(incident_store.iter_by_id(after_id=cursor, limit=limit, **filters))
+    headers = {"Vary": "Accept-Encoding"}
+    if "gzip" in request.headers.get("Accept-Encoding", ""):
+        chunks = _gzip_stream(chunks)
+        headers["Content-Encoding"] = "gzip"
+    else:
+        chunks = (chunk.encode("utf-8") for chunk in chunks)
+    return Response(stream_with_context(chunks), mimetype=mimetype, headers=headers)
+
+
+@app.route("/vehicles", methods=["GET"])
+def list_vehicles():
+    return _incident_response()
+
+
+@app.route("/violations", methods=["GET"])
+def list_violations():
+    # 按每条记录所在摄像头的限速判断是否超速，与全局 SPEED_LIMIT 无关；min_speed 仍可作为额外筛选
+    return _incident_response(overspeed=True)
+
+
+@app.route("/metrics", methods=["GET"])
+def prometheus_metrics():
+    return Response(metrics.render(), mimetype="text/plain; version=0.0.4")
+
+
+@app.route("/profiles/<job_id>", methods=["GET"])
+def get_profile(job_id):
+    """Profiling report of a job: JSON summary, or ?format=prof / ?format=folded for the raw profile."""
+    if not JOB_ID_PATTERN.match(job_id):
+        return jsonify({"error": "Invalid job id"}), 400
+    fmt = request.args.get("format", "json")
+    extensions = {"json": (".json", "application/json"), "prof": (".prof", "application/octet-stream"),
+                  "folded": (".folded", "text/plain")}
+    if fmt not in extensions:
+        return jsonify({"error": f"Unsupported format: {fmt}"}), 400
+    extension, mimetype = extensions[fmt]
+    path = artifact_writer.profile_path(job_id) + extension
+    if not os.path.isfile(path):
+        return jsonify({"error": "No profile for this job"}), 404
+    return send_file(os.path.abspath(path), mimetype=mimetype, as_attachment=fmt != "json",
+                     download_name=f"{job_id}{extension}")
+
+
+@app.route("/get_speed_limit", methods=["GET"])
+def get_speed_limit():
+    return jsonify({"speed_limit": SPEED_LIMIT})
+
+
+@app.route("/set_speed_limit", methods=["POST"])
+def set_speed_limit():
+    global SPEED_LIMIT
+    data = request.get_json(silent=True) or {}
+    try:
+        value = float(data["value"])
+    except (KeyError, TypeError, ValueError):
+        return jsonify({"error": "Expected JSON body {\"value\": <km/h>}"}), 400
+    if value <= 0:
+        return jsonify({"error": "Speed limit must be positive"}), 400
+    SPEED_LIMIT = value
+    return jsonify({"speed_limit": SPEED_LIMIT})
+
 
 if __name__ == "__main__":
-    app.run(debug=True, port=5000)
+    # 后台写线程（事故提交、快照）的错误通过 logging 输出
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s [%(levelname)s] %(name)s: %(message)s")
+    app.run(debug=True, port=5000, threaded=True)
@@ -0,0 +1,194 @@
+import logging
+import os
+import queue
+import threading
+from concurrent.futures import ThreadPoolExecutor, wait
+from functools import partial
+
+import cv2
+
+import cpu_resources
+import metrics
+
+THUMBNAIL_MAX_SIDE = 320
+THUMBNAIL_QUALITY = 80
+SNAPSHOT_QUALITY = 90
+
+logger = logging.getLogger(__name__)
+
+
+def thumbnail_path(image_path):
+    """uploads/snapshots/12.jpg -> uploads/snapshots/12.thumb.jpg"""
+    root, _ = os.path.splitext(image_path)
+    return f"{root}.thumb.jpg"
+
+
+def make_thumbnail(image, max_side=THUMBNAIL_MAX_SIDE):
+    h, w = image.shape[:2]
+    scale = max_side / max(h, w)
+    if scale >= 1:
+        return image
+    # INTER_AREA 缩小时质量最好
+    return cv2.resize(image, (max(1, int(w * scale)), max(1, int(h * scale))), interpolation=cv2.INTER_AREA)
+
+
+def write_thumbnail(image, image_path, max_side=THUMBNAIL_MAX_SIDE, quality=THUMBNAIL_QUALITY):
+    """Write a small JPEG next to image_path and return its path."""
+    path = thumbnail_path(image_path)
+    write_jpeg(make_thumbnail(image, max_side), path, quality)
+    return path
+
+
+def write_jpeg(image, path, quality=SNAPSHOT_QUALITY):
+    """Encode to JPEG in memory and move it into place atomically."""
+    with metrics.stage("jpeg_encode"):
+        ok, data = cv2.imencode(".jpg", image, [cv2.IMWRITE_JPEG_QUALITY, quality])
+    if not ok:
+        raise IOError(f"JPEG encoding failed for {path}")
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp_path = f"{path}.{threading.get_ident()}.tmp"
+    with open(tmp_path, "wb") as f:
+        f.write(data.tobytes())
+    os.replace(tmp_path, path)
+
+
+def sharded_path(root, key, filename):
+    """root/ab/cd/filename for a hex key "abcd...", so no directory grows without bound."""
+    return os.path.join(root, key[:2], key[2:4], filename)
+
+
+class ClipWriter:
+    """cv2.VideoWriter driven from its own thread; write() only enqueues the frame."""
+
+    def __init__(self, path, fps, size, fourcc="mp4v", max_pending=32):
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        self.path = path
+        self.closed = False
+        self._writer = cv2.VideoWriter(path, cv2.VideoWriter_fourcc(*fourcc), fps, size)
+        # 有界队列：编码跟不上时让生产者等待，而不是无限占用内存
+        self._queue = queue.Queue(maxsize=max_pending)
+        self._thread = threading.Thread(target=self._run, name="clip-writer", daemon=True)
+        self._thread.start()
+
+    def _run(self):
+        cpu_resources.pin("encode")
+        while True:
+            item = self._queue.get()
+            if item is None:
+                break
+            frame, on_written = item
+            with metrics.stage("clip_encode"):
+                self._writer.write(frame)
+            if on_written is not None:
+                on_written()
+        self._writer.release()
+
+    def write(self, frame, on_written=None):
+        """Queue a frame; on_written() is called once it has been encoded (e.g. to free a ring slot)."""
+        self._queue.put((frame, on_written))
+
+    def close(self, wait=False):
+        """Finish the clip in the background; pass wait=True to block until it is on disk."""
+        self.closed = True
+        self._queue.put(None)
+        if wait:
+            self._thread.join()
+
+    def join(self, timeout=None):
+        self._thread.join(timeout)
+
+    def is_alive(self):
+        return self._thread.is_alive()
+
+
+class ArtifactWriter:
+    """
+    Pool that annotates and JPEG-encodes snapshots and thumbnails off the request path.
+
+    Artifacts are named by job id (unique per /detect call) plus the track id,
+    and sharded by the first hex digits of the job id, e.g.
+        uploads/snapshots/3f/a2/3fa2...e1-17.jpg
+        uploads/snapshots/3f/a2/3fa2...e1-17.thumb.jpg
+        uploads/clips/3f/a2/3fa2...e1.mp4
+        uploads/profiles/3f/a2/3fa2...e1.json   (only for profiled jobs)
+        uploads/videos/3f/a2/3fa2...e1-<name>   (the uploaded video while it is processed)
+    """
+
+    def __init__(self, root="uploads", max_workers=4, quality=SNAPSHOT_QUALITY):
+        self.root = root
+        self.quality = quality
+        self._outstanding = set()
+        self._clips = []
+        self._lock = threading.Lock()
+        self._pool = ThreadPoolExecutor(
+            max_workers=max_workers, thread_name_prefix="artifact-writer",
+            initializer=cpu_resources.pin, initargs=("encode",)
+        )
+
+    def snapshot_path(self, job_id, name):
+        return sharded_path(os.path.join(self.root, "snapshots"), job_id, f"{job_id}-{name}.jpg")
+
+    def clip_path(self, job_id):
+        return sharded_path(os.path.join(self.root, "clips"), job_id, f"{job_id}.mp4")
+
+    def upload_path(self, job_id, filename):
+        return sharded_path(os.path.join(self.root, "videos"), job_id, f"{job_id}-{os.path.basename(filename)}")
+
+    def profile_path(self, job_id):
+        """Base path (without extension) of a job's profiling report."""
+        return sharded_path(os.path.join(self.root, "profiles"), job_id, job_id)
+
+    def _write_snapshot(self, image, path, annotate):
+        if annotate is not None:
+            with metrics.stage("annotation"):
+                annotate(image)
+        write_jpeg(image, path, self.quality)
+        write_thumbnail(image, path)
+        return path
+
+    def submit_snapshot(self, image, path, annotate=None):
+        """
+        Queue a snapshot (plus its thumbnail) for writing.
+
+        The worker owns ``image`` from now on; ``annotate(image)`` runs in the
+        worker before encoding. Returns a Future resolving to the snapshot path.
+        """
+        future = self._pool.submit(self._write_snapshot, image, path, annotate)
+        with self._lock:
+            self._outstanding.add(future)
+        future.add_done_callback(partial(self._forget, path))
+        return future
+
+    def _forget(self, path, future):
+        with self._lock:
+            self._outstanding.discard(future)
+        error = None if future.cancelled() else future.exception()
+        if error is not None:
+            # 事故记录里的 image_url 会指向不存在的文件，至少要留下日志和计数
+            logger.error("Failed to write snapshot %s", path, exc_info=error)
+            metrics.ARTIFACT_ERRORS.inc(kind="snapshot")
+
+    def pending(self):
+        """Snapshots queued or being written."""
+        with self._lock:
+            # 回调在 Future 完成之后才执行，已完成但尚未移除的不算
+            return sum(1 for future in self._outstanding if not future.done())
+
+    def open_clip(self, path, fps, size):
+        clip = ClipWriter(path, fps, size)
+        with self._lock:
+            self._clips = [c for c in self._clips if c.is_alive()] + [clip]
+        return clip
+
+    def flush(self, timeout=None):
+        """Wait until every snapshot queued and every clip closed so far is on disk."""
+        with self._lock:
+            futures, clips = list(self._outstanding), list(self._clips)
+        wait(futures, timeout=timeout)
+        for clip in clips:
+            # 只等待已经 close() 的片段，仍在写入的片段不会结束
+            if clip.closed:
+                clip.join(timeout)
+
+    def shutdown(self, wait=True):
+        self._pool.shutdown(wait=wait)
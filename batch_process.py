@@ -0,0 +1,294 @@
+"""
+Offline batch processing of recorded footage.
+
+Runs every video in the given directories / globs through the same pipeline as
+/detect (process_video with the camera's speed limit and tuned settings) in a
+pool of worker processes, each with its own detector and its own slice of the
+CPU cores. Snapshots and clips are written under --uploads by the workers;
+incidents are committed to the incident store by this process.
+
+Progress is kept in a JSON-lines manifest (one line per finished or failed
+video, keyed by path, size and mtime), so an interrupted run picks up where it
+stopped. A video counts as done only after its incidents are committed.
+
+The camera of a video is --camera, or else the name of its directory
+(recordings/CAM001/...). With --time-format, the recording start time is
+parsed from the file name and incidents are stamped with when the vehicle was
+seen; otherwise they get the processing time like /detect uploads.
+
+    python batch_process.py recordings/ --workers 4
+    python batch_process.py "footage/CAM001/*.mp4" --camera CAM001 --time-format "%Y%m%d_%H%M%S"
+"""
+
+import argparse
+import glob
+import json
+import logging
+import multiprocessing as mp
+import os
+import time
+import uuid
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from datetime import datetime
+
+import cpu_resources
+from storage.camera_registry import get_registry
+from storage.incident_store import open_store
+from storage.incident_writer import get_writer
+from yolo_tracker import DetectionSettings
+
+VIDEO_EXTENSIONS = (".mp4", ".avi", ".mov", ".mkv", ".ts")
+DEFAULT_MANIFEST = os.path.join("uploads", "batch_manifest.jsonl")
+DEFAULT_SPEED_LIMIT = 60.0
+
+
+def find_videos(inputs):
+    """Video files under directories, matching globs or given directly; sorted, without duplicates."""
+    found = set()
+    for item in inputs:
+        if os.path.isdir(item):
+            for root, _, files in os.walk(item):
+                found.update(os.path.join(root, name) for name in files
+                             if name.lower().endswith(VIDEO_EXTENSIONS))
+        elif os.path.isfile(item):
+            found.add(item)
+        else:
+            found.update(path for path in glob.glob(item, recursive=True) if os.path.isfile(path))
+    return sorted(os.path.abspath(path) for path in found)
+
+
+class Manifest:
+    """Append-only JSON-lines record of processed videos; the last line for a path wins."""
+
+    def __init__(self, path):
+        self.path = path
+        self.entries = {}
+        if os.path.exists(path):
+            with open(path, "r", encoding="utf-8") as f:
+                for line in f:
+                    try:
+                        entry = json.loads(line)
+                    except ValueError:
+                        continue  # 上次中断时写了一半的行
+                    self.entries[entry["path"]] = entry
+
+    @staticmethod
+    def fingerprint(path):
+        """size and mtime of path; empty if it was moved or deleted meanwhile."""
+        try:
+            st = os.stat(path)
+        except OSError:
+            return {}
+        return {"size": st.st_size, "mtime_ns": st.st_mtime_ns}
+
+    def status(self, path):
+        """Status of path's last entry ("done"/"failed"), or None if new or changed since."""
+        entry = self.entries.get(path)
+        if entry is None or any(entry.get(k) != v for k, v in self.fingerprint(path).items()):
+            return None
+        return entry["status"]
+
+    def record(self, path, status, **details):
+        entry = {"path": path, "status": status, **self.fingerprint(path),
+                 "finished_at": datetime.now().isoformat(timespec="seconds"), **details}
+        directory = os.path.dirname(self.path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        with open(self.path, "a", encoding="utf-8") as f:
+            f.write(json.dumps(entry) + "\n")
+            f.flush()
+            os.fsync(f.fileno())
+        self.entries[path] = entry
+
+
+def recorded_at(path, time_format):
+    """Recording start parsed from the file name (without extension), or None."""
+    if not time_format:
+        return None
+    stem = os.path.splitext(os.path.basename(path))[0]
+    try:
+        return datetime.strptime(stem, time_format)
+    except ValueError:
+        print(f"[WARN] Cannot parse start time from {stem!r} with {time_format!r}; using processing time")
+        return None
+
+
+# ---- worker processes -------------------------------------------------------
+
+_worker = {}
+
+
+class _NoOCR:
+    def readtext(self, crop):
+        return []
+
+
+def _init_worker(model_path, detector_kind, uploads, core_slices, ocr):
+    cores = core_slices.get() if core_slices is not None else None
+    if cores:
+        # 切片小于 MIN_CORES_TO_PARTITION 时 CPU 计划不设亲和性，这里先把整个进程限制在切片内
+        if hasattr(os, "sched_setaffinity"):
+            os.sched_setaffinity(0, cores)
+        cpu_resources.configure(cores=cores)
+
+    from artifacts import ArtifactWriter
+    import license
+    if not ocr:
+        license.reader = _NoOCR()
+    if detector_kind == "colorbox":
+        from benchmarks.synthetic_video import ColorBoxDetector
+        _worker["detector"] = ColorBoxDetector()
+    else:
+        from yolo_tracker import YOLOVehicleDetector
+        _worker["detector"] = YOLOVehicleDetector(model_path)
+    _worker["artifact_writer"] = ArtifactWriter(root=uploads)
+
+
+def _run_video(task):
+    from pipeline import process_video
+
+    cpu_resources.pin("pipeline")
+    job_id = uuid.uuid4().hex
+    started = time.perf_counter()
+    job, incidents = process_video(
+        task["path"], _worker["detector"], task["camera_id"], task["speed_limit"],
+        task["latitude"], task["longitude"], artifact_writer=_worker["artifact_writer"], job_id=job_id,
+        settings=task["settings"], recorded_at=task["recorded_at"],
+    )
+    if job.frame_id == 0:
+        raise ValueError("no frames could be decoded")
+    # 快照和视频片段落盘后才算完成，否则中断后清单里会有缺图的记录
+    _worker["artifact_writer"].flush()
+    return {"job_id": job_id, "incidents": incidents, "frames": job.frame_id,
+            "seconds": round(time.perf_counter() - started, 3)}
+
+
+# ---- coordinator -------------------------------------------------------------
+
+def _core_slices(ctx, workers):
+    """One contiguous slice of the available cores per worker, handed out through a queue."""
+    cores = cpu_resources.available_cores()
+    if workers <= 1 or len(cores) < workers:
+        return None
+    size = len(cores) // workers
+    slices = ctx.Queue()
+    for i in range(workers):
+        slices.put(cores[i * size:(i + 1) * size] if i < workers - 1 else cores[i * size:])
+    return slices
+
+
+def build_tasks(videos, registry, camera_id=None, time_format=None, default_speed_limit=DEFAULT_SPEED_LIMIT):
+    tasks = []
+    for path in videos:
+        cam = camera_id or os.path.basename(os.path.dirname(path))
+        camera = registry.get(cam)
+        if camera is None and not camera_id:
+            print(f"[WARN] Skipping {path}: no --camera and directory {cam!r} is not a registered camera")
+            continue
+        tasks.append({
+            "path": path,
+            "camera_id": cam,
+            "speed_limit": camera.speed_limit if camera and camera.speed_limit is not None else default_speed_limit,
+            "latitude": camera.latitude if camera and camera.latitude is not None else "",
+            "longitude": camera.longitude if camera and camera.longitude is not None else "",
+            "settings": DetectionSettings.from_config(camera.extra) if camera else None,
+            "recorded_at": recorded_at(path, time_format),
+        })
+    return tasks
+
+
+def run(tasks, manifest, incident_writer, workers, model_path="yolov8n.pt", detector_kind="yolo",
+        uploads="uploads", ocr=True):
+    """
+    Process tasks in a worker pool, committing incidents and recording each video in the manifest.
+
+    Returns:
+        dict: Counts of done and failed videos and committed incidents.
+    """
+    summary = {"done": 0, "failed": 0, "incidents": 0}
+    if not tasks:
+        return summary
+    # spawn：子进程不继承父进程的模型和线程状态
+    ctx = mp.get_context("spawn")
+    workers = max(1, min(workers, len(tasks)))
+    executor = ProcessPoolExecutor(
+        max_workers=workers, mp_context=ctx, initializer=_init_worker,
+        initargs=(model_path, detector_kind, uploads, _core_slices(ctx, workers), ocr),
+    )
+    try:
+        futures = {executor.submit(_run_video, task): task for task in tasks}
+        for finished, future in enumerate(as_completed(futures), 1):
+            path = futures[future]["path"]
+            try:
+                result = future.result()
+            except Exception as e:
+                summary["failed"] += 1
+                manifest.record(path, "failed", error=f"{type(e).__name__}: {e}")
+                print(f"[ERROR] {finished}/{len(tasks)} {path}: {e}")
+                continue
+
+            # 事故提交成功后再写清单，保证续跑时不会漏掉
+            for incident_future in incident_writer.submit_many(result["incidents"]):
+                incident_future.result()
+            summary["done"] += 1
+            summary["incidents"] += len(result["incidents"])
+            fps = result["frames"] / result["seconds"] if result["seconds"] else 0.0
+            manifest.record(path, "done", job_id=result["job_id"], incidents=len(result["incidents"]),
+                            frames=result["frames"], seconds=result["seconds"])
+            print(f"[INFO] {finished}/{len(tasks)} {path}: {len(result['incidents'])} incidents, "
+                  f"{result['frames']} frames at {fps:.1f} fps")
+    except KeyboardInterrupt:
+        print("[WARN] Interrupted; finished videos are in the manifest, run again to resume")
+        executor.shutdown(wait=False, cancel_futures=True)
+        raise
+    executor.shutdown()
+    return summary
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Process directories of recorded videos through the detection pipeline.")
+    parser.add_argument("inputs", nargs="+", help="video files, directories or glob patterns")
+    parser.add_argument("--camera", help="camera id for all videos (default: each video's directory name)")
+    parser.add_argument("--cameras", default=os.path.join("speed_monitor_dashboard", "data", "cameras.csv"))
+    parser.add_argument("--db", default=os.path.join("speed_monitor_dashboard", "data", "incidents.db"))
+    parser.add_argument("--uploads", default="uploads", help="root for snapshots and clips")
+    parser.add_argument("--manifest", default=DEFAULT_MANIFEST)
+    parser.add_argument("--workers", type=int, default=max(1, (os.cpu_count() or 1) // 8))
+    parser.add_argument("--model", default="yolov8n.pt")
+    parser.add_argument("--detector", choices=["yolo", "colorbox"], default="yolo",
+                        help="colorbox: stand-in detector for benchmarks/synthetic_video.py clips")
+    parser.add_argument("--time-format", help="strptime format of the recording start in file names")
+    parser.add_argument("--speed-limit", type=float, default=DEFAULT_SPEED_LIMIT, help="for cameras without one")
+    parser.add_argument("--no-ocr", action="store_true", help="skip licence plate OCR")
+    parser.add_argument("--skip-failed", action="store_true", help="do not retry videos that failed before")
+    parser.add_argument("--force", action="store_true", help="process videos already marked done")
+    parser.add_argument("--dry-run", action="store_true", help="list the videos that would be processed")
+    args = parser.parse_args(argv)
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s [%(levelname)s] %(name)s: %(message)s")
+
+    manifest = Manifest(args.manifest)
+    videos = find_videos(args.inputs)
+    skip = set() if args.force else {"done", "failed"} if args.skip_failed else {"done"}
+    pending = [path for path in videos if manifest.status(path) not in skip]
+    print(f"[INFO] {len(videos)} videos found, {len(videos) - len(pending)} already processed, {len(pending)} to go")
+
+    tasks = build_tasks(pending, get_registry(args.cameras), args.camera, args.time_format, args.speed_limit)
+    if args.dry_run:
+        for task in tasks:
+            print(f"{task['camera_id']}\t{task['path']}")
+        return None
+
+    incident_writer = get_writer(open_store(args.db, cameras_csv=args.cameras))
+    started = time.perf_counter()
+    try:
+        summary = run(tasks, manifest, incident_writer, args.workers, args.model, args.detector,
+                      args.uploads, ocr=not args.no_ocr)
+    finally:
+        incident_writer.flush()
+    print(f"[INFO] {summary['done']} done, {summary['failed']} failed, {summary['incidents']} incidents "
+          f"in {time.perf_counter() - started:.1f}s")
+    return summary
+
+
+if __name__ == "__main__":
+    main()
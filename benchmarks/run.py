@@ -0,0 +1,297 @@
+"""
+Benchmark suite for the detection pipeline.
+
+Generates a synthetic traffic video (benchmarks/synthetic_video.py), then
+measures throughput and latency of BYTETracker.update, estimate_speed_by_length,
+extract_vehicle_features (one crop at a time and batched per frame) and the
+end-to-end /detect pipeline
+(pipeline.process_video with a colour-box stand-in for YOLO), and checks the
+estimated speeds against the ground truth. Results are written as JSON so runs
+can be compared across commits:
+
+    python -m benchmarks.run --output bench.json
+    python -m benchmarks.run --output new.json --compare bench.json
+
+OCR is replaced by a no-op reader unless --ocr is given (EasyOCR downloads its
+weights on first use).
+"""
+
+import argparse
+import json
+import os
+import platform
+import statistics
+import subprocess
+import tempfile
+import time
+from datetime import datetime
+
+import cv2
+import numpy as np
+
+import cpu_resources
+import license
+from artifacts import ArtifactWriter
+from benchmarks.synthetic_video import ColorBoxDetector, generate
+from inference_scheduler import InferenceScheduler
+from pipeline import process_video
+from tracker.byte_tracker import BYTETracker
+from yolo_tracker import DetectionSettings, estimate_speed_by_length
+
+SPEED_LIMIT = 60.0
+
+
+class _NoOCR:
+    def readtext(self, crop):
+        return []
+
+
+def _latency_summary(samples, items=None):
+    """Throughput and latency percentiles (ms) for a list of per-call durations (s)."""
+    samples = sorted(samples)
+    total = sum(samples)
+    pct = lambda q: samples[min(len(samples) - 1, int(q * len(samples)))] * 1000
+    return {
+        "calls": len(samples),
+        "total_s": round(total, 6),
+        "per_second": round((items if items is not None else len(samples)) / total, 2) if total else None,
+        "mean_ms": round(total / len(samples) * 1000, 4) if samples else None,
+        "p50_ms": round(pct(0.50), 4) if samples else None,
+        "p95_ms": round(pct(0.95), 4) if samples else None,
+        "p99_ms": round(pct(0.99), 4) if samples else None,
+    }
+
+
+def bench_tracker(video, repeat):
+    samples = []
+    for _ in range(repeat):
+        tracker = BYTETracker(frame_rate=video.fps)
+        shape = (video.height, video.width)
+        for boxes in video.boxes:
+            start = time.perf_counter()
+            tracker.update(boxes, shape, shape)
+            samples.append(time.perf_counter() - start)
+    result = _latency_summary(samples)
+    result["detections_per_frame"] = round(statistics.mean(len(b) for b in video.boxes), 2)
+    return result
+
+
+def bench_speed_estimate(video, repeat):
+    histories = []
+    for vehicle in video.vehicles:
+        if len(vehicle.frames) < 2:
+            continue
+        positions, bboxes = [], []
+        for frame_no in vehicle.frames:
+            x1, y1, x2, y2 = vehicle.box(frame_no, video.fps, video.px_per_m)
+            positions.append((frame_no, ((x1 + x2) // 2, y2)))
+            bboxes.append((x1, y1, x2 - x1, y2 - y1))
+        histories.append((vehicle, positions, bboxes))
+
+    samples, errors = [], []
+    for _ in range(repeat):
+        for vehicle, positions, bboxes in histories:
+            start = time.perf_counter()
+            speed = estimate_speed_by_length(positions, bboxes, video.fps, vehicle.class_name)
+            samples.append(time.perf_counter() - start)
+            errors.append(abs(speed - vehicle.speed_kmh))
+    result = _latency_summary(samples)
+    # 用真值轨迹直接估速，误差只来自像素取整，可作为端到端精度的下限
+    result["mean_abs_error_kmh"] = round(statistics.mean(errors), 3) if errors else None
+    return result
+
+
+def bench_features(video, repeat):
+    cap = cv2.VideoCapture(video.path)
+    frames = []
+    frame_no = 0
+    while True:
+        ret, frame = cap.read()
+        if not ret:
+            break
+        frame_no += 1
+        boxes = [(int(x1), int(y1), int(x2 - x1), int(y2 - y1)) for x1, y1, x2, y2, _, _ in video.boxes[frame_no - 1]]
+        if boxes:
+            frames.append((frame, boxes, [ColorBoxDetector.names[int(c)] for c in video.boxes[frame_no - 1][:, 5]]))
+    cap.release()
+
+    samples, batch_samples = [], []
+    crops = sum(len(boxes) for _, boxes, _ in frames)
+    for _ in range(repeat):
+        for frame, boxes, class_names in frames:
+            for bbox, class_name in zip(boxes, class_names):
+                start = time.perf_counter()
+                license.extract_vehicle_features(frame, bbox, class_name)
+                samples.append(time.perf_counter() - start)
+            start = time.perf_counter()
+            license.extract_vehicle_features_batch(frame, boxes, class_names)
+            batch_samples.append(time.perf_counter() - start)
+    result = _latency_summary(samples)
+    # 批量接口按帧计时，per_second 仍是每秒处理的车辆数
+    result["batch"] = _latency_summary(batch_samples, items=crops * repeat)
+    return result
+
+
+def _match_tracks(video, job):
+    """Pair each ground-truth vehicle with the longest track that started on it."""
+    matches = {}
+    for info in job.track_data.values():
+        first_frame, (cx, cy) = info["positions"][0]
+        best_vehicle, best_distance = None, None
+        for vehicle in video.vehicles:
+            if (not vehicle.frames or vehicle.class_name != info["class"]
+                    or abs(vehicle.center_x - cx) >= video.lane_px / 2
+                    or not vehicle.frames[0] <= first_frame <= vehicle.frames[-1]):
+                continue
+            distance = abs(vehicle.box(first_frame, video.fps, video.px_per_m)[3] - cy)
+            if distance < vehicle.length_px / 2 and (best_distance is None or distance < best_distance):
+                best_vehicle, best_distance = vehicle, distance
+        if best_vehicle is not None:
+            current = matches.get(best_vehicle.vehicle_id)
+            if current is None or len(info["positions"]) > len(current["positions"]):
+                matches[best_vehicle.vehicle_id] = info
+    return matches
+
+
+def bench_end_to_end(video, repeat, batch, decode_process, out_dir, settings=None):
+    detector = ColorBoxDetector()
+    if batch:
+        detector = InferenceScheduler(detector)
+    artifact_writer = ArtifactWriter(root=out_dir)
+
+    durations, job = [], None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        job, _ = process_video(video.path, detector, "BENCH", SPEED_LIMIT,
+                               artifact_writer=artifact_writer, decode_process=decode_process, settings=settings)
+        durations.append(time.perf_counter() - start)
+    artifact_writer.shutdown()
+    if batch:
+        detector.close()
+
+    result = _latency_summary(durations, items=video.frame_count * repeat)
+    result["frames_per_second"] = result.pop("per_second")
+    result["ms_per_frame"] = round(sum(durations) / (video.frame_count * repeat) * 1000, 3)
+
+    # 精度：与真值比较估计速度、超速判定和轨迹数量（ID 切换）
+    visible = [v for v in video.vehicles if len(v.frames) >= 2]
+    matches = _match_tracks(video, job)
+    errors = [abs(matches[v.vehicle_id]["speed"] - v.speed_kmh) for v in visible if v.vehicle_id in matches]
+    truly_over = {v.vehicle_id for v in visible if v.speed_kmh > SPEED_LIMIT}
+    flagged = {vid for vid, info in matches.items() if info.get("speed", 0.0) > SPEED_LIMIT}
+    result["accuracy"] = {
+        "ground_truth_vehicles": len(visible),
+        "tracks": len(job.track_data),
+        "matched": len(errors),
+        "mean_abs_error_kmh": round(statistics.mean(errors), 3) if errors else None,
+        "p95_abs_error_kmh": round(sorted(errors)[int(0.95 * (len(errors) - 1))], 3) if errors else None,
+        "within_5kmh": round(sum(e <= 5 for e in errors) / len(errors), 4) if errors else None,
+        "overspeed_precision": round(len(flagged & truly_over) / len(flagged), 4) if flagged else None,
+        "overspeed_recall": round(len(flagged & truly_over) / len(truly_over), 4) if truly_over else None,
+    }
+    return result
+
+
+def _git_commit():
+    try:
+        return subprocess.check_output(["git", "rev-parse", "--short", "HEAD"], text=True,
+                                       stderr=subprocess.DEVNULL).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def _flatten(data, prefix=""):
+    for key, value in data.items():
+        name = f"{prefix}{key}"
+        if isinstance(value, dict):
+            yield from _flatten(value, name + ".")
+        elif isinstance(value, (int, float)) and not isinstance(value, bool):
+            yield name, value
+
+
+def compare(baseline, current):
+    """Print the relative change of every numeric result against a baseline run."""
+    old = dict(_flatten(baseline["results"]))
+    print(f"{'metric':55s} {'baseline':>12s} {'current':>12s} {'change':>9s}")
+    for name, value in _flatten(current["results"]):
+        if name not in old:
+            continue
+        change = f"{(value - old[name]) / old[name] * 100:+.1f}%" if old[name] else ""
+        print(f"{name:55s} {old[name]:12.4g} {value:12.4g} {change:>9s}")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark the detection pipeline on synthetic traffic video.")
+    parser.add_argument("--width", type=int, default=1280)
+    parser.add_argument("--height", type=int, default=720)
+    parser.add_argument("--fps", type=float, default=30)
+    parser.add_argument("--seconds", type=float, default=10)
+    parser.add_argument("--density", type=float, default=20, help="vehicles per lane per minute")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--ocr", action="store_true", help="use the real EasyOCR reader")
+    parser.add_argument("--batch", action="store_true", help="route detection through InferenceScheduler")
+    parser.add_argument("--decode-process", action="store_true", help="decode in a child process (FrameRing)")
+    parser.add_argument("--imgsz", type=int, help="detector input size (the stand-in detector downscales too)")
+    parser.add_argument("--tile-size", type=int, help="tiled detection with this tile size")
+    parser.add_argument("--only", nargs="+", choices=["tracker", "speed", "features", "end_to_end"])
+    parser.add_argument("--output", help="write results to this JSON file")
+    parser.add_argument("--compare", help="baseline JSON file to compare against")
+    args = parser.parse_args(argv)
+
+    if not args.ocr:
+        license.reader = _NoOCR()
+
+    # 与 api_server 一样按 ICT_CPU_PLAN 划分核心，便于比较 ICT_CPU_PLAN=off 的结果
+    cpu_plan = cpu_resources.configure()
+    selected = set(args.only or ["tracker", "speed", "features", "end_to_end"])
+    with tempfile.TemporaryDirectory(prefix="ict-bench-") as tmp:
+        started = time.perf_counter()
+        video = generate(os.path.join(tmp, "synthetic.mp4"), width=args.width, height=args.height,
+                         fps=args.fps, seconds=args.seconds, vehicles_per_lane_minute=args.density,
+                         seed=args.seed)
+        print(f"Generated {video.frame_count} frames, {len(video.vehicles)} vehicles "
+              f"in {time.perf_counter() - started:.1f}s")
+
+        results = {}
+        if "tracker" in selected:
+            results["tracker_update"] = bench_tracker(video, args.repeat)
+        if "speed" in selected:
+            results["estimate_speed"] = bench_speed_estimate(video, args.repeat)
+        if "features" in selected:
+            results["extract_features"] = bench_features(video, args.repeat)
+        if "end_to_end" in selected:
+            settings = DetectionSettings(imgsz=args.imgsz, tile_size=args.tile_size)
+            results["end_to_end"] = bench_end_to_end(video, args.repeat, args.batch, args.decode_process,
+                                                     os.path.join(tmp, "uploads"), settings)
+
+    report = {
+        "meta": {
+            "commit": _git_commit(),
+            "timestamp": datetime.now().isoformat(timespec="seconds"),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "opencv": cv2.__version__,
+            "numpy": np.__version__,
+            "cpu_count": os.cpu_count(),
+            "cpu_plan": cpu_plan.to_dict() if cpu_plan is not None else None,
+            "params": vars(args),
+        },
+        "results": results,
+    }
+    text = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            f.write(text + "\n")
+        print(f"Wrote {args.output}")
+    else:
+        print(text)
+
+    if args.compare:
+        with open(args.compare, "r", encoding="utf-8") as f:
+            compare(json.load(f), report)
+    return report
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,2 @@
+# test_main.py 是直接运行的脚本（导入时就开始处理 data/test2.mp4），不是 pytest 用例
+collect_ignore = ["test_main.py"]
@@ -0,0 +1,251 @@
+"""
+CPU core partitioning between the pipeline's stages.
+
+PyTorch (YOLO and EasyOCR) and OpenCV each size their thread pools to every
+core in the machine, so when inference, OCR and encoding run at the same time
+they oversubscribe the CPU. A CPUPlan splits the cores this process may use
+into one set per stage and gives each stage a thread count to match:
+
+    inference   InferenceScheduler thread and torch's intra-op threads for YOLO
+    pipeline    /detect request threads and stream workers: tracking, EasyOCR, features
+    encode      JPEG snapshots and clip encoding (ArtifactWriter, ClipWriter)
+    decode      decoder child processes and stream reader threads
+
+Threads call pin(stage) once when they start; on Linux that sets the thread's
+CPU affinity (threads and processes it starts later inherit it) and, for torch
+stages, the thread's OpenMP thread count. Without a configured plan pin() does
+nothing. Decoder processes also size OpenCV's pool to the decode stage.
+
+The plan is read from ICT_CPU_PLAN: "off", inline JSON or the path of a JSON
+file mapping a stage to a share of the cores (0.5), a core count (8), a core
+list ("0-7,16") or {"cores": ..., "threads": ...}, e.g.
+
+    ICT_CPU_PLAN='{"inference": 16, "pipeline": 8, "encode": "24-27"}'
+
+Stages left out get the cores that remain, by DEFAULT_SHARES. Machines with
+fewer than MIN_CORES_TO_PARTITION cores are not partitioned: every stage keeps
+all cores and only the thread counts are split.
+"""
+
+import json
+import os
+import threading
+
+STAGES = ("inference", "pipeline", "encode", "decode")
+DEFAULT_SHARES = {"inference": 0.5, "pipeline": 0.25, "encode": 0.125, "decode": 0.125}
+TORCH_STAGES = ("inference", "pipeline")
+MIN_CORES_TO_PARTITION = 8
+INTEROP_THREADS = 1
+
+_plan = None
+_lock = threading.Lock()
+
+
+def available_cores():
+    """Core ids this process may run on (respects taskset / cgroup cpusets)."""
+    if hasattr(os, "sched_getaffinity"):
+        return sorted(os.sched_getaffinity(0))
+    return list(range(os.cpu_count() or 1))
+
+
+def parse_cores(value):
+    """"0-3,8,10-11" -> [0, 1, 2, 3, 8, 10, 11]"""
+    cores = set()
+    for part in str(value).split(","):
+        part = part.strip()
+        if not part:
+            continue
+        first, sep, last = part.partition("-")
+        cores.update(range(int(first), int(last) + 1) if sep else [int(first)])
+    return sorted(cores)
+
+
+def format_cores(cores):
+    """Inverse of parse_cores()."""
+    ranges = []
+    for core in sorted(cores):
+        if ranges and core == ranges[-1][1] + 1:
+            ranges[-1][1] = core
+        else:
+            ranges.append([core, core])
+    return ",".join(str(a) if a == b else f"{a}-{b}" for a, b in ranges)
+
+
+class CPUPlan:
+    """
+    Core set and thread count per stage.
+
+    Args:
+        stages (dict): stage -> {"cores": [core ids], "threads": int}.
+        partitioned (bool): False if every stage shares all cores (no affinity is set).
+    """
+
+    def __init__(self, stages, partitioned=True):
+        self.stages = stages
+        self.partitioned = partitioned
+
+    @classmethod
+    def build(cls, config=None, cores=None):
+        """
+        Partition cores (default: available_cores()) according to config.
+
+        Args:
+            config (dict): stage -> share (float), core count (int), core list (str)
+                or {"cores": ..., "threads": ...}; missing stages use DEFAULT_SHARES.
+            cores (list): Core ids to split.
+        """
+        config = dict(config or {})
+        unknown = set(config) - set(STAGES)
+        if unknown:
+            raise ValueError(f"Unknown CPU plan stage(s): {', '.join(sorted(unknown))}")
+        cores = sorted(cores) if cores is not None else available_cores()
+
+        specs, threads = {}, {}
+        for stage in STAGES:
+            spec = config.get(stage, DEFAULT_SHARES[stage])
+            if isinstance(spec, dict):
+                threads[stage] = spec.get("threads")
+                spec = spec.get("cores", DEFAULT_SHARES[stage])
+            specs[stage] = spec
+
+        if len(cores) < MIN_CORES_TO_PARTITION:
+            # 核数太少时不划分核心，只按份额分配线程数
+            total = len(cores)
+            return cls({
+                stage: {
+                    "cores": cores,
+                    "threads": threads.get(stage) or max(1, round(total * _share(specs[stage], total))),
+                }
+                for stage in STAGES
+            }, partitioned=False)
+
+        assigned = {}
+        for stage, spec in specs.items():
+            if isinstance(spec, str):
+                assigned[stage] = [c for c in parse_cores(spec) if c in cores]
+        remaining = [c for c in cores if not any(c in used for used in assigned.values())]
+
+        # 其余阶段按份额从剩余核心中依次切分，每个阶段至少一个核心
+        auto = [stage for stage in STAGES if stage not in assigned]
+        counts = {stage: max(1, round(_share(specs[stage], len(cores)) * len(cores))) for stage in auto}
+        while sum(counts.values()) > len(remaining) and max(counts.values(), default=0) > 1:
+            counts[max(counts, key=counts.get)] -= 1
+        for stage in auto:
+            assigned[stage], remaining = remaining[:counts[stage]], remaining[counts[stage]:]
+        # 取整后剩下的核心给第一个未显式配置的阶段
+        flexible = [stage for stage in auto if stage not in config]
+        if remaining and flexible:
+            assigned[flexible[0]] = sorted(assigned[flexible[0]] + remaining)
+        for stage in STAGES:
+            if not assigned[stage]:
+                assigned[stage] = cores  # 核心不够分时与所有阶段共享
+
+        return cls({
+            stage: {"cores": assigned[stage], "threads": threads.get(stage) or len(assigned[stage])}
+            for stage in STAGES
+        })
+
+    def cores(self, stage):
+        return self.stages[stage]["cores"]
+
+    def threads(self, stage):
+        return self.stages[stage]["threads"]
+
+    def apply(self):
+        """Process-wide settings; call once at startup, before the models run."""
+        try:
+            import cv2
+            # OpenCV 的线程池是进程级的，主要服务于请求线程里的缩放、颜色转换
+            cv2.setNumThreads(self.threads("pipeline"))
+        except ImportError:
+            pass
+        torch = _torch()
+        if torch is not None:
+            torch.set_num_threads(self.threads("inference"))
+            try:
+                torch.set_num_interop_threads(INTEROP_THREADS)
+            except RuntimeError:
+                pass  # 只能在 torch 开始并行计算之前设置一次
+
+    def pin(self, stage):
+        """Restrict the calling thread to the stage's cores and thread count."""
+        if self.partitioned and hasattr(os, "sched_setaffinity"):
+            try:
+                # Linux 上 pid 0 指调用线程本身，之后创建的线程继承这一亲和性
+                os.sched_setaffinity(0, self.cores(stage))
+            except OSError as e:
+                print(f"[WARN] Cannot pin {stage} thread to cores {format_cores(self.cores(stage))}: {e}")
+        if stage in TORCH_STAGES:
+            torch = _torch()
+            if torch is not None:
+                torch.set_num_threads(self.threads(stage))
+
+    def describe(self):
+        return ", ".join(
+            f"{stage}={format_cores(self.cores(stage))} ({self.threads(stage)} threads)" for stage in STAGES
+        )
+
+    def to_dict(self):
+        return {stage: {"cores": format_cores(s["cores"]), "threads": s["threads"]} for stage, s in self.stages.items()}
+
+
+def _share(spec, total):
+    if isinstance(spec, bool):
+        raise ValueError(f"Invalid CPU plan entry: {spec!r}")
+    if isinstance(spec, float):
+        return spec
+    if isinstance(spec, int):
+        return spec / max(1, total)
+    return len(parse_cores(spec)) / max(1, total)
+
+
+def _torch():
+    try:
+        import torch
+    except ImportError:
+        return None
+    return torch
+
+
+def load_config(value):
+    """ICT_CPU_PLAN value -> config dict, or None when partitioning is turned off."""
+    if value is None or not value.strip():
+        return {}
+    value = value.strip()
+    if value.lower() in ("0", "off", "false", "no"):
+        return None
+    if value.startswith("{"):
+        return json.loads(value)
+    with open(value, "r", encoding="utf-8") as f:
+        return json.load(f)
+
+
+def configure(config=None, cores=None):
+    """
+    Build the plan from config (default: ICT_CPU_PLAN), apply it and make it current.
+
+    Returns:
+        CPUPlan or None: None if ICT_CPU_PLAN turns partitioning off.
+    """
+    global _plan
+    if config is None:
+        config = load_config(os.environ.get("ICT_CPU_PLAN"))
+        if config is None:
+            return None
+    plan = CPUPlan.build(config, cores)
+    with _lock:
+        _plan = plan
+    plan.apply()
+    print(f"[INFO] CPU plan: {plan.describe()}")
+    return plan
+
+
+def current_plan():
+    return _plan
+
+
+def pin(stage):
+    """Pin the calling thread to stage's cores if a plan is configured."""
+    plan = _plan
+    if plan is not None:
+        plan.pin(stage)
@@ -0,0 +1,249 @@
+"""
+Zero-copy frame transport between processes.
+
+A FrameRing is a block of multiprocessing.shared_memory split into fixed-size
+frame slots. The decoder is a separate program (this module run as a script)
+that attaches to the shared memory by name; only small fixed-size records
+travel over its stdin/stdout pipes. The parent grants free slot indices on the
+decoder's stdin, the decoder lets cv2 decode straight into a granted slot and
+reports (slot, frame_id, decode seconds) on stdout, and the parent grants the
+slot again once it has been released. The number of slots bounds how far the
+decoder can run ahead.
+
+The decoder is exec'd with subprocess rather than started by multiprocessing:
+a forked child of the multithreaded server inherits locks held by its other
+threads (inference scheduler, writers, torch) and can deadlock on them, and a
+spawned or forkserver child re-imports the __main__ module, which for
+api_server would load the detector again. The decoder imports nothing
+heavier than cv2 and numpy. POSIX only (select() on pipes).
+"""
+
+import argparse
+import os
+import select
+import struct
+import subprocess
+import sys
+import threading
+import time
+from functools import partial
+from multiprocessing import resource_tracker, shared_memory
+
+import cv2
+import numpy as np
+
+import cpu_resources
+import metrics
+
+GRANT = struct.Struct("<i")  # 父进程 -> 解码进程：可以写入的槽位
+FRAME = struct.Struct("<iqd")  # 解码进程 -> 父进程：槽位、帧号、解码耗时；槽位 -1 表示结束
+END = -1
+
+
+class FrameRing:
+    def __init__(self, slots, shape, dtype=np.uint8, name=None):
+        """
+        Args:
+            slots (int): Number of preallocated frames.
+            shape (tuple): Frame shape, e.g. (1080, 1920, 3).
+            name (str): Attach to the shared memory of an existing ring instead of creating one.
+        """
+        self.slots = slots
+        self.shape = tuple(shape)
+        self.dtype = np.dtype(dtype)
+        self.slot_bytes = int(np.prod(self.shape)) * self.dtype.itemsize
+        if name is None:
+            self._shm = shared_memory.SharedMemory(create=True, size=self.slots * self.slot_bytes)
+            self._owner = True
+        else:
+            self._shm = shared_memory.SharedMemory(name=name)
+            self._owner = False
+            # 解码进程有自己的 resource_tracker，退出时会删除它登记过的共享内存；只由创建者负责删除
+            resource_tracker.unregister(self._shm._name, "shared_memory")
+        self._views = self._make_views()
+
+    def _make_views(self):
+        buffer = np.ndarray((self.slots,) + self.shape, dtype=self.dtype, buffer=self._shm.buf)
+        return [buffer[i] for i in range(self.slots)]
+
+    @property
+    def name(self):
+        return self._shm.name
+
+    def slot(self, index):
+        """Writable ndarray view of a slot."""
+        return self._views[index]
+
+    def close(self):
+        """
+        Unmap the shared memory in this process. Every view handed out by
+        slot() becomes invalid (accessing one would crash), so only call this
+        once all of them have been released.
+        """
+        self._views = []
+        self._shm.close()
+
+    def unlink(self):
+        """Remove the shared memory name; it is freed once every process has closed it (creator only)."""
+        if self._owner:
+            self._shm.unlink()
+
+
+def _read_record(stream, timeout):
+    """Next FRAME record from the decoder, None on timeout, b"" if the pipe closed early."""
+    fd = stream.fileno()
+    data = b""
+    while len(data) < FRAME.size:
+        ready, _, _ = select.select([fd], [], [], timeout)
+        if not ready:
+            if not data:
+                return None
+            continue  # 记录只写了一半，继续等剩下的字节
+        chunk = os.read(fd, FRAME.size - len(data))
+        if not chunk:
+            return b""
+        data += chunk
+    return FRAME.unpack(data)
+
+
+def decode_to_ring(video_path, ring, grants, frames):
+    """
+    Decoder process body: decode video_path into the slots granted on grants.
+
+    Args:
+        grants: Binary stream of GRANT records (the process's stdin).
+        frames: Binary stream the FRAME records are written to (the process's stdout).
+    """
+    cap = cv2.VideoCapture(video_path)
+    frame_no = 0
+    try:
+        while True:
+            data = grants.read(GRANT.size)
+            if len(data) < GRANT.size:
+                break  # 父进程已关闭管道，不再需要更多帧
+            index, = GRANT.unpack(data)
+            slot = ring.slot(index)
+            started = time.perf_counter()
+            ret, frame = cap.read(slot)
+            elapsed = time.perf_counter() - started
+            if not ret:
+                break
+            if frame.ctypes.data != slot.ctypes.data:
+                slot[...] = frame  # 尺寸不符时 OpenCV 会另分配内存，退回到一次拷贝
+            frame_no += 1
+            frames.write(FRAME.pack(index, frame_no, elapsed))
+            frames.flush()
+        # 只有正常读完才发送结束记录；出错时进程以非零码退出，父进程不会把半段视频当成完整结果
+        try:
+            frames.write(FRAME.pack(END, frame_no, 0.0))
+            frames.flush()
+        except BrokenPipeError:
+            pass
+    finally:
+        cap.release()
+        ring.close()
+
+
+def iter_frames(video_path, slots=8):
+    """
+    Decode video_path in a separate process and yield (frame_id, frame, release).
+
+    frame is a view into shared memory; call release() once nothing refers to it
+    any more (e.g. after the clip writer has encoded it). Frames that are never
+    released keep the mapping alive until the process exits.
+    """
+    cap = cv2.VideoCapture(video_path)
+    width, height = int(cap.get(cv2.CAP_PROP_FRAME_WIDTH)), int(cap.get(cv2.CAP_PROP_FRAME_HEIGHT))
+    cap.release()
+    if width <= 0 or height <= 0:
+        return
+
+    ring = FrameRing(slots, (height, width, 3))
+    command = [sys.executable, os.path.abspath(__file__), video_path, ring.name, str(slots), str(height), str(width)]
+    plan = cpu_resources.current_plan()
+    if plan is not None:
+        command += ["--threads", str(plan.threads("decode"))]
+        if plan.partitioned:
+            command += ["--cores", cpu_resources.format_cores(plan.cores("decode"))]
+    decoder = subprocess.Popen(command, stdin=subprocess.PIPE, stdout=subprocess.PIPE, bufsize=0)
+
+    # 帧视图可能在迭代结束后仍在编码队列中，最后一个槽位归还后才解除映射
+    lock = threading.Lock()
+    state = {"outstanding": 0, "finished": False}
+
+    def grant(index):
+        with lock:
+            if state["finished"]:
+                return
+            try:
+                decoder.stdin.write(GRANT.pack(index))
+            except (BrokenPipeError, ValueError):
+                pass  # 解码进程已结束
+
+    def release(index):
+        grant(index)
+        with lock:
+            state["outstanding"] -= 1
+            last = state["finished"] and state["outstanding"] == 0
+        if last:
+            ring.close()
+
+    try:
+        for index in range(slots):
+            grant(index)
+        while True:
+            with metrics.stage("decode_wait"):
+                record = _read_record(decoder.stdout, timeout=1.0)
+            if record is None:
+                if decoder.poll() is None:
+                    continue
+                record = b""
+            if record == b"":
+                raise RuntimeError(f"Decoder process for {video_path} exited with code {decoder.wait()}")
+            index, frame_id, seconds = record
+            if index == END:
+                break
+            # 解码耗时在子进程中测得，在本进程记录，才能出现在 /metrics 中
+            if metrics.enabled():
+                metrics.STAGE_SECONDS.observe(seconds, stage="decode")
+            with lock:
+                state["outstanding"] += 1
+            yield frame_id, ring.slot(index), partial(release, index)
+        code = decoder.wait(timeout=5)
+        if code != 0:
+            raise RuntimeError(f"Decoder process for {video_path} exited with code {code}")
+    finally:
+        with lock:
+            state["finished"] = True
+            last = state["outstanding"] == 0
+            decoder.stdin.close()
+        try:
+            decoder.wait(timeout=5)
+        except subprocess.TimeoutExpired:
+            decoder.kill()
+            decoder.wait()
+        decoder.stdout.close()
+        ring.unlink()
+        if last:
+            ring.close()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Frame ring decoder process (started by iter_frames).")
+    parser.add_argument("video_path")
+    parser.add_argument("name", help="shared memory name of the ring")
+    parser.add_argument("slots", type=int)
+    parser.add_argument("height", type=int)
+    parser.add_argument("width", type=int)
+    parser.add_argument("--cores", help="core list to pin the decoder to, e.g. 0-3")
+    parser.add_argument("--threads", type=int, help="OpenCV threads")
+    args = parser.parse_args()
+
+    if args.cores and hasattr(os, "sched_setaffinity"):
+        os.sched_setaffinity(0, cpu_resources.parse_cores(args.cores))
+    if args.threads:
+        cv2.setNumThreads(args.threads)
+    out = sys.stdout.buffer
+    sys.stdout = sys.stderr  # stdout 只用来传帧记录
+    decode_to_ring(args.video_path, FrameRing(args.slots, (args.height, args.width, 3), name=args.name),
+                   sys.stdin.buffer, out)
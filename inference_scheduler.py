@@ -0,0 +1,223 @@
+"""
+Cross-stream batching in front of one shared detector.
+
+Every job or camera stream hands its frames to submit() (or calls detect(),
+which blocks on the result). A single scheduler thread collects the pending
+frames into batches of at most max_batch, waiting no longer than max_latency
+after the first frame of a batch arrived, runs one detect_batch() forward pass
+and resolves each frame's Future with its own detections. The tracker of each
+stream then consumes them as usual, so tracking state never mixes.
+
+A batch takes at most one frame per stream; further frames of the same stream
+wait for the next batch, so one fast stream cannot crowd out the others. Frames
+submitted with different detection options (inference size, threshold; tuned
+per camera) never share a batch either. A batch is dispatched before
+max_latency when every stream that submitted within ACTIVE_WINDOW already has a
+frame in it (or one deferred) and nothing else is queued, so a lone stream does
+not wait for frames that cannot come. Frames handed over together in one
+detect_batch() call (consecutive frames of a job, or the tiles of one frame)
+may share a batch even though they carry the same stream_id. Frames submitted
+without a stream_id count as one stream.
+"""
+
+import itertools
+import queue
+import threading
+import time
+from collections import deque
+from concurrent.futures import Future
+
+import cpu_resources
+
+_STOP = object()
+ACTIVE_WINDOW = 0.5  # 秒：这段时间内提交过帧的流视为仍在运行
+
+
+class InferenceScheduler:
+    def __init__(self, detector, max_batch=8, max_latency=0.01):
+        """
+        Args:
+            detector: Object with detect_batch(frames) and names (YOLOVehicleDetector).
+            max_batch (int): Upper bound on frames per forward pass.
+            max_latency (float): Seconds a frame may wait for the batch to fill.
+        """
+        self.detector = detector
+        self.max_batch = max_batch
+        self.max_latency = max_latency
+        self._queue = queue.Queue()
+        self._deferred = deque()
+        self._active = {}  # stream_id -> 最近一次提交的时间
+        self._active_lock = threading.Lock()
+        self._calls = itertools.count()  # 每次 submit/detect_batch 调用一个编号，同一调用的帧可以同批
+        self._closed = False
+        self._stats_lock = threading.Lock()
+        self.stats = {"batches": 0, "frames": 0, "max_batch_seen": 0}
+        self._thread = threading.Thread(target=self._run, name="inference-scheduler", daemon=True)
+        self._thread.start()
+
+    @property
+    def names(self):
+        return self.detector.names
+
+    @property
+    def model(self):
+        return getattr(self.detector, "model", None)
+
+    # ---- producer side ------------------------------------------------------
+
+    def submit(self, frame, stream_id=None, imgsz=None, threshold=None):
+        """
+        Queue a frame; the returned Future resolves to its detection list.
+
+        Args:
+            imgsz (int): Inference size for this frame (None: the detector's default).
+            threshold (float): Confidence threshold (None: the detector's default).
+        """
+        return self._submit(frame, stream_id, (imgsz, threshold), next(self._calls))
+
+    def _submit(self, frame, stream_id, options, call):
+        if self._closed:
+            raise RuntimeError("InferenceScheduler is closed")
+        future = Future()
+        with self._active_lock:
+            self._active[stream_id] = time.monotonic()
+        self._queue.put((stream_id, frame, future, options, call))
+        return future
+
+    def detect(self, frame, stream_id=None, imgsz=None, threshold=None):
+        """Blocking form of submit(), so the scheduler can stand in for the detector."""
+        return self.submit(frame, stream_id, imgsz, threshold).result()
+
+    def detect_batch(self, frames, stream_id=None, imgsz=None, threshold=None):
+        """Submit several frames of one stream together; they may all land in the same batch."""
+        call = next(self._calls)
+        futures = [self._submit(frame, stream_id, (imgsz, threshold), call) for frame in frames]
+        return [future.result() for future in futures]
+
+    def pending(self):
+        """Frames waiting for a batch."""
+        return self._queue.qsize() + len(self._deferred)
+
+    def close(self, timeout=10.0):
+        """Serve the frames already queued, then stop the scheduler thread."""
+        if self._closed:
+            return
+        self._closed = True
+        self._queue.put(_STOP)
+        self._thread.join(timeout)
+
+    # ---- scheduler thread ---------------------------------------------------
+
+    def _next_item(self, timeout):
+        if self._deferred:
+            return self._deferred.popleft()
+        if timeout is None:
+            return self._queue.get()
+        if timeout <= 0:
+            return self._queue.get_nowait()
+        return self._queue.get(timeout=timeout)
+
+    def _others_active(self, covered):
+        """True if a stream not in covered submitted a frame within ACTIVE_WINDOW."""
+        now = time.monotonic()
+        with self._active_lock:
+            for stream_id, last in list(self._active.items()):
+                if now - last > ACTIVE_WINDOW:
+                    del self._active[stream_id]
+            return any(stream_id not in covered for stream_id in self._active)
+
+    def _collect(self):
+        """Gather one batch; returns (batch, stopping)."""
+        batch, streams, deferred = [], {}, []  # streams: stream_id -> 占据本批的调用编号
+        covered = set()  # 已在本批或已被推迟的流，它们的新帧都进不了这一批
+        stopping = False
+        item = self._next_item(None)
+        deadline = time.monotonic() + self.max_latency
+        while True:
+            if item is _STOP:
+                stopping = True
+                break
+            stream_id = item[0]
+            covered.add(stream_id)
+            # 同一路流的后续帧留到下一批，保证各路流轮流进入批次；检测参数不同的帧也不能同批
+            if self._conflicts(item, batch, streams):
+                deferred.append(item)
+            else:
+                batch.append(item)
+                if stream_id is not None:
+                    streams[stream_id] = item[4]
+            if len(batch) >= self.max_batch:
+                break
+            if not self._deferred and self._queue.empty() and not self._others_active(covered):
+                break  # 没有别的流能再加入这一批，不必等到 max_latency
+            try:
+                item = self._next_item(deadline - time.monotonic())
+            except queue.Empty:
+                break
+        # 被推迟的帧总是早于尚未取出的帧，放回队首以保持每路流的顺序
+        self._deferred.extendleft(reversed(deferred))
+        return batch, stopping
+
+    def _run(self):
+        cpu_resources.pin("inference")
+        stopping = False
+        while not stopping or self._deferred:
+            if stopping:
+                batch, _ = self._collect_deferred()
+            else:
+                batch, stopping = self._collect()
+            if batch:
+                self._dispatch(batch)
+
+        # 关闭后仍可能有帧进入队列，让等待者得到异常而不是永远阻塞
+        while True:
+            try:
+                item = self._queue.get_nowait()
+            except queue.Empty:
+                break
+            if item is not _STOP:
+                item[2].set_exception(RuntimeError("InferenceScheduler is closed"))
+
+    def _collect_deferred(self):
+        batch, streams, rest = [], {}, deque()
+        while self._deferred and len(batch) < self.max_batch:
+            item = self._deferred.popleft()
+            if self._conflicts(item, batch, streams):
+                rest.append(item)
+            else:
+                batch.append(item)
+                if item[0] is not None:
+                    streams[item[0]] = item[4]
+        self._deferred.extendleft(reversed(rest))
+        return batch, True
+
+    @staticmethod
+    def _conflicts(item, batch, streams):
+        """True if item must wait: its stream is in the batch from another call, or its options differ."""
+        stream_id, call = item[0], item[4]
+        if stream_id is not None and streams.get(stream_id, call) != call:
+            return True
+        return bool(batch) and item[3] != batch[0][3]
+
+    def _dispatch(self, batch):
+        frames = [item[1] for item in batch]
+        imgsz, threshold = batch[0][3]
+        options = {}
+        if imgsz is not None:
+            options["imgsz"] = imgsz
+        if threshold is not None:
+            options["threshold"] = threshold
+        try:
+            results = self.detector.detect_batch(frames, **options)
+        except Exception as e:
+            print(f"[ERROR] Batched inference failed for {len(batch)} frames: {e}")
+            for item in batch:
+                item[2].set_exception(e)
+            return
+
+        with self._stats_lock:
+            self.stats["batches"] += 1
+            self.stats["frames"] += len(batch)
+            self.stats["max_batch_seen"] = max(self.stats["max_batch_seen"], len(batch))
+        for item, detections in zip(batch, results):
+            item[2].set_result(detections)
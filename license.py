@@ -3,7 +3,16 @@ import numpy as np
 import easyocr
 
 import torch
-reader = easyocr.Reader(['en'], gpu=torch.cuda.is_available())
+
+# 首次使用时才创建（会加载/下载 OCR 模型），导入本模块本身很快
+reader = None
+
+
+def get_reader():
+    global reader
+    if reader is None:
+        reader = easyocr.Reader(['en'], gpu=torch.cuda.is_available())
+    return reader
 
 
 def extract_vehicle_features(frame, bbox, class_name):
@@ -21,7 +30,7 @@ def extract_vehicle_features(frame, bbox, class_name):
     dominant_color = interpret_hue(h_mean)
 
     try:
-        result = reader.readtext(crop)
+        result = get_reader().readtext(crop)
         plate = result[0][1] if result else ""
     except:
         plate = ""
@@ -35,6 +44,94 @@ def extract_vehicle_features(frame, bbox, class_name):
         'plate': plate
     }
 
+# 每个边最多取这么多个采样点计算颜色统计，大框不再逐像素求均值
+FEATURE_SAMPLE_SIDE = 32
+HUE_NAMES = np.array(["red", "yellow", "green", "blue", "purple"])
+# OpenCV 的色调范围是 0-179；阈值都是整数，所以按 floor(均值) 查表与 interpret_hue 结果一致
+HUE_LUT = np.array([0] * 15 + [1] * 20 + [2] * 50 + [3] * 40 + [4] * 35 + [0] * 20, dtype=np.uint8)
+FEATURE_DTYPE = np.dtype([
+    ("x", np.int32), ("y", np.int32), ("w", np.int32), ("h", np.int32),
+    ("center", np.int32, (2,)), ("color_rgb", np.int32, (3,)), ("hue", np.float32),
+    ("dominant_color", "U7"), ("valid", np.bool_),
+])
+
+
+def color_features(frame, bboxes, sample_side=FEATURE_SAMPLE_SIDE):
+    """
+    Colour statistics of many boxes in one frame, as a structured array.
+
+    Crops larger than sample_side are subsampled with a fixed stride. The
+    pixels of all crops are converted to HSV in a single cvtColor call and
+    averaged per crop with np.add.reduceat. The hue is then classified
+    through HUE_LUT.
+
+    Args:
+        bboxes: Sequence of (x, y, w, h).
+
+    Returns:
+        np.ndarray: FEATURE_DTYPE records; valid is False for empty crops.
+    """
+    features = np.zeros(len(bboxes), dtype=FEATURE_DTYPE)
+    samples, offsets = [], []
+    total = 0
+    for i, (x, y, w, h) in enumerate(bboxes):
+        features[i]["x"], features[i]["y"], features[i]["w"], features[i]["h"] = x, y, w, h
+        features[i]["center"] = (x + w // 2, y + h)
+        step_y, step_x = max(1, h // sample_side), max(1, w // sample_side)
+        # 与逐个提取时相同的切片语义（包括越界框得到空切片）
+        sample = frame[y:y+h:step_y, x:x+w:step_x]
+        if sample.size == 0:
+            continue
+        features[i]["valid"] = True
+        samples.append(sample.reshape(-1, 3))
+        offsets.append(total)
+        total += len(samples[-1])
+
+    if not samples:
+        return features
+    pixels = np.concatenate(samples)
+    counts = np.diff(offsets + [total])
+    valid = features["valid"]
+
+    bgr_mean = np.add.reduceat(pixels.astype(np.float64), offsets, axis=0) / counts[:, None]
+    features["color_rgb"][valid] = bgr_mean.astype(int)[:, ::-1]
+
+    hue = cv2.cvtColor(pixels.reshape(-1, 1, 3), cv2.COLOR_BGR2HSV)[:, 0, 0]
+    hue_mean = np.add.reduceat(hue.astype(np.float64), offsets) / counts
+    features["hue"][valid] = hue_mean
+    features["dominant_color"][valid] = HUE_NAMES[HUE_LUT[np.clip(hue_mean.astype(int), 0, 179)]]
+    return features
+
+
+def extract_vehicle_features_batch(frame, bboxes, class_names):
+    """
+    extract_vehicle_features() for all new vehicles of a frame at once.
+
+    Returns:
+        list: One dict per box with the same fields as extract_vehicle_features().
+    """
+    results = []
+    for record, class_name in zip(color_features(frame, bboxes), class_names):
+        if not record["valid"]:
+            results.append({})
+            continue
+        x, y, w, h = (int(record[k]) for k in ("x", "y", "w", "h"))
+        try:
+            result = get_reader().readtext(frame[y:y+h, x:x+w])
+            plate = result[0][1] if result else ""
+        except:
+            plate = ""
+        results.append({
+            'type': class_name,
+            'center': tuple(int(v) for v in record["center"]),
+            'size': (w, h),
+            'color_rgb': tuple(np.int64(v) for v in record["color_rgb"]),
+            'dominant_color': str(record["dominant_color"]),
+            'plate': plate
+        })
+    return results
+
+
 def interpret_hue(hue):
     if hue < 15 or hue >= 160:
         return "red"
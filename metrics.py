@@ -0,0 +1,227 @@
+"""
+Minimal in-process metrics with Prometheus text exposition.
+
+Counters, gauges and histograms live in a module-level registry and are
+rendered by render() (served at /metrics by api_server). Gauges can also be
+backed by a callback that is only evaluated at scrape time, which is how
+queue depths are exported.
+
+Set ICT_METRICS=0 (or call set_enabled(False)) to turn recording into a no-op:
+stage() then returns a shared null context and observe()/inc() return at once.
+"""
+
+import bisect
+import os
+import threading
+import time
+from contextlib import nullcontext
+
+DEFAULT_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+JOB_BUCKETS = (0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 120.0, 300.0, 600.0)
+
+_enabled = os.environ.get("ICT_METRICS", "1") != "0"
+_registry = []
+_registry_lock = threading.Lock()
+_NULL = nullcontext()
+UNKNOWN_CAMERA = "unknown"  # 未登记的摄像头共用的 camera_id 标签，任意 ID 不会让时间序列无限增长
+
+
+def enabled():
+    return _enabled
+
+
+def set_enabled(value):
+    global _enabled
+    _enabled = bool(value)
+
+
+def _format_labels(names, values, extra=None):
+    pairs = list(zip(names, values))
+    if extra:
+        pairs.append(extra)
+    if not pairs:
+        return ""
+    escaped = (str(v).replace("\\", "\\\\").replace("\"", "\\\"").replace("\n", "\\n") for _, v in pairs)
+    return "{" + ",".join(f'{k}="{v}"' for (k, _), v in zip(pairs, escaped)) + "}"
+
+
+def _format_value(value):
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class _Metric:
+    kind = None
+
+    def __init__(self, name, help_text, labels=()):
+        self.name = name
+        self.help = help_text
+        self.labels = tuple(labels)
+        self._lock = threading.Lock()
+        with _registry_lock:
+            _registry.append(self)
+
+    def _key(self, labels):
+        return tuple(labels.get(name, "") for name in self.labels)
+
+    def _header(self):
+        return [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} {self.kind}"]
+
+
+class Counter(_Metric):
+    kind = "counter"
+
+    def __init__(self, name, help_text, labels=()):
+        super().__init__(name, help_text, labels)
+        self._values = {}
+
+    def inc(self, amount=1, **labels):
+        if not _enabled:
+            return
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def render(self):
+        with self._lock:
+            items = sorted(self._values.items())
+        return self._header() + [
+            f"{self.name}{_format_labels(self.labels, key)} {_format_value(value)}" for key, value in items
+        ]
+
+
+class Gauge(_Metric):
+    kind = "gauge"
+
+    def __init__(self, name, help_text, labels=()):
+        super().__init__(name, help_text, labels)
+        self._values = {}
+        self._callbacks = {}
+
+    def set(self, value, **labels):
+        if not _enabled:
+            return
+        with self._lock:
+            self._values[self._key(labels)] = value
+
+    def inc(self, amount=1, **labels):
+        if not _enabled:
+            return
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def dec(self, amount=1, **labels):
+        self.inc(-amount, **labels)
+
+    def set_function(self, callback, **labels):
+        """Report callback() at scrape time (e.g. a queue's qsize)."""
+        with self._lock:
+            self._callbacks[self._key(labels)] = callback
+
+    def render(self):
+        with self._lock:
+            values = dict(self._values)
+            callbacks = dict(self._callbacks)
+        for key, callback in callbacks.items():
+            try:
+                values[key] = callback()
+            except Exception as e:
+                print(f"[WARN] Metric {self.name} callback failed: {e}")
+        return self._header() + [
+            f"{self.name}{_format_labels(self.labels, key)} {_format_value(value)}"
+            for key, value in sorted(values.items())
+        ]
+
+
+class Histogram(_Metric):
+    kind = "histogram"
+
+    def __init__(self, name, help_text, labels=(), buckets=DEFAULT_BUCKETS):
+        super().__init__(name, help_text, labels)
+        self.buckets = tuple(sorted(buckets))
+        self._values = {}  # key -> [bucket counts..., +Inf count, sum]
+
+    def observe(self, value, **labels):
+        if not _enabled:
+            return
+        key = self._key(labels)
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            state = self._values.get(key)
+            if state is None:
+                state = self._values[key] = [0] * (len(self.buckets) + 1) + [0.0]
+            state[index] += 1
+            state[-1] += value
+
+    def time(self, **labels):
+        """Context manager observing the elapsed seconds of its block."""
+        if not _enabled:
+            return _NULL
+        return _Timer(self, labels)
+
+    def render(self):
+        with self._lock:
+            items = sorted((key, list(state)) for key, state in self._values.items())
+        lines = self._header()
+        for key, state in items:
+            cumulative = 0
+            for bound, count in zip(self.buckets + (float("inf"),), state[:-1]):
+                cumulative += count
+                labels = _format_labels(self.labels, key, ("le", _format_value(float(bound))))
+                lines.append(f"{self.name}_bucket{labels} {cumulative}")
+            labels = _format_labels(self.labels, key)
+            lines.append(f"{self.name}_sum{labels} {_format_value(state[-1])}")
+            lines.append(f"{self.name}_count{labels} {cumulative}")
+        return lines
+
+
+class _Timer:
+    __slots__ = ("histogram", "labels", "start")
+
+    def __init__(self, histogram, labels):
+        self.histogram = histogram
+        self.labels = labels
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self.histogram.observe(time.perf_counter() - self.start, **self.labels)
+        return False
+
+
+def render():
+    """All registered metrics in the Prometheus text exposition format."""
+    with _registry_lock:
+        metrics = list(_registry)
+    lines = []
+    for metric in metrics:
+        lines.extend(metric.render())
+    return "\n".join(lines) + "\n"
+
+
+# ---- pipeline metrics -------------------------------------------------------
+
+STAGE_SECONDS = Histogram("ict_stage_seconds", "Time spent per pipeline stage.", labels=("stage",))
+FRAMES_PROCESSED = Counter("ict_frames_processed_total", "Frames run through detection and tracking.", labels=("camera_id",))
+FRAMES_DROPPED = Counter("ict_frames_dropped_total", "Stream frames dropped because inference fell behind.", labels=("camera_id",))
+INCIDENTS_DETECTED = Counter("ict_incidents_total", "Overspeed incidents detected.", labels=("camera_id",))
+INFERENCE_BATCH_SIZE = Histogram(
+    "ict_inference_batch_size", "Frames per detector forward pass.", buckets=(1, 2, 4, 8, 16, 32)
+)
+ACTIVE_TRACKS = Gauge("ict_active_tracks", "Tracks currently held by running jobs.")
+ACTIVE_JOBS = Gauge("ict_active_jobs", "Detection jobs and stream workers currently running.", labels=("kind",))
+QUEUE_DEPTH = Gauge("ict_queue_depth", "Items waiting in internal queues.", labels=("queue",))
+ADMISSION_REJECTED = Counter("ict_admission_rejected_total", "/detect requests turned away.", labels=("reason",))
+ARTIFACT_ERRORS = Counter("ict_artifact_errors_total", "Snapshots that failed to write.", labels=("kind",))
+JOB_SECONDS = Histogram("ict_job_seconds", "Duration of /detect jobs.", buckets=JOB_BUCKETS)
+
+
+def stage(name):
+    """Time a pipeline stage: with metrics.stage("inference"): ..."""
+    if not _enabled:
+        return _NULL
+    return _Timer(STAGE_SECONDS, {"stage": name})
@@ -0,0 +1,279 @@
+import os
+import uuid
+import weakref
+from datetime import datetime, timedelta
+from functools import partial
+
+import cv2
+
+from yolo_tracker import DetectionSettings, YOLOByteTrackWrapper, estimate_speed_by_length
+from license import extract_vehicle_features_batch
+from frame_ring import iter_frames
+import metrics
+
+# 运行中的任务，供 /metrics 统计活跃轨迹数
+_jobs = weakref.WeakSet()
+metrics.ACTIVE_TRACKS.set_function(lambda: sum(len(job.track_data) for job in list(_jobs)))
+
+
+def annotate_snapshot(snapshot, bbox, speed, plate):
+    x, y, w, h = bbox
+    cv2.rectangle(snapshot, (x, y), (x + w, y + h), (0, 0, 255), 2)
+    label = f"{speed:.1f} km/h"
+    cv2.putText(snapshot, f"{label}", (x, y - 10), cv2.FONT_HERSHEY_SIMPLEX, 0.6, (0, 0, 255), 2)
+    cv2.putText(snapshot, f"Plate: {plate}", (x, y + h + 20), cv2.FONT_HERSHEY_SIMPLEX, 0.6, (255, 0, 0), 2)
+
+
+class TrackingJob:
+    """
+    State of one detection job: its own tracker (and track ID namespace),
+    per-track history and the overspeed decision. The detector is shared.
+    """
+
+    def __init__(self, detector, camera_id, speed_limit, latitude="", longitude="", fps=30,
+                 job_id=None, artifact_writer=None, settings=None, recorded_at=None, metrics_label=None):
+        """
+        Args:
+            settings (DetectionSettings): The camera's tuned detection knobs (default: untuned).
+            recorded_at (datetime): Wall-clock time of frame 0 for recorded footage; incidents
+                are then stamped with the time the vehicle was last seen instead of now.
+            metrics_label (str): camera_id label for metrics (default: camera_id); callers
+                taking camera ids from clients pass metrics.UNKNOWN_CAMERA for unregistered ones.
+        """
+        self.settings = settings or DetectionSettings()
+        self.recorded_at = recorded_at
+        self.job_id = job_id or uuid.uuid4().hex
+        self.camera_id = camera_id
+        self.metrics_label = metrics_label or camera_id
+        self.speed_limit = speed_limit
+        self.latitude = latitude
+        self.longitude = longitude
+        self.fps = fps
+        self.artifact_writer = artifact_writer
+        self.tracker = YOLOByteTrackWrapper(detector=detector, frame_rate=fps, stream_id=self.job_id,
+                                            settings=self.settings)
+        self.track_data = {}
+        self.frame_id = 0
+        _jobs.add(self)
+
+    def process_frame(self, frame, frame_id=None):
+        """
+        Detect, track and annotate one frame in place; returns the tracked vehicles.
+
+        Args:
+            frame_id: Source frame number, when frames were dropped upstream
+                (speeds are computed from frame numbers, not from call count).
+        """
+        self.frame_id = self.frame_id + 1 if frame_id is None else frame_id
+        tracked_vehicles = self.tracker.detect_and_track(frame)
+        self.update_tracks(frame, tracked_vehicles)
+        metrics.FRAMES_PROCESSED.inc(camera_id=self.metrics_label)
+        return tracked_vehicles
+
+    def process_batch(self, frames, frame_ids):
+        """process_frame() for consecutive frames whose detection runs as one batch."""
+        for frame, frame_id, detections in zip(frames, frame_ids, self.tracker.detect_batch(frames)):
+            self.frame_id = frame_id
+            self.update_tracks(frame, self.tracker.track(detections, frame.shape[:2]))
+            metrics.FRAMES_PROCESSED.inc(camera_id=self.metrics_label)
+
+    def wants_frame(self, frame_id):
+        """False for frames skipped by the camera's detection stride."""
+        return (frame_id - 1) % self.settings.stride == 0
+
+    def update_tracks(self, frame, tracked_vehicles):
+        track_data = self.track_data
+        # 本帧新出现的车辆一次性提取特征
+        new_vehicles = [vehicle for vehicle in tracked_vehicles if vehicle["id"] not in track_data]
+        if new_vehicles:
+            with metrics.stage("features"):
+                features = extract_vehicle_features_batch(
+                    frame, [vehicle["bbox"] for vehicle in new_vehicles],
+                    [vehicle["class_name"] for vehicle in new_vehicles]
+                )
+            for vehicle, vehicle_features in zip(new_vehicles, features):
+                track_data[vehicle["id"]] = {
+                    "positions": [], "bboxes": [], "class": vehicle["class_name"],
+                    "features": vehicle_features,
+                    "snapshot_frame": None
+                }
+
+        for vehicle in tracked_vehicles:
+            x, y, w, h = vehicle["bbox"]
+            track_id = vehicle["id"]
+            class_name = vehicle["class_name"]
+
+            cx, cy = x + w // 2, y + h
+            track_data[track_id]["positions"].append((self.frame_id, (cx, cy)))
+            track_data[track_id]["bboxes"].append((x, y, w, h))
+            track_data[track_id]["bbox"] = (x, y, w, h)
+            track_data[track_id]["snapshot_frame"] = frame.copy()
+            track_data[track_id]["speed"] = estimate_speed_by_length(
+                track_data[track_id]["positions"],
+                track_data[track_id]["bboxes"],
+                self.fps,
+                class_name
+            )
+
+            with metrics.stage("annotation"):
+                color = (0, 255, 0) if track_data[track_id]['speed'] <= self.speed_limit else (0, 0, 255)
+                label = f"{class_name} {track_data[track_id]['speed']:.1f} km/h ID:{track_id}"
+                cv2.rectangle(frame, (x, y), (x + w, y + h), color, 2)
+                cv2.putText(frame, label, (x, y - 10), cv2.FONT_HERSHEY_SIMPLEX, 0.5, color, 1)
+
+    def overspeed_incidents(self, track_ids=None):
+        """
+        Build incident rows for tracks above the speed limit and queue their snapshots.
+
+        Args:
+            track_ids: Only consider these tracks (default: all tracks of the job).
+        """
+        overspeed_vehicles = []
+        for car_id in (self.track_data if track_ids is None else track_ids):
+            info = self.track_data[car_id]
+            speed = info.get("speed", 0.0)
+            if speed <= self.speed_limit:
+                continue
+
+            plate = info["features"].get("plate", car_id)
+            image_url = ""
+            snapshot = info.get("snapshot_frame")
+            if self.artifact_writer is not None:
+                snapshot_path = self.artifact_writer.snapshot_path(self.job_id, car_id)
+                image_url = "../" + snapshot_path.replace(os.sep, "/")
+                if snapshot is not None:
+                    # 标注与 JPEG 编码都在写入线程池中完成，不占用请求时间
+                    self.artifact_writer.submit_snapshot(
+                        snapshot, snapshot_path,
+                        annotate=partial(annotate_snapshot, bbox=info.get("bbox", (0, 0, 0, 0)),
+                                         speed=speed, plate=plate)
+                    )
+
+            timestamp = datetime.now()
+            if self.recorded_at is not None:
+                timestamp = self.recorded_at + timedelta(seconds=info["positions"][-1][0] / self.fps)
+            metrics.INCIDENTS_DETECTED.inc(camera_id=self.metrics_label)
+            overspeed_vehicles.append({
+                "timestamp": timestamp.strftime("%Y-%m-%d %H:%M:%S"),
+                "camera_id": self.camera_id,
+                "license_plate": plate,
+                "latitude": self.latitude,
+                "longitude": self.longitude,
+                "speed_limit": self.speed_limit,
+                "actual_speed": speed,
+                "speed_difference": speed - self.speed_limit,
+                "image_url": image_url
+            })
+        return overspeed_vehicles
+
+
+    def collect_finished(self, max_idle_frames=None):
+        """
+        Emit incidents for tracks not seen for more than max_idle_frames and forget them.
+
+        Long-running streams call this periodically so track history stays bounded;
+        max_idle_frames=None finishes every track.
+        """
+        finished = [
+            car_id for car_id, info in self.track_data.items()
+            if max_idle_frames is None or self.frame_id - info["positions"][-1][0] > max_idle_frames
+        ]
+        incidents = self.overspeed_incidents(finished)
+        for car_id in finished:
+            del self.track_data[car_id]
+        return incidents
+
+
+def read_frames(video_path):
+    """Yield (frame_id, frame, release) from cv2 in this process; release is a no-op."""
+    cap = cv2.VideoCapture(video_path)
+    frame_id = 0
+    try:
+        while cap.isOpened():
+            with metrics.stage("decode"):
+                ret, frame = cap.read()
+            if not ret:
+                break
+            frame_id += 1
+            yield frame_id, frame, None
+    finally:
+        cap.release()
+
+
+def _process_items(job, items):
+    if len(items) == 1:
+        job.process_frame(items[0][1], frame_id=items[0][0])
+    elif items:
+        job.process_batch([frame for _, frame, _ in items], [frame_id for frame_id, _, _ in items])
+
+
+def process_video(video_path, detector, camera_id, speed_limit, latitude="", longitude="",
+                  artifact_writer=None, job_id=None, decode_process=False, settings=None, recorded_at=None,
+                  metrics_label=None):
+    """
+    Run a whole video file through a new TrackingJob.
+
+    Args:
+        decode_process (bool): Decode in a separate process and receive frames
+            through a shared-memory FrameRing instead of decoding in this thread.
+        settings (DetectionSettings): Camera's tuned inference size, threshold,
+            batch size and stride; frames skipped by the stride go to the clip unannotated.
+        recorded_at (datetime): Start time of recorded footage, see TrackingJob.
+        metrics_label (str): camera_id label for metrics, see TrackingJob.
+
+    Returns:
+        tuple: (job, overspeed incident rows)
+    """
+    cap = cv2.VideoCapture(video_path)
+    fps = cap.get(cv2.CAP_PROP_FPS) or 30
+    size = (int(cap.get(3)), int(cap.get(4)))
+    cap.release()
+    job = TrackingJob(detector, camera_id, speed_limit, latitude, longitude, fps=fps,
+                      job_id=job_id, artifact_writer=artifact_writer, settings=settings, recorded_at=recorded_at,
+                      metrics_label=metrics_label)
+
+    out_writer = None
+    if artifact_writer is not None:
+        out_writer = artifact_writer.open_clip(artifact_writer.clip_path(job.job_id), fps, size)
+
+    def emit(items):
+        for _, frame, release in items:
+            if out_writer is not None:
+                # 共享内存槽位要等编码完成后才能归还给解码进程
+                out_writer.write(frame, on_written=release)
+            elif release is not None:
+                release()
+
+    # 攒够 batch_size 个待检测帧再一起推理；跳过的帧夹在中间，按原顺序写入视频。
+    # 攒批期间的帧都占着共享内存槽位，槽位数要够用
+    batch_size, stride = job.settings.batch_size, job.settings.stride
+    pending, wanted = [], []
+    if decode_process:
+        frames = iter_frames(video_path, slots=max(8, batch_size * stride + 2))
+    else:
+        frames = read_frames(video_path)
+    try:
+        for item in frames:
+            if job.wants_frame(item[0]):
+                wanted.append(item)
+            elif not wanted:
+                emit([item])
+                continue
+            pending.append(item)
+            if len(wanted) >= batch_size:
+                _process_items(job, wanted)
+                done, pending, wanted = pending, [], []
+                emit(done)
+        _process_items(job, wanted)
+        done, pending = pending, []
+        emit(done)
+    finally:
+        # 检测或解码出错时也要收尾：归还未写入片段的槽位，关闭片段让编码线程写完后退出
+        for _, _, release in pending:
+            if release is not None:
+                release()
+        frames.close()
+        if out_writer is not None:
+            out_writer.close()
+
+    return job, job.overspeed_incidents()
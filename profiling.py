@@ -0,0 +1,227 @@
+"""
+Opt-in profiling of a single detection job.
+
+JobProfiler wraps the job's code in the request thread and records either a
+cProfile profile ("cprofile") or a low-overhead sampling profile ("sample",
+py-spy style: the thread's stack is captured every few milliseconds and
+written as collapsed stacks that flamegraph.pl / speedscope can open). In
+both modes it also records wall and CPU time, the process's peak RSS and, if
+no other job is using it, the tracemalloc peak and top allocation sites.
+
+Reports are written next to the job's other artifacts:
+    uploads/profiles/ab/cd/<job_id>.json       summary (always)
+    uploads/profiles/ab/cd/<job_id>.prof       cProfile data (cprofile mode)
+    uploads/profiles/ab/cd/<job_id>.folded     collapsed stacks (sample mode)
+
+Only the request thread is profiled; work done by the inference scheduler,
+the artifact pool or a decoder process shows up as waiting time.
+"""
+
+import cProfile
+import json
+import os
+import pstats
+import sys
+import threading
+import time
+import tracemalloc
+from collections import Counter
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+MODES = ("cprofile", "sample")
+TOP_FUNCTIONS = 40
+TOP_ALLOCATIONS = 25
+
+# tracemalloc 是进程级的，同一时间只让一个任务使用
+_tracemalloc_lock = threading.Lock()
+# Python 3.12 起 cProfile 基于进程级的 sys.monitoring，同时只能有一个；其余任务改用采样
+_cprofile_lock = threading.Lock()
+
+
+def parse_mode(value):
+    """Map a request value ("1", "true", "cprofile", "sample", ...) to a mode or None."""
+    if value is None:
+        return None
+    value = str(value).strip().lower()
+    if value in ("", "0", "false", "no", "off"):
+        return None
+    if value in MODES:
+        return value
+    return "cprofile"
+
+
+def peak_rss_bytes():
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux 以 KB 为单位，macOS 以字节为单位
+    return peak if sys.platform == "darwin" else peak * 1024
+
+
+class _StackSampler:
+    def __init__(self, thread_id, interval):
+        self.thread_id = thread_id
+        self.interval = interval
+        self.stacks = Counter()
+        self.samples = 0
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="profile-sampler", daemon=True)
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            frame = sys._current_frames().get(self.thread_id)
+            if frame is None:
+                continue
+            stack = []
+            while frame is not None:
+                code = frame.f_code
+                stack.append(f"{code.co_name} ({os.path.basename(code.co_filename)}:{frame.f_lineno})")
+                frame = frame.f_back
+            self.stacks[";".join(reversed(stack))] += 1
+            self.samples += 1
+
+    def start(self):
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        self._thread.join()
+
+    def folded(self):
+        return "".join(f"{stack} {count}\n" for stack, count in self.stacks.most_common())
+
+    def top_functions(self, limit):
+        """Leaf functions by share of samples (self time)."""
+        leaves = Counter()
+        for stack, count in self.stacks.items():
+            leaves[stack.rsplit(";", 1)[-1]] += count
+        return [
+            {"function": name, "samples": count, "fraction": round(count / max(1, self.samples), 4)}
+            for name, count in leaves.most_common(limit)
+        ]
+
+
+class JobProfiler:
+    """
+    Context manager profiling the code run inside it.
+
+    Args:
+        job_id (str): Used to name the report files.
+        mode (str): "cprofile" or "sample"; None disables profiling entirely.
+        base_path (str): Path of the report files without extension.
+        sample_interval (float): Seconds between stack samples in "sample" mode.
+    """
+
+    def __init__(self, job_id, mode, base_path, sample_interval=0.005):
+        self.job_id = job_id
+        self.mode = mode
+        self.base_path = base_path
+        self.sample_interval = sample_interval
+        self.report = None
+        self._profile = None
+        self._sampler = None
+        self._tracing = False
+        self._fallback = None
+
+    @property
+    def enabled(self):
+        return self.mode is not None
+
+    def __enter__(self):
+        if not self.enabled:
+            return self
+        if _tracemalloc_lock.acquire(blocking=False):
+            self._tracing = True
+            self._was_tracing = tracemalloc.is_tracing()
+            if not self._was_tracing:
+                tracemalloc.start(10)
+            tracemalloc.reset_peak()
+            self._snapshot_before = tracemalloc.take_snapshot()
+
+        self._wall = time.perf_counter()
+        self._cpu = time.thread_time()
+        if self.mode == "cprofile":
+            self._start_cprofile()
+        if self.mode == "sample":
+            self._sampler = _StackSampler(threading.get_ident(), self.sample_interval)
+            self._sampler.start()
+        return self
+
+    def _start_cprofile(self):
+        if not _cprofile_lock.acquire(blocking=False):
+            self._fallback = "cprofile in use by another profiled job"
+            self.mode = "sample"
+            return
+        profile = cProfile.Profile()
+        try:
+            profile.enable()
+        except ValueError as e:  # 其他性能分析工具占用了 sys.monitoring
+            _cprofile_lock.release()
+            self._fallback = f"cprofile unavailable: {e}"
+            self.mode = "sample"
+            return
+        self._profile = profile
+
+    def __exit__(self, exc_type, exc, tb):
+        if not self.enabled:
+            return False
+        if self._profile is not None:
+            self._profile.disable()
+            _cprofile_lock.release()
+        if self._sampler is not None:
+            self._sampler.stop()
+
+        report = {
+            "job_id": self.job_id,
+            "mode": self.mode,
+            "failed": exc_type is not None,
+            "wall_seconds": round(time.perf_counter() - self._wall, 6),
+            "thread_cpu_seconds": round(time.thread_time() - self._cpu, 6),
+            "peak_rss_bytes": peak_rss_bytes(),
+        }
+        if self._fallback:
+            report["fallback"] = self._fallback
+
+        if self._tracing:
+            try:
+                report["tracemalloc_peak_bytes"] = tracemalloc.get_traced_memory()[1]
+                diff = tracemalloc.take_snapshot().compare_to(self._snapshot_before, "lineno")
+                report["top_allocations"] = [
+                    {"location": str(stat.traceback[0]), "size_diff_bytes": stat.size_diff, "count_diff": stat.count_diff}
+                    for stat in diff[:TOP_ALLOCATIONS]
+                ]
+                self._snapshot_before = None
+                if not self._was_tracing:
+                    tracemalloc.stop()
+            finally:
+                _tracemalloc_lock.release()
+        else:
+            report["tracemalloc"] = "skipped: another profiled job was using tracemalloc"
+
+        os.makedirs(os.path.dirname(self.base_path), exist_ok=True)
+        if self._profile is not None:
+            self._profile.dump_stats(self.base_path + ".prof")
+            stats = pstats.Stats(self._profile)
+            report["top_functions"] = [
+                {
+                    "function": f"{func[2]} ({os.path.basename(func[0])}:{func[1]})",
+                    "calls": nc, "total_seconds": round(tt, 6), "cumulative_seconds": round(ct, 6),
+                }
+                for func, (cc, nc, tt, ct, _) in sorted(stats.stats.items(), key=lambda item: -item[1][3])[:TOP_FUNCTIONS]
+            ]
+        if self._sampler is not None:
+            with open(self.base_path + ".folded", "w", encoding="utf-8") as f:
+                f.write(self._sampler.folded())
+            report["samples"] = self._sampler.samples
+            report["top_functions"] = self._sampler.top_functions(TOP_FUNCTIONS)
+
+        tmp_path = f"{self.base_path}.json.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=2)
+        os.replace(tmp_path, self.base_path + ".json")
+        self.report = report
+        return False
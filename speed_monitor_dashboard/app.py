@@ -17,7 +17,8 @@ from PIL import Image
 import io
 import requests
 
-from data_handler import load_csv_data
+from data_handler import load_camera_data, load_incident_summary, load_chart_rollups, IncrementalIncidentLoader
+from incident_index import IncidentIndex
 from utils import (
     load_image,
     load_image_from_url, 
@@ -25,7 +26,10 @@ from utils import (
     create_map, 
     create_time_series_chart,
     create_speed_distribution_chart,
-    create_camera_bar_chart
+    create_camera_bar_chart,
+    paginate_incidents,
+    format_incident_table,
+    incident_labels
 )
 
 # Set page configuration
@@ -40,18 +44,40 @@ st.set_page_config(
 if 'selected_incident' not in st.session_state:
     st.session_state.selected_incident = None
 
-# Load data from CSV files
+# Load cameras and the incident summary (filter bounds)
 @st.cache_data(ttl=60)  # Cache for 60 seconds to allow refreshing
 def load_data():
     try:
-        camera_data, speeding_data = load_csv_data()
-        return camera_data, speeding_data
+        camera_data = load_camera_data()
+        incident_summary = load_incident_summary()
+        return camera_data, incident_summary
     except Exception as e:
         st.error(f"Error loading data: {str(e)}")
-        # Return empty DataFrames if loading fails
-        return pd.DataFrame(), pd.DataFrame()
+        # Return empty data if loading fails
+        return pd.DataFrame(), {}
 
-cameras_df, incidents_df = load_data()
+# The incident frame lives across reruns; each refresh only reads new rows
+@st.cache_resource
+def get_incident_loader():
+    return IncrementalIncidentLoader()
+
+def load_incidents():
+    try:
+        return get_incident_loader().load_index()
+    except Exception as e:
+        st.error(f"Error loading incidents: {str(e)}")
+        return IncidentIndex(pd.DataFrame(columns=["timestamp", "camera_id", "actual_speed"]))
+
+@st.cache_data(ttl=5)
+def load_rollups(camera_id, start_date, end_date):
+    try:
+        return load_chart_rollups(camera_id=camera_id, start=start_date, end=end_date)
+    except Exception as e:
+        st.error(f"Error loading chart data: {str(e)}")
+        return None
+
+cameras_df, incident_summary = load_data()
+incident_index = load_incidents()
 
 # Video loading
 def video_upload_ui():
@@ -86,21 +112,21 @@ st.write("Monitor and analyze speeding vehicle incidents captured by traffic cam
 st.sidebar.header("Filters")
 
 # Camera filter
-camera_options = ["All Cameras"] + sorted(incidents_df["camera_id"].unique().tolist())
+camera_options = ["All Cameras"] + incident_summary["camera_ids"]
 selected_camera = st.sidebar.selectbox("Select Camera", camera_options)
 camera_filter = None if selected_camera == "All Cameras" else selected_camera
 
 # Date range filter
-max_date = incidents_df["timestamp"].max().date()
-min_date = incidents_df["timestamp"].min().date()
+max_date = incident_summary["max_timestamp"].date()
+min_date = incident_summary["min_timestamp"].date()
 default_start_date = max_date - timedelta(days=30)
 
 start_date = st.sidebar.date_input("Start Date", default_start_date, min_value=min_date, max_value=max_date)
 end_date = st.sidebar.date_input("End Date", max_date, min_value=start_date, max_value=max_date)
 
 # Speed filter
-min_speed_val = int(incidents_df["actual_speed"].min())
-max_speed_val = int(incidents_df["actual_speed"].max())
+min_speed_val = int(incident_summary["min_speed"])
+max_speed_val = int(np.ceil(incident_summary["max_speed"]))
 speed_range = st.sidebar.slider(
     "Speed Range (km/h)", 
     min_value=min_speed_val, 
@@ -110,7 +136,7 @@ speed_range = st.sidebar.slider(
 
 # Apply filters
 filtered_incidents = filter_data(
-    incidents_df,
+    incident_index,
     camera_id=camera_filter,
     start_date=pd.Timestamp(start_date),
     end_date=pd.Timestamp(end_date),
@@ -118,13 +144,23 @@ filtered_incidents = filter_data(
     max_speed=speed_range[1]
 )
 
+# Charts and summary metrics come from the hourly rollup tables unless a speed
+# filter is active (rollups are not broken down by speed)
+chart_rollups = None
+if speed_range == (min_speed_val, max_speed_val):
+    chart_rollups = load_rollups(camera_filter, pd.Timestamp(start_date), pd.Timestamp(end_date) + timedelta(days=1))
+
 # Display summary statistics
 st.sidebar.header("Summary")
 st.sidebar.metric("Total Incidents", len(filtered_incidents))
 if not filtered_incidents.empty:
-    avg_excess = filtered_incidents["speed_difference"].mean()
+    if chart_rollups is not None and chart_rollups["summary"]["count"]:
+        avg_excess = chart_rollups["summary"]["mean_excess"]
+        max_excess = chart_rollups["summary"]["max_excess"]
+    else:
+        avg_excess = filtered_incidents["speed_difference"].mean()
+        max_excess = filtered_incidents["speed_difference"].max()
     st.sidebar.metric("Average Speed Excess", f"{avg_excess:.1f} km/h")
-    max_excess = filtered_incidents["speed_difference"].max()
     st.sidebar.metric("Maximum Speed Excess", f"{max_excess:.1f} km/h")
 
 # Create 2-column layout: Left for table, Right for map and charts
@@ -137,13 +173,32 @@ with col1:
     if filtered_incidents.empty:
         st.warning("No incidents match the selected filters.")
     else:
-        # Format display data
-        display_df = filtered_incidents.copy()
-        display_df["timestamp"] = display_df["timestamp"].dt.strftime("%Y-%m-%d %H:%M:%S")
-        display_df["coordinates"] = display_df.apply(
-            lambda row: f"{row['latitude']:.4f}, {row['longitude']:.4f}", axis=1
+        # Sort and paginate before formatting so only one page is ever rendered
+        sort_col, order_col, size_col, page_col = st.columns([2, 1, 1, 1])
+        sort_options = {
+            "Timestamp": "timestamp",
+            "Actual Speed": "actual_speed",
+            "Excess": "speed_difference",
+            "Camera ID": "camera_id",
+            "License Plate": "license_plate"
+        }
+        sort_label = sort_col.selectbox("Sort by", list(sort_options))
+        ascending = order_col.selectbox("Order", ["Descending", "Ascending"]) == "Ascending"
+        page_size = size_col.selectbox("Rows per page", [25, 50, 100, 250], index=1)
+        page_count = max(1, -(-len(filtered_incidents) // page_size))
+        page = page_col.number_input(f"Page (of {page_count})", min_value=1, max_value=page_count, value=1)
+        
+        page_df, _ = paginate_incidents(
+            filtered_incidents,
+            page=page,
+            page_size=page_size,
+            sort_by=sort_options[sort_label],
+            ascending=ascending
         )
         
+        # Format display data
+        display_df = format_incident_table(page_df)
+        
         # Select columns to display
         display_columns = ["timestamp", "license_plate", "camera_id", "coordinates", 
                           "speed_limit", "actual_speed", "speed_difference"]
@@ -164,17 +219,14 @@ with col1:
             }
         )
         
-        # Add a selectbox to pick an incident
-        if not filtered_incidents.empty:
-            incident_options = [f"{row['timestamp']} - {row['license_plate']} - {row['camera_id']}" 
-                              for _, row in filtered_incidents.iterrows()]
-            selected_incident_str = st.selectbox("Select an incident to view details:", incident_options)
-            
-            if selected_incident_str:
-                # Get the index of the selected incident
-                selected_idx = incident_options.index(selected_incident_str)
-                # Get the full row data
-                st.session_state.selected_incident = filtered_incidents.iloc[selected_idx]
+        # Add a selectbox to pick an incident on the current page
+        labels = incident_labels(page_df)
+        positions = {incident_id: i for i, incident_id in enumerate(labels)}
+        selected_id = st.selectbox("Select an incident to view details:", list(labels), format_func=labels.get)
+        
+        if selected_id is not None:
+            # Get the full row data
+            st.session_state.selected_incident = page_df.iloc[positions[selected_id]]
     
     # Display selected incident details
     if st.session_state.selected_incident is not None:
@@ -211,27 +263,45 @@ with col2:
     # Display map
     st.header("Camera Locations & Incidents")
     
-    # Create map with cameras and selected incidents
-    incident_map = create_map(cameras_df, filtered_incidents)
-    st_folium(incident_map, width=600, height=400)
+    # Create map with cameras and selected incidents; large result sets are
+    # culled to the last viewport and aggregated so the payload stays bounded
+    map_view = st.session_state.get("map_view", {})
+    map_mode = st.radio("Incident display", ["auto", "cluster", "heatmap"], horizontal=True)
+    incident_map = create_map(
+        cameras_df,
+        filtered_incidents,
+        center=map_view.get("center"),
+        zoom=map_view.get("zoom", 12),
+        bounds=map_view.get("bounds"),
+        mode=map_mode
+    )
+    map_state = st_folium(incident_map, width=600, height=400, key="incident_map",
+                          returned_objects=["zoom", "bounds", "center"])
+    if map_state and map_state.get("bounds") and map_state["bounds"].get("_southWest"):
+        south_west, north_east = map_state["bounds"]["_southWest"], map_state["bounds"]["_northEast"]
+        st.session_state.map_view = {
+            "center": [map_state["center"]["lat"], map_state["center"]["lng"]] if map_state.get("center") else None,
+            "zoom": map_state.get("zoom", 12),
+            "bounds": ((south_west["lat"], south_west["lng"]), (north_east["lat"], north_east["lng"]))
+        }
     
     # Create visualizations tab
     st.header("Visualizations")
     
     # Time series chart
-    time_chart = create_time_series_chart(filtered_incidents)
+    time_chart = create_time_series_chart(chart_rollups["daily"] if chart_rollups else filtered_incidents)
     if time_chart:
         st.plotly_chart(time_chart, use_container_width=True)
     else:
         st.info("Not enough data for time series visualization.")
     
     # Speed distribution chart
-    speed_chart = create_speed_distribution_chart(filtered_incidents)
+    speed_chart = create_speed_distribution_chart(chart_rollups["histogram"] if chart_rollups else filtered_incidents)
     if speed_chart:
         st.plotly_chart(speed_chart, use_container_width=True)
     
     # Camera incident distribution
-    camera_chart = create_camera_bar_chart(filtered_incidents)
+    camera_chart = create_camera_bar_chart(chart_rollups["by_camera"] if chart_rollups else filtered_incidents)
     if camera_chart:
         st.plotly_chart(camera_chart, use_container_width=True)
 
@@ -1,14 +1,250 @@
 """
-This module handles loading data from CSV files for the dashboard.
-It replaces the previous data_generator module.
+This module handles loading data for the dashboard.
+Cameras come from cameras.csv through the shared camera registry and
+incidents from the SQLite incident store. It replaces the previous
+data_generator module.
 """
 
 import pandas as pd
 import os
+import sys
+import threading
+import time
 
-def load_csv_data():
+# 让仪表盘可以导入仓库根目录下的共享模块（storage/ 等）
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from storage.camera_registry import CAMERA_FIELDS, get_registry, invalidate as invalidate_cameras
+from storage.incident_store import open_store, EXCESS_BIN_WIDTH
+from storage.incident_writer import get_writer
+from storage import parquet_archive
+from incident_index import IncidentIndex
+
+CAMERA_FILE = 'data/cameras.csv'
+INCIDENTS_FILE = 'data/incidents.csv'
+INCIDENTS_DB = 'data/incidents.db'
+INCIDENTS_ARCHIVE = 'data/archive'
+
+
+def get_incident_store():
+    """Return the shared SQLite incident store, importing incidents.csv on first use."""
+    return open_store(INCIDENTS_DB, incidents_csv=INCIDENTS_FILE, cameras_csv=CAMERA_FILE)
+
+
+def _camera_frame(camera_file):
+    """Build the camera DataFrame from the shared in-memory registry."""
+    camera_data = pd.DataFrame(get_registry(camera_file).records())
+    for column in CAMERA_FIELDS:
+        if column not in camera_data.columns:
+            camera_data[column] = pd.Series(dtype="object")
+
+    # 保持与 pd.read_csv 相同的整数限速类型，避免 st.number_input 混合类型报错
+    speed_limit = camera_data['speed_limit']
+    if not speed_limit.empty and speed_limit.notna().all() and (speed_limit % 1 == 0).all():
+        camera_data['speed_limit'] = speed_limit.astype('int64')
+
+    return camera_data
+
+def query_incidents(camera_id=None, start=None, end=None, min_speed=None, max_speed=None,
+                    store=None, columns=None, archive_dir=INCIDENTS_ARCHIVE):
+    """
+    Query incidents with the filters pushed down to storage.
+    
+    Incidents already compacted into the Parquet archive are read from the
+    partitions that match the date range and camera (only the requested
+    columns); newer incidents come from the SQLite store as SQL.
+    
+    Args:
+        camera_id (str): Only incidents from this camera
+        start, end: Inclusive timestamp bounds
+        min_speed, max_speed (float): Inclusive bounds on the measured speed
+        store (IncidentStore): Store to query, defaults to the dashboard's store
+        columns (list): Columns to load, defaults to all
+        archive_dir (str): Parquet archive directory; ignored if it was never compacted
+    
+    Returns:
+        pandas.DataFrame: Matching incidents, newest first
+    """
+    store = store or get_incident_store()
+    filters = dict(camera_id=camera_id, start=start, end=end, min_speed=min_speed, max_speed=max_speed)
+    
+    frames = []
+    archived_up_to = 0
+    if archive_dir and os.path.isfile(os.path.join(archive_dir, parquet_archive.MANIFEST_NAME)):
+        archived_up_to = parquet_archive.read_manifest(archive_dir)["last_id"]
+        frames.append(parquet_archive.load(archive_dir, columns=columns, **filters))
+    
+    sql, params = store.select_sql(columns=columns, after_id=archived_up_to, **filters)
+    parse_dates = ['timestamp'] if columns is None or 'timestamp' in columns else None
+    frames.append(pd.read_sql_query(sql, store.connection(), params=params, parse_dates=parse_dates))
+    
+    if len(frames) == 1:
+        return frames[0]
+    
+    incidents = pd.concat([frame for frame in frames if not frame.empty] or frames[-1:], ignore_index=True)
+    sort_columns = [c for c in ('timestamp', 'id') if c in incidents.columns]
+    if sort_columns:
+        incidents = incidents.sort_values(sort_columns, ascending=False, ignore_index=True)
+    return incidents
+
+class IncrementalIncidentLoader:
+    """
+    Keep the full, newest-first incident frame in memory and only fetch what changed.
+    
+    The loader remembers the highest row id (and the first id and the last
+    row's timestamp) from the previous load. A refresh then reads only rows
+    with a larger id and merges them into the cached, already sorted frame.
+    If earlier rows disappeared or were rewritten (database truncated or
+    re-imported), it falls back to a full reload.
+    """
+    
+    def __init__(self, store=None, min_interval=5.0):
+        self.store = store
+        self.min_interval = min_interval
+        self._lock = threading.Lock()
+        self._frame = None
+        self._first_id = None
+        self._last_id = 0
+        self._last_timestamp = None
+        self._checked_at = 0.0
+        self._index = None
+        self._indexed_frame = None
+    
+    def _get_store(self):
+        return self.store or get_incident_store()
+    
+    def _remember(self, frame):
+        self._frame = frame
+        if frame.empty:
+            self._first_id, self._last_id, self._last_timestamp = None, 0, None
+        else:
+            last = frame['id'].idxmax()
+            self._first_id = int(frame['id'].min())
+            self._last_id = int(frame.at[last, 'id'])
+            self._last_timestamp = frame.at[last, 'timestamp']
+    
+    def _unchanged_prefix(self, conn):
+        """Check that the rows loaded so far are still the same rows."""
+        if self._last_id == 0:
+            return True
+        first_id, = conn.execute("SELECT MIN(id) FROM incidents").fetchone()
+        row = conn.execute("SELECT timestamp FROM incidents WHERE id = ?", (self._last_id,)).fetchone()
+        return (first_id == self._first_id and row is not None
+                and pd.Timestamp(row[0]) == self._last_timestamp)
+    
+    def _full_reload(self):
+        self._remember(query_incidents(store=self._get_store()))
+    
+    def _tail(self):
+        store = self._get_store()
+        sql, params = store.select_sql(after_id=self._last_id)
+        new_rows = pd.read_sql_query(sql, store.connection(), params=params, parse_dates=['timestamp'])
+        if new_rows.empty:
+            return
+        frame = self._frame
+        if frame.empty or new_rows['timestamp'].iloc[-1] >= frame['timestamp'].iloc[0]:
+            # 常见情况：新记录都比缓存中最新的记录更晚，直接拼在前面
+            merged = pd.concat([new_rows, frame], ignore_index=True)
+        else:
+            merged = pd.concat([new_rows, frame], ignore_index=True).sort_values(
+                ['timestamp', 'id'], ascending=False, ignore_index=True, kind='stable')
+        self._remember(merged)
+    
+    def load(self, force=False):
+        """
+        Return the incident frame, refreshing it if min_interval has passed.
+        
+        Args:
+            force (bool): Check for new rows even if min_interval has not passed
+        
+        Returns:
+            pandas.DataFrame: All incidents, newest first
+        """
+        with self._lock:
+            now = time.monotonic()
+            if self._frame is not None and not force and now - self._checked_at < self.min_interval:
+                return self._frame
+            self._checked_at = now
+            if self._frame is None or not self._unchanged_prefix(self._get_store().connection()):
+                self._full_reload()
+            else:
+                self._tail()
+            return self._frame
+    
+    def load_index(self, force=False):
+        """
+        Return an IncidentIndex over the current frame, rebuilt only when new rows arrived.
+        
+        Returns:
+            IncidentIndex: Sorted, searchable incidents
+        """
+        frame = self.load(force=force)
+        with self._lock:
+            if self._indexed_frame is not frame:
+                self._index = IncidentIndex(frame)
+                self._indexed_frame = frame
+            return self._index
+
+def load_incident_summary():
+    """
+    Load the values needed to build the dashboard filters without reading any incident rows.
+    
+    Returns:
+        dict: camera_ids, min/max timestamp, min/max speed and the incident count
+    """
+    store = get_incident_store()
+    summary = store.bounds()
+    summary['camera_ids'] = store.camera_ids()
+    summary['min_timestamp'] = pd.to_datetime(summary['min_timestamp'])
+    summary['max_timestamp'] = pd.to_datetime(summary['max_timestamp'])
+    return summary
+
+def load_chart_rollups(camera_id=None, start=None, end=None):
+    """
+    Load pre-aggregated chart data from the rollup tables (per camera x hour).
+    
+    The cost depends on the number of hourly buckets in the range, not on the
+    number of incidents. Rollups cannot apply a speed filter.
+    
+    Returns:
+        dict: 'daily' (timestamp, count), 'by_camera' (camera_id, count),
+        'histogram' (speed_difference, count) DataFrames and a 'summary' dict
+        with count, mean_excess and max_excess
+    """
+    store = get_incident_store()
+    filters = dict(camera_id=camera_id, start=start, end=end)
+    daily = pd.DataFrame(store.rollup_series(freq="day", **filters), columns=['bucket', 'count'])
+    daily = daily.rename(columns={'bucket': 'timestamp'})
+    daily['timestamp'] = pd.to_datetime(daily['timestamp'])
+    if not daily.empty:
+        # 汇总表里只有出现过事故的日期；补上中间为 0 的日期，与原来 resample('D') 的结果一致
+        days = pd.date_range(daily['timestamp'].min(), daily['timestamp'].max(), freq='D', name='timestamp')
+        daily = daily.set_index('timestamp').reindex(days, fill_value=0).reset_index()
+    histogram = pd.DataFrame(store.rollup_histogram(**filters), columns=['bin_start', 'count'])
+    return {
+        'daily': daily,
+        'by_camera': pd.DataFrame(store.rollup_by_camera(**filters), columns=['camera_id', 'count']),
+        'histogram': histogram.rename(columns={'bin_start': 'speed_difference'}),
+        'summary': store.rollup_summary(**filters),
+    }
+
+def load_camera_data():
+    """
+    Load camera data through the shared camera registry.
+    
+    Returns:
+        pandas.DataFrame: One row per camera
+    """
+    if not os.path.exists(CAMERA_FILE):
+        raise FileNotFoundError(f"Camera data file not found: {CAMERA_FILE}")
+    return _camera_frame(CAMERA_FILE)
+
+def load_csv_data(camera_id=None, start=None, end=None, min_speed=None, max_speed=None):
     """
-    Load camera and speeding incident data from CSV files.
+    Load camera and speeding incident data.
+    
+    Incidents come from the SQLite store (seeded once from incidents.csv);
+    any filters given are pushed down into the SQL query.
     
     Returns:
         tuple: (camera_data, speeding_data) as pandas DataFrames
@@ -17,45 +253,25 @@ def load_csv_data():
     if not os.path.exists('data'):
         raise FileNotFoundError("Data directory not found. Please create 'data' directory with cameras.csv and incidents.csv files.")
     
-    # Check if required CSV files exist
-    camera_file = 'data/cameras.csv'
-    incidents_file = 'data/incidents.csv'
-    
-    if not os.path.exists(camera_file):
-        raise FileNotFoundError(f"Camera data file not found: {camera_file}")
-    
-    if not os.path.exists(incidents_file):
-        raise FileNotFoundError(f"Incidents data file not found: {incidents_file}")
-    
     # Load camera data
-    camera_data = pd.read_csv(camera_file)
+    camera_data = load_camera_data()
     
-    # Load incidents data and convert timestamp to datetime
-    speeding_data = pd.read_csv(incidents_file)
-    speeding_data['timestamp'] = pd.to_datetime(speeding_data['timestamp'])
-    speeding_data = speeding_data.sort_values('timestamp', ascending=False)
+    # Load incidents data (timestamps parsed, newest first)
+    speeding_data = query_incidents(camera_id=camera_id, start=start, end=end,
+                                    min_speed=min_speed, max_speed=max_speed)
     
     return camera_data, speeding_data
 
 def save_incident(incident_data):
     """
-    Save a new incident to the incidents CSV file.
+    Save a new incident to the incident store.
     
     Args:
         incident_data (dict): Dictionary containing the incident data
     """
-    incidents_file = 'data/incidents.csv'
-    
-    # Convert to DataFrame
-    new_incident = pd.DataFrame([incident_data])
-    
-    # Check if file exists
-    if os.path.exists(incidents_file):
-        # Append to existing file without header
-        new_incident.to_csv(incidents_file, mode='a', header=False, index=False)
-    else:
-        # Create new file with header
-        new_incident.to_csv(incidents_file, index=False)
+    # Goes through the shared group-commit writer; wait so the form only
+    # reports success once the incident is durable
+    get_writer(get_incident_store()).submit(incident_data).result(timeout=30)
     
     return True
 
@@ -66,7 +282,7 @@ def save_camera(camera_data):
     Args:
         camera_data (dict): Dictionary containing the camera data
     """
-    camera_file = 'data/cameras.csv'
+    camera_file = CAMERA_FILE
     
     # Convert to DataFrame
     new_camera = pd.DataFrame([camera_data])
@@ -78,5 +294,10 @@ def save_camera(camera_data):
     else:
         # Create new file with header
         new_camera.to_csv(camera_file, index=False)
-    
-    return True
\ No newline at end of file
+
+    # The registry would notice the mtime/size change anyway; invalidate explicitly
+    # so that writes within the same mtime tick are never missed.
+    invalidate_cameras(camera_file)
+    get_incident_store().upsert_camera(camera_data)
+
+    return True
@@ -0,0 +1,180 @@
+"""
+Bounded two-level (memory + disk) LRU cache for incident images.
+
+Local snapshots are served from the thumbnail the detection pipeline writes
+next to them (<name>.thumb.jpg) when it exists. Remote image URLs are fetched
+once through a pooled requests.Session, shrunk to a thumbnail with Pillow and
+kept on disk, so reruns do no network I/O.
+"""
+
+import hashlib
+import os
+import threading
+from collections import OrderedDict
+from io import BytesIO
+
+import requests
+from PIL import Image
+from requests.adapters import HTTPAdapter
+
+THUMBNAIL_MAX_SIDE = 320
+
+
+def thumbnail_path(image_path):
+    """Same naming convention as artifacts.thumbnail_path in the API server."""
+    root, _ = os.path.splitext(image_path)
+    return f"{root}.thumb.jpg"
+
+
+def make_thumbnail(data, max_side=THUMBNAIL_MAX_SIDE):
+    """Shrink encoded image bytes to a JPEG thumbnail; returns the input if it is already small."""
+    image = Image.open(BytesIO(data))
+    if max(image.size) <= max_side:
+        return data
+    image.thumbnail((max_side, max_side))
+    out = BytesIO()
+    image.convert("RGB").save(out, format="JPEG", quality=80)
+    return out.getvalue()
+
+
+class ImageFetchError(Exception):
+    pass
+
+
+class ImageCache:
+    def __init__(self, cache_dir, memory_bytes=64 * 1024 * 1024, disk_bytes=512 * 1024 * 1024,
+                 pool_size=8, timeout=10):
+        self.cache_dir = cache_dir
+        self.memory_bytes = memory_bytes
+        self.disk_bytes = disk_bytes
+        self.timeout = timeout
+        self._memory = OrderedDict()
+        self._memory_used = 0
+        self._disk_used = None
+        self._lock = threading.Lock()
+
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size, max_retries=2)
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
+
+    # ---- memory level -------------------------------------------------------
+
+    def _memory_get(self, key):
+        with self._lock:
+            data = self._memory.get(key)
+            if data is not None:
+                self._memory.move_to_end(key)
+            return data
+
+    def _memory_put(self, key, data):
+        if len(data) > self.memory_bytes:
+            return
+        with self._lock:
+            old = self._memory.pop(key, None)
+            if old is not None:
+                self._memory_used -= len(old)
+            self._memory[key] = data
+            self._memory_used += len(data)
+            while self._memory_used > self.memory_bytes:
+                _, evicted = self._memory.popitem(last=False)
+                self._memory_used -= len(evicted)
+
+    # ---- disk level ---------------------------------------------------------
+
+    def _disk_path(self, key):
+        digest = hashlib.sha1(key.encode("utf-8")).hexdigest()
+        return os.path.join(self.cache_dir, digest[:2], digest + ".jpg")
+
+    def _disk_get(self, key):
+        path = self._disk_path(key)
+        try:
+            with open(path, "rb") as f:
+                data = f.read()
+        except OSError:
+            return None
+        os.utime(path)  # 用 mtime 记录最近访问时间，供 LRU 淘汰
+        return data
+
+    def _disk_put(self, key, data):
+        path = self._disk_path(key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp_path = f"{path}.{threading.get_ident()}.tmp"
+        with open(tmp_path, "wb") as f:
+            f.write(data)
+        os.replace(tmp_path, path)
+        with self._lock:
+            if self._disk_used is None:
+                self._disk_used = sum(size for _, size, _ in self._disk_entries())
+            else:
+                self._disk_used += len(data)
+            if self._disk_used > self.disk_bytes:
+                self._evict_disk()
+
+    def _disk_entries(self):
+        for root, _, files in os.walk(self.cache_dir):
+            for name in files:
+                path = os.path.join(root, name)
+                try:
+                    st = os.stat(path)
+                except OSError:
+                    continue
+                yield st.st_mtime, st.st_size, path
+
+    def _evict_disk(self):
+        # 淘汰到容量的 90%，避免每次写入都遍历目录
+        entries = sorted(self._disk_entries())
+        used = sum(size for _, size, _ in entries)
+        target = self.disk_bytes * 0.9
+        for _, size, path in entries:
+            if used <= target:
+                break
+            try:
+                os.remove(path)
+                used -= size
+            except OSError:
+                pass
+        self._disk_used = used
+
+    # ---- public API ---------------------------------------------------------
+
+    def get(self, source, thumbnail=True):
+        """
+        Return image bytes for a local path or http(s) URL.
+
+        Raises:
+            FileNotFoundError: If a local image does not exist.
+            ImageFetchError: If a remote image cannot be fetched.
+        """
+        remote = source.startswith("http://") or source.startswith("https://")
+        if not remote:
+            if thumbnail and os.path.isfile(thumbnail_path(source)):
+                source = thumbnail_path(source)
+            elif not os.path.isfile(source):
+                raise FileNotFoundError(source)
+            # 本地文件以 mtime 作为版本，文件被覆盖后自动失效
+            key = f"{source}|{os.path.getmtime(source)}|{thumbnail}"
+        else:
+            key = f"{source}|{thumbnail}"
+
+        data = self._memory_get(key)
+        if data is not None:
+            return data
+
+        if not remote:
+            with open(source, "rb") as f:
+                data = f.read()
+            if thumbnail and not source.endswith(".thumb.jpg"):
+                data = make_thumbnail(data)
+            self._memory_put(key, data)
+            return data
+
+        data = self._disk_get(key)
+        if data is None:
+            response = self.session.get(source, timeout=self.timeout)
+            if response.status_code != 200:
+                raise ImageFetchError(f"Status code: {response.status_code}")
+            data = make_thumbnail(response.content) if thumbnail else response.content
+            self._disk_put(key, data)
+        self._memory_put(key, data)
+        return data
@@ -0,0 +1,100 @@
+"""
+Pre-sorted, searchable representation of the incident DataFrame.
+
+Building the index sorts the incidents once by timestamp, and once by camera
+then timestamp (camera_id stored as a categorical). Filtering then resolves
+the camera to a contiguous block through per-camera offsets, and the date
+range to a sub-slice through binary search (searchsorted). The speed range
+is only applied to that slice. When no speed mask is needed the result is a
+view of the sorted frame rather than a copy.
+"""
+
+import numpy as np
+import pandas as pd
+
+
+class IncidentIndex:
+    def __init__(self, df):
+        """
+        Build the index.
+
+        Args:
+            df (pandas.DataFrame): Incidents with at least timestamp, camera_id and actual_speed
+        """
+        df = df.reset_index(drop=True)
+        df['camera_id'] = df['camera_id'].astype('category')
+        times = df['timestamp'].to_numpy()
+        tie_break = df['id'].to_numpy() if 'id' in df.columns else np.arange(len(df))
+        codes = df['camera_id'].cat.codes.to_numpy()
+
+        # Oldest first, so searchsorted works; filter() returns reversed (newest first) views
+        self.by_time = df.take(np.lexsort((tie_break, times))).reset_index(drop=True)
+        self._times = self.by_time['timestamp'].to_numpy()
+
+        camera_order = np.lexsort((tie_break, times, codes))
+        self.by_camera = df.take(camera_order).reset_index(drop=True)
+        self._camera_times = self.by_camera['timestamp'].to_numpy()
+        sorted_codes = codes[camera_order]
+        categories = df['camera_id'].cat.categories
+        starts = np.searchsorted(sorted_codes, np.arange(len(categories)), side='left')
+        stops = np.searchsorted(sorted_codes, np.arange(len(categories)), side='right')
+        self.offsets = {
+            camera: (int(start), int(stop))
+            for camera, start, stop in zip(categories, starts, stops) if stop > start
+        }
+
+    def __len__(self):
+        return len(self.by_time)
+
+    @property
+    def empty(self):
+        return len(self.by_time) == 0
+
+    @property
+    def frame(self):
+        """All incidents, newest first (a view of the sorted frame)."""
+        return self.by_time.iloc[::-1]
+
+    @property
+    def camera_ids(self):
+        return sorted(self.offsets)
+
+    @property
+    def min_timestamp(self):
+        return self.by_time['timestamp'].iloc[0] if len(self) else pd.NaT
+
+    @property
+    def max_timestamp(self):
+        return self.by_time['timestamp'].iloc[-1] if len(self) else pd.NaT
+
+    def filter(self, camera_id=None, start=None, end=None, min_speed=None, max_speed=None):
+        """
+        Select incidents; start and end are inclusive timestamps.
+
+        Returns:
+            pandas.DataFrame: Matching incidents, newest first
+        """
+        if camera_id:
+            frame, times = self.by_camera, self._camera_times
+            lo, hi = self.offsets.get(camera_id, (0, 0))
+        else:
+            frame, times = self.by_time, self._times
+            lo, hi = 0, len(frame)
+
+        if start is not None and hi > lo:
+            lo += int(np.searchsorted(times[lo:hi], pd.Timestamp(start).to_datetime64(), side='left'))
+        if end is not None and hi > lo:
+            hi = lo + int(np.searchsorted(times[lo:hi], pd.Timestamp(end).to_datetime64(), side='right'))
+
+        result = frame.iloc[lo:hi]
+        if min_speed is not None or max_speed is not None:
+            speeds = result['actual_speed'].to_numpy()
+            mask = np.ones(len(speeds), dtype=bool)
+            if min_speed is not None:
+                mask &= speeds >= min_speed
+            if max_speed is not None:
+                mask &= speeds <= max_speed
+            if not mask.all():
+                result = result[mask]
+
+        return result.iloc[::-1]
@@ -0,0 +1,53 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from incident_index import IncidentIndex
+from utils import filter_data
+
+
+@pytest.fixture(scope="module")
+def incidents():
+    rng = np.random.default_rng(5)
+    count = 2000
+    start = pd.Timestamp("2025-01-01")
+    return pd.DataFrame({
+        "id": np.arange(1, count + 1),
+        # 取整到小时，制造时间戳相同的记录
+        "timestamp": start + pd.to_timedelta(rng.integers(0, 60 * 24, count), unit="h"),
+        "camera_id": rng.choice(["CAM001", "CAM002", "CAM003"], count),
+        "actual_speed": rng.uniform(30, 130, count).round(1),
+    })
+
+
+def _ids(frame):
+    return frame["id"].tolist()
+
+
+@pytest.mark.parametrize("filters", [
+    {},
+    {"camera_id": "CAM002"},
+    {"camera_id": "CAM404"},
+    {"start_date": pd.Timestamp("2025-01-10"), "end_date": pd.Timestamp("2025-01-20")},
+    {"start_date": pd.Timestamp("2025-01-31"), "end_date": pd.Timestamp("2025-01-31")},  # 结束日整天计入
+    {"min_speed": 80, "max_speed": 100},
+    {"camera_id": "CAM001", "start_date": pd.Timestamp("2025-02-01"), "min_speed": 90},
+    {"start_date": pd.Timestamp("2026-01-01")},
+])
+def test_index_matches_dataframe_filter(incidents, filters):
+    expected = filter_data(incidents, **filters).sort_values(["timestamp", "id"], ascending=False)
+    result = filter_data(IncidentIndex(incidents), **filters)
+    assert _ids(result) == _ids(expected)
+
+
+def test_index_is_newest_first_with_id_tie_break(incidents):
+    frame = IncidentIndex(incidents).frame
+    assert frame["timestamp"].is_monotonic_decreasing
+    ties = frame.groupby("timestamp", sort=False)["id"]
+    assert ties.apply(lambda ids: ids.is_monotonic_decreasing).all()
+
+
+def test_empty_index(incidents):
+    index = IncidentIndex(incidents.iloc[:0])
+    assert index.empty and index.camera_ids == []
+    assert index.filter(camera_id="CAM001", start="2025-01-01").empty
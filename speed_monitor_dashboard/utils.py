@@ -7,6 +7,7 @@ import streamlit as st
 import pandas as pd
 import numpy as np
 import folium
+from folium.plugins import HeatMap, MarkerCluster
 from streamlit_folium import folium_static
 import plotly.express as px
 from datetime import datetime, timedelta
@@ -16,46 +17,69 @@ from PIL import Image
 import requests
 from io import BytesIO
 
+from data_handler import query_incidents, EXCESS_BIN_WIDTH
+from incident_index import IncidentIndex
+from image_cache import ImageCache, ImageFetchError
 
-def load_image(source):
-    """Load image from a URL or local file depending on input format."""
+# Shared by all sessions of this Streamlit process
+image_cache = ImageCache(os.path.join("data", "image_cache"))
+
+# Above this many incidents in view the map shows aggregated cells instead of one marker each
+MAP_MARKER_LIMIT = 300
+
+
+def load_image(source, thumbnail=True):
+    """Load image from a URL or local file depending on input format.
+
+    Images go through the shared memory/disk LRU cache; by default the
+    thumbnail is returned (the pipeline's .thumb.jpg for local snapshots).
+    """
     try:
-        if source.startswith("http://") or source.startswith("https://"):
-            # Load from URL
-            response = requests.get(source)
-            if response.status_code == 200:
-                return response.content
-            else:
-                st.error(f"Failed to load image from URL: {source}, Status code: {response.status_code}")
-                return None
-        else:
-            # Load from local file
-            if os.path.isfile(source):
-                with open(source, "rb") as f:
-                    return f.read()
-            else:
-                st.error(f"File not found: {source}")
-                return None
+        return image_cache.get(source, thumbnail=thumbnail)
+    except FileNotFoundError:
+        st.error(f"File not found: {source}")
+        return None
+    except ImageFetchError as e:
+        st.error(f"Failed to load image from URL: {source}, {str(e)}")
+        return None
     except Exception as e:
         st.error(f"Error loading image from source: {source}, Error: {str(e)}")
         return None
     
     
 def load_image_from_url(url):
-    """Load an image from a URL and convert to base64 for embedding."""
-    try:
-        response = requests.get(url)
-        if response.status_code == 200:
-            return response.content
-        else:
-            st.error(f"Failed to load image from URL: {url}, Status code: {response.status_code}")
-            return None
-    except Exception as e:
-        st.error(f"Error loading image from URL: {url}, Error: {str(e)}")
-        return None
+    """Load an image from a URL (full resolution, cached)."""
+    return load_image(url, thumbnail=False)
 
 def filter_data(df, camera_id=None, start_date=None, end_date=None, min_speed=None, max_speed=None):
-    """Filter data based on user selections."""
+    """Filter data based on user selections.
+
+    ``df`` may be an incident DataFrame, an IncidentIndex (binary-searched
+    slices, no full copy) or an IncidentStore (filters pushed down as SQL).
+    """
+    if end_date:
+        # Add one day to include the end date fully
+        end_date = end_date + timedelta(days=1)
+
+    if isinstance(df, IncidentIndex):
+        return df.filter(
+            camera_id=camera_id,
+            start=start_date or None,
+            end=end_date or None,
+            min_speed=min_speed,
+            max_speed=max_speed
+        )
+
+    if not isinstance(df, pd.DataFrame):
+        return query_incidents(
+            camera_id=camera_id,
+            start=start_date or None,
+            end=end_date or None,
+            min_speed=min_speed,
+            max_speed=max_speed,
+            store=df
+        )
+
     filtered_df = df.copy()
     
     if camera_id:
@@ -65,8 +89,6 @@ def filter_data(df, camera_id=None, start_date=None, end_date=None, min_speed=No
         filtered_df = filtered_df[filtered_df['timestamp'] >= start_date]
     
     if end_date:
-        # Add one day to include the end date fully
-        end_date = end_date + timedelta(days=1)
         filtered_df = filtered_df[filtered_df['timestamp'] <= end_date]
     
     if min_speed is not None:
@@ -77,26 +99,132 @@ def filter_data(df, camera_id=None, start_date=None, end_date=None, min_speed=No
     
     return filtered_df
 
-def create_map(camera_df, incident_df=None, center=None):
-    """Create a folium map with camera locations and incident markers."""
+def paginate_incidents(df, page=1, page_size=50, sort_by="timestamp", ascending=False):
+    """
+    Return one sorted page of incidents without sorting or copying the whole frame.
+    
+    The filtered frame is already newest first, so the default order is a
+    plain slice. Other orders only fully sort the first page * page_size rows
+    (argpartition), which keeps early pages O(n).
+    
+    Returns:
+        tuple: (page_df, page_count)
+    """
+    page_count = max(1, -(-len(df) // page_size))
+    page = min(max(1, page), page_count)
+    start, stop = (page - 1) * page_size, min(page * page_size, len(df))
+    
+    if sort_by == "timestamp" and not ascending:
+        return df.iloc[start:stop], page_count
+    if sort_by == "timestamp":
+        return df.iloc[::-1].iloc[start:stop], page_count
+    
+    values = df[sort_by].to_numpy()
+    if values.dtype == object or isinstance(df[sort_by].dtype, pd.CategoricalDtype):
+        values = df[sort_by].astype(str).to_numpy()
+        order = np.argsort(values, kind="stable")
+        if not ascending:
+            order = order[::-1]
+    else:
+        keys = values if ascending else -values.astype(float)
+        if stop < len(keys):
+            top = np.argpartition(keys, stop - 1)[:stop]
+            order = top[np.argsort(keys[top], kind="stable")]
+        else:
+            order = np.argsort(keys, kind="stable")
+    return df.iloc[order[start:stop]], page_count
+
+def format_incident_table(page_df):
+    """Add display strings (timestamp, coordinates) to a page of incidents, column-wise."""
+    display_df = page_df.copy()
+    display_df["timestamp"] = display_df["timestamp"].dt.strftime("%Y-%m-%d %H:%M:%S")
+    lat = display_df["latitude"].to_numpy(dtype=float)
+    lon = display_df["longitude"].to_numpy(dtype=float)
+    display_df["coordinates"] = np.char.add(np.char.add(np.char.mod("%.4f", lat), ", "), np.char.mod("%.4f", lon))
+    return display_df
+
+def incident_labels(page_df):
+    """Map incident id -> "timestamp - plate - camera" label for a page of incidents."""
+    labels = (page_df["timestamp"].dt.strftime("%Y-%m-%d %H:%M:%S") + " - "
+              + page_df["license_plate"].astype(str) + " - " + page_df["camera_id"].astype(str))
+    return dict(zip(page_df["id"].tolist(), labels.tolist()))
+
+def cull_to_bounds(incident_df, bounds):
+    """Keep only incidents with a location inside the map viewport ((south, west), (north, east))."""
+    if incident_df.empty:
+        return incident_df
+    lat = incident_df['latitude'].to_numpy(dtype=float)
+    lon = incident_df['longitude'].to_numpy(dtype=float)
+    # Incidents from unknown cameras have no coordinates and cannot be drawn
+    mask = ~(np.isnan(lat) | np.isnan(lon))
+    if bounds is not None:
+        (south, west), (north, east) = bounds
+        mask &= (lat >= south) & (lat <= north) & (lon >= west) & (lon <= east)
+    return incident_df if mask.all() else incident_df[mask]
+
+def aggregate_incidents(incident_df, zoom=12, max_cells=MAP_MARKER_LIMIT):
+    """
+    Aggregate incidents into square lat/lon grid cells sized for the zoom level.
+    
+    Returns:
+        pandas.DataFrame: One row per cell (latitude, longitude, count,
+        max_excess, mean_speed), at most max_cells rows, busiest first
+    """
+    # 每个网格约为当前缩放级别下 16 像素宽（一个瓦片 256 像素）
+    cell_size = 360.0 / (2 ** zoom) / 16
+    cells = pd.DataFrame({
+        'cell_lat': np.floor(incident_df['latitude'].to_numpy() / cell_size),
+        'cell_lon': np.floor(incident_df['longitude'].to_numpy() / cell_size),
+        'latitude': incident_df['latitude'].to_numpy(),
+        'longitude': incident_df['longitude'].to_numpy(),
+        'speed_difference': incident_df['speed_difference'].to_numpy(),
+        'actual_speed': incident_df['actual_speed'].to_numpy(),
+    }).dropna(subset=['cell_lat', 'cell_lon'])
+    
+    aggregated = cells.groupby(['cell_lat', 'cell_lon'], sort=False).agg(
+        latitude=('latitude', 'mean'),
+        longitude=('longitude', 'mean'),
+        count=('latitude', 'size'),
+        max_excess=('speed_difference', 'max'),
+        mean_speed=('actual_speed', 'mean'),
+    )
+    return aggregated.nlargest(max_cells, 'count').reset_index(drop=True)
+
+def create_map(camera_df, incident_df=None, center=None, zoom=12, bounds=None, mode="auto"):
+    """
+    Create a folium map with camera locations and incident markers.
+    
+    The payload is bounded regardless of the number of incidents: incidents
+    outside ``bounds`` are culled, and if more than MAP_MARKER_LIMIT remain they
+    are aggregated into grid cells and drawn as clustered count markers
+    (``mode="cluster"``) or a heatmap (``mode="heatmap"``). ``mode="auto"``
+    draws individual markers when few enough incidents are in view.
+    """
     # If no center is provided, use the mean coordinates from camera_df
     if center is None:
         center = [camera_df['latitude'].mean(), camera_df['longitude'].mean()]
     
     # Create a map
-    m = folium.Map(location=center, zoom_start=12)
+    m = folium.Map(location=center, zoom_start=zoom)
     
     # Add camera markers
-    for _, camera in camera_df.iterrows():
+    for camera in camera_df.to_dict('records'):
         folium.Marker(
             location=[camera['latitude'], camera['longitude']],
             popup=f"Camera ID: {camera['camera_id']}<br>Speed Limit: {camera['speed_limit']} km/h",
             icon=folium.Icon(icon="video-camera", prefix="fa", color="blue")
         ).add_to(m)
     
-    # Add incident markers if incident data is provided
-    if incident_df is not None and not incident_df.empty:
-        for _, incident in incident_df.iterrows():
+    if incident_df is None or incident_df.empty:
+        return m
+    
+    visible = cull_to_bounds(incident_df, bounds)
+    if mode == "auto":
+        mode = "markers" if len(visible) <= MAP_MARKER_LIMIT else "cluster"
+    
+    if mode == "markers":
+        # Add one marker per incident (at most MAP_MARKER_LIMIT)
+        for incident in visible.head(MAP_MARKER_LIMIT).to_dict('records'):
             # Format timestamp for display
             timestamp_str = incident['timestamp'].strftime("%Y-%m-%d %H:%M:%S")
             
@@ -116,17 +244,47 @@ def create_map(camera_df, incident_df=None, center=None):
                 popup=popup_content,
                 icon=folium.Icon(icon="car", prefix="fa", color="red")
             ).add_to(m)
+        return m
+    
+    cells = aggregate_incidents(visible, zoom=zoom)
+    if mode == "heatmap":
+        HeatMap(
+            cells[['latitude', 'longitude', 'count']].to_numpy().tolist(),
+            name="Incidents",
+            radius=20
+        ).add_to(m)
+    else:
+        cluster = MarkerCluster(name="Incidents").add_to(m)
+        max_count = cells['count'].max()
+        for cell in cells.to_dict('records'):
+            folium.CircleMarker(
+                location=[cell['latitude'], cell['longitude']],
+                radius=6 + 14 * cell['count'] / max_count,
+                color="firebrick",
+                fill=True,
+                fill_opacity=0.6,
+                popup=(f"<b>Incidents:</b> {cell['count']}<br>"
+                       f"<b>Mean Speed:</b> {cell['mean_speed']:.1f} km/h<br>"
+                       f"<b>Max Excess:</b> {cell['max_excess']:.1f} km/h")
+            ).add_to(cluster)
     
     return m
 
 def create_time_series_chart(df):
-    """Create a time series chart of speeding incidents."""
+    """Create a time series chart of speeding incidents.
+
+    ``df`` is either raw incidents or a daily rollup (timestamp, count).
+    """
     # Ensure the dataframe has a timestamp column
     if 'timestamp' not in df.columns or df.empty:
         return None
     
-    # Group by date and count incidents
-    df_by_date = df.set_index('timestamp').resample('D').size().reset_index(name='count')
+    if 'count' in df.columns:
+        # Already aggregated by day
+        df_by_date = df
+    else:
+        # Group by date and count incidents
+        df_by_date = df.set_index('timestamp').resample('D').size().reset_index(name='count')
     
     # Create chart
     fig = px.line(
@@ -140,10 +298,26 @@ def create_time_series_chart(df):
     return fig
 
 def create_speed_distribution_chart(df):
-    """Create a histogram of speed violations."""
+    """Create a histogram of speed violations.
+
+    ``df`` is either raw incidents or a rollup histogram (speed_difference bin start, count).
+    """
     if df.empty:
         return None
     
+    if 'count' in df.columns:
+        fig = px.bar(
+            df,
+            x='speed_difference',
+            y='count',
+            title='Distribution of Speed Violations',
+            labels={'speed_difference': 'Speed Excess (km/h)', 'count': 'count'},
+            color_discrete_sequence=['firebrick']
+        )
+        # Bars are the rollup bins, drawn edge to edge like the histogram
+        fig.update_traces(offset=0, width=EXCESS_BIN_WIDTH)
+        return fig
+    
     fig = px.histogram(
         df,
         x='speed_difference',
@@ -156,13 +330,21 @@ def create_speed_distribution_chart(df):
     return fig
 
 def create_camera_bar_chart(df):
-    """Create a bar chart showing incidents by camera."""
+    """Create a bar chart showing incidents by camera.
+
+    ``df`` is either raw incidents or per-camera counts (camera_id, count).
+    """
     if df.empty:
         return None
     
-    # Group by camera ID and count incidents
-    camera_counts = df['camera_id'].value_counts().reset_index()
-    camera_counts.columns = ['camera_id', 'count']
+    if 'count' in df.columns:
+        camera_counts = df
+    else:
+        # Group by camera ID and count incidents
+        camera_counts = df['camera_id'].value_counts().reset_index()
+        camera_counts.columns = ['camera_id', 'count']
+    # camera_id may be categorical; drop cameras without incidents
+    camera_counts = camera_counts[camera_counts['count'] > 0]
     
     # Sort by count in descending order
     camera_counts = camera_counts.sort_values('count', ascending=False)
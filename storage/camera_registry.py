@@ -0,0 +1,183 @@
+"""
+In-memory camera registry backed by cameras.csv.
+
+The CSV file is parsed once into a dict keyed by camera_id and only re-read
+when its mtime or size changes, or when a writer calls invalidate().
+"""
+
+import csv
+import os
+import threading
+from dataclasses import dataclass, field
+
+CAMERA_FIELDS = ["camera_id", "latitude", "longitude", "location_name", "speed_limit"]
+# 可选列：RTSP/HTTP 地址、视频文件或命名管道，供 stream_ingest 使用
+STREAM_URL_FIELD = "stream_url"
+
+
+def _to_float(value):
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return None
+
+
+@dataclass(frozen=True)
+class Camera:
+    camera_id: str
+    latitude: float = None
+    longitude: float = None
+    location_name: str = ""
+    speed_limit: float = None
+    extra: dict = field(default_factory=dict)
+
+    @classmethod
+    def from_row(cls, row):
+        extra = {k: v for k, v in row.items() if k not in CAMERA_FIELDS and k is not None}
+        return cls(
+            camera_id=row["camera_id"],
+            latitude=_to_float(row.get("latitude")),
+            longitude=_to_float(row.get("longitude")),
+            location_name=row.get("location_name") or "",
+            speed_limit=_to_float(row.get("speed_limit")),
+            extra=extra,
+        )
+
+    @property
+    def stream_url(self):
+        return (self.extra.get(STREAM_URL_FIELD) or "").strip()
+
+    def to_dict(self):
+        record = {
+            "camera_id": self.camera_id,
+            "latitude": self.latitude,
+            "longitude": self.longitude,
+            "location_name": self.location_name,
+            "speed_limit": self.speed_limit,
+        }
+        record.update(self.extra)
+        return record
+
+
+class CameraRegistry:
+    """Thread-safe, lazily refreshed view of a cameras.csv file."""
+
+    def __init__(self, path):
+        self.path = path
+        self._lock = threading.Lock()
+        self._cameras = {}
+        self._ordered = []
+        self._signature = None
+
+    def _stat_signature(self):
+        st = os.stat(self.path)
+        return st.st_mtime_ns, st.st_size
+
+    def _reload(self, signature):
+        cameras = {}
+        with open(self.path, "r", encoding="utf-8", newline="") as f:
+            for row in csv.DictReader(f):
+                camera_id = row.get("camera_id")
+                # 与原来的线性扫描保持一致：重复 ID 以第一行为准
+                if not camera_id or camera_id in cameras:
+                    continue
+                cameras[camera_id] = Camera.from_row(row)
+        self._cameras = cameras
+        self._ordered = list(cameras.values())
+        self._signature = signature
+
+    def refresh(self):
+        """Reload the file if it changed since the last load.
+
+        Raises:
+            FileNotFoundError: If the backing CSV file does not exist.
+        """
+        signature = self._stat_signature()
+        if signature == self._signature:
+            return
+        with self._lock:
+            if signature != self._signature:
+                self._reload(signature)
+
+    def invalidate(self):
+        """Force the next lookup to re-read the file."""
+        with self._lock:
+            self._signature = None
+
+    def get(self, camera_id):
+        """Return the Camera for camera_id, or None if it is not registered."""
+        self.refresh()
+        return self._cameras.get(camera_id)
+
+    def all(self):
+        """Return all cameras in file order."""
+        self.refresh()
+        return list(self._ordered)
+
+    def records(self):
+        """Return all cameras as plain dicts, suitable for pd.DataFrame."""
+        return [camera.to_dict() for camera in self.all()]
+
+    def __contains__(self, camera_id):
+        self.refresh()
+        return camera_id in self._cameras
+
+    def __len__(self):
+        self.refresh()
+        return len(self._cameras)
+
+
+_registries = {}
+_registries_lock = threading.Lock()
+
+
+def get_registry(path):
+    """Return the process-wide registry for the given cameras.csv path."""
+    key = os.path.realpath(path)
+    with _registries_lock:
+        registry = _registries.get(key)
+        if registry is None:
+            registry = _registries[key] = CameraRegistry(path)
+        return registry
+
+
+def invalidate(path):
+    """Mark the registry for path as stale (used after writing to the file)."""
+    key = os.path.realpath(path)
+    with _registries_lock:
+        registry = _registries.get(key)
+    if registry is not None:
+        registry.invalidate()
+
+
+def update_camera_fields(path, camera_id, values):
+    """
+    Set columns of one camera's row in cameras.csv, adding missing columns at the end.
+
+    Args:
+        values (dict): column -> value.
+
+    Raises:
+        KeyError: If camera_id is not in the file.
+    """
+    with open(path, "r", encoding="utf-8", newline="") as f:
+        reader = csv.DictReader(f)
+        fieldnames = list(reader.fieldnames or CAMERA_FIELDS)
+        rows = list(reader)
+
+    for row in rows:
+        if row.get("camera_id") == camera_id:
+            row.update(values)
+            break
+    else:
+        raise KeyError(camera_id)
+    # 新列追加在末尾，旧的按列位置追加行的写入方式不受影响
+    fieldnames += [column for column in values if column not in fieldnames]
+
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, "w", encoding="utf-8", newline="") as f:
+        writer = csv.DictWriter(f, fieldnames=fieldnames, restval="", extrasaction="ignore")
+        writer.writeheader()
+        writer.writerows(rows)
+    os.replace(tmp_path, path)
+    invalidate(path)
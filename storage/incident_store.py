@@ -0,0 +1,484 @@
+"""
+SQLite-backed store for speeding incidents and cameras.
+
+The database runs in WAL mode so the API server can write while the dashboard
+reads, and every thread gets its own connection. Filters are translated into
+SQL against indexes on (camera_id, timestamp), timestamp and actual_speed, so
+queries cost roughly the size of their result rather than the whole history.
+"""
+
+import argparse
+import csv
+import os
+import sqlite3
+import threading
+from contextlib import contextmanager
+from datetime import datetime
+
+INCIDENT_FIELDS = [
+    "timestamp", "camera_id", "license_plate", "latitude", "longitude",
+    "speed_limit", "actual_speed", "speed_difference", "image_url"
+]
+CAMERA_FIELDS = ["camera_id", "latitude", "longitude", "location_name", "speed_limit"]
+TIMESTAMP_FORMAT = "%Y-%m-%d %H:%M:%S"
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS incidents (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    timestamp TEXT NOT NULL,
+    camera_id TEXT NOT NULL,
+    license_plate TEXT,
+    latitude REAL,
+    longitude REAL,
+    speed_limit REAL,
+    actual_speed REAL,
+    speed_difference REAL,
+    image_url TEXT
+);
+CREATE INDEX IF NOT EXISTS idx_incidents_camera_ts ON incidents (camera_id, timestamp);
+CREATE INDEX IF NOT EXISTS idx_incidents_ts ON incidents (timestamp);
+CREATE INDEX IF NOT EXISTS idx_incidents_speed ON incidents (actual_speed);
+
+CREATE TABLE IF NOT EXISTS cameras (
+    camera_id TEXT PRIMARY KEY,
+    latitude REAL,
+    longitude REAL,
+    location_name TEXT,
+    speed_limit REAL
+);
+
+CREATE TABLE IF NOT EXISTS meta (
+    key TEXT PRIMARY KEY,
+    value TEXT
+);
+
+-- 每个摄像头×小时的汇总，由触发器在写入事件时同步更新
+CREATE TABLE IF NOT EXISTS incident_rollups (
+    camera_id TEXT NOT NULL,
+    hour TEXT NOT NULL,
+    count INTEGER NOT NULL,
+    sum_speed REAL NOT NULL,
+    sum_excess REAL NOT NULL,
+    max_speed REAL,
+    max_excess REAL,
+    PRIMARY KEY (camera_id, hour)
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS idx_rollups_hour ON incident_rollups (hour);
+
+CREATE TABLE IF NOT EXISTS incident_excess_histogram (
+    camera_id TEXT NOT NULL,
+    hour TEXT NOT NULL,
+    bin INTEGER NOT NULL,
+    count INTEGER NOT NULL,
+    PRIMARY KEY (camera_id, hour, bin)
+) WITHOUT ROWID;
+
+CREATE TRIGGER IF NOT EXISTS incidents_rollup_insert AFTER INSERT ON incidents
+BEGIN
+    INSERT INTO incident_rollups (camera_id, hour, count, sum_speed, sum_excess, max_speed, max_excess)
+    VALUES (NEW.camera_id, substr(NEW.timestamp, 1, 13) || ':00:00', 1,
+            COALESCE(NEW.actual_speed, 0), COALESCE(NEW.speed_difference, 0),
+            NEW.actual_speed, NEW.speed_difference)
+    ON CONFLICT (camera_id, hour) DO UPDATE SET
+        count = count + 1,
+        sum_speed = sum_speed + excluded.sum_speed,
+        sum_excess = sum_excess + excluded.sum_excess,
+        max_speed = MAX(COALESCE(max_speed, excluded.max_speed), COALESCE(excluded.max_speed, max_speed)),
+        max_excess = MAX(COALESCE(max_excess, excluded.max_excess), COALESCE(excluded.max_excess, max_excess));
+
+    INSERT INTO incident_excess_histogram (camera_id, hour, bin, count)
+    VALUES (NEW.camera_id, substr(NEW.timestamp, 1, 13) || ':00:00',
+            MAX(0, CAST(COALESCE(NEW.speed_difference, 0) / 5 AS INTEGER)), 1)
+    ON CONFLICT (camera_id, hour, bin) DO UPDATE SET count = count + 1;
+END;
+"""
+
+EXCESS_BIN_WIDTH = 5  # km/h，须与触发器中的除数一致
+ROLLUPS_VERSION = "1"
+
+
+def _to_float(value):
+    if value is None or value == "":
+        return None
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return None
+
+
+def format_timestamp(value):
+    """Normalize a datetime/Timestamp/string to the stored 'YYYY-MM-DD HH:MM:SS' text."""
+    if value is None:
+        return None
+    if isinstance(value, str):
+        value = value.strip()
+        try:
+            return datetime.fromisoformat(value).strftime(TIMESTAMP_FORMAT)
+        except ValueError:
+            return value
+    if hasattr(value, "strftime"):
+        return value.strftime(TIMESTAMP_FORMAT)
+    return str(value)
+
+
+def _incident_values(incident):
+    return (
+        format_timestamp(incident.get("timestamp")) or datetime.now().strftime(TIMESTAMP_FORMAT),
+        str(incident.get("camera_id", "")),
+        incident.get("license_plate"),
+        _to_float(incident.get("latitude")),
+        _to_float(incident.get("longitude")),
+        _to_float(incident.get("speed_limit")),
+        _to_float(incident.get("actual_speed")),
+        _to_float(incident.get("speed_difference")),
+        incident.get("image_url"),
+    )
+
+
+def build_where(camera_id=None, start=None, end=None, min_speed=None, max_speed=None, overspeed=False,
+                after_id=None):
+    """Translate incident filters into a SQL WHERE clause and its parameters.
+
+    Args:
+        camera_id (str): Only incidents from this camera.
+        start, end: Inclusive timestamp bounds (datetime or string).
+        min_speed, max_speed (float): Inclusive bounds on actual_speed.
+        overspeed (bool): Only incidents faster than their own camera's speed limit.
+        after_id (int): Only incidents with a row id greater than this.
+
+    Returns:
+        tuple: (where_sql, params); where_sql is "" when no filter is given.
+    """
+    clauses = []
+    params = []
+    if camera_id:
+        clauses.append("camera_id = ?")
+        params.append(camera_id)
+    if start is not None:
+        clauses.append("timestamp >= ?")
+        params.append(format_timestamp(start))
+    if end is not None:
+        clauses.append("timestamp <= ?")
+        params.append(format_timestamp(end))
+    if min_speed is not None:
+        clauses.append("actual_speed >= ?")
+        params.append(float(min_speed))
+    if max_speed is not None:
+        clauses.append("actual_speed <= ?")
+        params.append(float(max_speed))
+    if overspeed:
+        clauses.append("actual_speed > speed_limit")
+    if after_id:
+        clauses.append("id > ?")
+        params.append(int(after_id))
+    where_sql = (" WHERE " + " AND ".join(clauses)) if clauses else ""
+    return where_sql, params
+
+
+class IncidentStore:
+    """Thread-safe SQLite incident store (one connection per thread)."""
+
+    def __init__(self, db_path, timeout=30.0):
+        self.db_path = db_path
+        self.timeout = timeout
+        self._local = threading.local()
+        directory = os.path.dirname(db_path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        conn = self.connection()
+        conn.executescript(_SCHEMA)
+        if self.get_meta("rollups_version") != ROLLUPS_VERSION:
+            self.rebuild_rollups()
+
+    def connection(self):
+        """Return this thread's connection, opening it on first use."""
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            # isolation_level=None：由我们显式控制事务，写入使用 BEGIN IMMEDIATE
+            conn = sqlite3.connect(self.db_path, timeout=self.timeout, isolation_level=None,
+                                   check_same_thread=False)
+            conn.row_factory = sqlite3.Row
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            conn.execute(f"PRAGMA busy_timeout={int(self.timeout * 1000)}")
+            self._local.conn = conn
+        return conn
+
+    def close(self):
+        conn = getattr(self._local, "conn", None)
+        if conn is not None:
+            conn.close()
+            self._local.conn = None
+
+    # ---- writes -------------------------------------------------------------
+
+    @contextmanager
+    def transaction(self):
+        """Run the block in a write transaction (BEGIN IMMEDIATE ... COMMIT)."""
+        conn = self.connection()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            yield conn
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+        conn.execute("COMMIT")
+
+    @staticmethod
+    def _insert_rows(conn, incidents):
+        sql = (f"INSERT INTO incidents ({', '.join(INCIDENT_FIELDS)}) "
+               f"VALUES ({', '.join('?' * len(INCIDENT_FIELDS))})")
+        return [conn.execute(sql, _incident_values(incident)).lastrowid for incident in incidents]
+
+    def insert_incidents(self, incidents):
+        """Insert a batch of incident dicts in a single write transaction.
+
+        Returns:
+            list: The row ids assigned to the inserted incidents.
+        """
+        with self.transaction() as conn:
+            return self._insert_rows(conn, incidents)
+
+    def insert_incident(self, incident):
+        return self.insert_incidents([incident])[0]
+
+    def upsert_camera(self, camera):
+        conn = self.connection()
+        conn.execute(
+            "INSERT INTO cameras (camera_id, latitude, longitude, location_name, speed_limit) "
+            "VALUES (?, ?, ?, ?, ?) "
+            "ON CONFLICT(camera_id) DO UPDATE SET latitude=excluded.latitude, "
+            "longitude=excluded.longitude, location_name=excluded.location_name, "
+            "speed_limit=excluded.speed_limit",
+            (
+                str(camera["camera_id"]),
+                _to_float(camera.get("latitude")),
+                _to_float(camera.get("longitude")),
+                camera.get("location_name"),
+                _to_float(camera.get("speed_limit")),
+            ),
+        )
+
+    # ---- reads --------------------------------------------------------------
+
+    def select_sql(self, columns=None, order="desc", limit=None, **filters):
+        """Build the SELECT statement for query(); see build_where() for filters."""
+        columns = columns or ["id"] + INCIDENT_FIELDS
+        where_sql, params = build_where(**filters)
+        direction = "ASC" if order == "asc" else "DESC"
+        sql = f"SELECT {', '.join(columns)} FROM incidents{where_sql} ORDER BY timestamp {direction}, id {direction}"
+        if limit is not None:
+            sql += " LIMIT ?"
+            params.append(int(limit))
+        return sql, params
+
+    def query(self, columns=None, order="desc", limit=None, **filters):
+        """Return matching incidents as a list of dicts, newest first by default."""
+        sql, params = self.select_sql(columns=columns, order=order, limit=limit, **filters)
+        return [dict(row) for row in self.connection().execute(sql, params)]
+
+    def iter_by_id(self, columns=None, after_id=0, limit=None, chunk_size=1000, **filters):
+        """Yield matching incidents in id order, starting after after_id (keyset pagination).
+
+        Each chunk is a separate short query (id > last seen id), so a long
+        export never holds a read transaction open or an OFFSET scan.
+        """
+        columns = list(columns or ["id"] + INCIDENT_FIELDS)
+        if "id" not in columns:
+            columns.insert(0, "id")
+        conn = self.connection()
+        remaining = limit
+        last_id = after_id or 0
+        while remaining is None or remaining > 0:
+            size = chunk_size if remaining is None else min(chunk_size, remaining)
+            where_sql, params = build_where(after_id=last_id, **filters)
+            rows = conn.execute(
+                f"SELECT {', '.join(columns)} FROM incidents{where_sql} ORDER BY id LIMIT ?", params + [size]
+            ).fetchall()
+            if not rows:
+                return
+            for row in rows:
+                yield dict(row)
+            last_id = rows[-1]["id"]
+            if remaining is not None:
+                remaining -= len(rows)
+            if len(rows) < size:
+                return
+
+    def count(self, **filters):
+        where_sql, params = build_where(**filters)
+        return self.connection().execute(f"SELECT COUNT(*) FROM incidents{where_sql}", params).fetchone()[0]
+
+    def bounds(self):
+        """Return min/max timestamp and actual_speed plus the row count, in one indexed query."""
+        row = self.connection().execute(
+            "SELECT MIN(timestamp) AS min_timestamp, MAX(timestamp) AS max_timestamp, "
+            "MIN(actual_speed) AS min_speed, MAX(actual_speed) AS max_speed, COUNT(*) AS count "
+            "FROM incidents"
+        ).fetchone()
+        return dict(row)
+
+    def camera_ids(self):
+        """Distinct camera ids that have incidents (served from the camera/timestamp index)."""
+        rows = self.connection().execute("SELECT DISTINCT camera_id FROM incidents ORDER BY camera_id")
+        return [row[0] for row in rows]
+
+    def cameras(self):
+        rows = self.connection().execute(f"SELECT {', '.join(CAMERA_FIELDS)} FROM cameras ORDER BY camera_id")
+        return [dict(row) for row in rows]
+
+    # ---- rollups -------------------------------------------------------------
+
+    def rebuild_rollups(self):
+        """Recompute the rollup tables from scratch (used for databases created before them)."""
+        with self.transaction() as conn:
+            conn.execute("DELETE FROM incident_rollups")
+            conn.execute("DELETE FROM incident_excess_histogram")
+            conn.execute(
+                "INSERT INTO incident_rollups (camera_id, hour, count, sum_speed, sum_excess, max_speed, max_excess) "
+                "SELECT camera_id, substr(timestamp, 1, 13) || ':00:00', COUNT(*), "
+                "TOTAL(actual_speed), TOTAL(speed_difference), MAX(actual_speed), MAX(speed_difference) "
+                "FROM incidents GROUP BY 1, 2"
+            )
+            conn.execute(
+                "INSERT INTO incident_excess_histogram (camera_id, hour, bin, count) "
+                f"SELECT camera_id, substr(timestamp, 1, 13) || ':00:00', "
+                f"MAX(0, CAST(COALESCE(speed_difference, 0) / {EXCESS_BIN_WIDTH} AS INTEGER)), COUNT(*) "
+                "FROM incidents GROUP BY 1, 2, 3"
+            )
+            self.set_meta("rollups_version", ROLLUPS_VERSION)
+
+    @staticmethod
+    def _rollup_where(camera_id=None, start=None, end=None):
+        # 小时桶 [hour, hour+1h) 与 [start, end] 相交即计入，粒度为一小时
+        clauses, params = [], []
+        if camera_id:
+            clauses.append("camera_id = ?")
+            params.append(camera_id)
+        if start is not None:
+            clauses.append("hour >= ?")
+            params.append(format_timestamp(start)[:13] + ":00:00")
+        if end is not None:
+            end = format_timestamp(end)
+            end_hour = end[:13] + ":00:00"
+            # end 恰好落在整点时不计入从该整点开始的桶
+            clauses.append("hour < ?" if end == end_hour else "hour <= ?")
+            params.append(end_hour)
+        return (" WHERE " + " AND ".join(clauses)) if clauses else "", params
+
+    def rollup_series(self, freq="day", camera_id=None, start=None, end=None):
+        """Incident counts per day or hour, read from the rollup table.
+
+        Returns:
+            list: dicts with bucket (timestamp text) and count, oldest first.
+        """
+        bucket = "substr(hour, 1, 10) || ' 00:00:00'" if freq == "day" else "hour"
+        where_sql, params = self._rollup_where(camera_id, start, end)
+        rows = self.connection().execute(
+            f"SELECT {bucket} AS bucket, SUM(count) AS count FROM incident_rollups{where_sql} "
+            "GROUP BY bucket ORDER BY bucket", params
+        )
+        return [dict(row) for row in rows]
+
+    def rollup_by_camera(self, camera_id=None, start=None, end=None):
+        """Incident count per camera, busiest first."""
+        where_sql, params = self._rollup_where(camera_id, start, end)
+        rows = self.connection().execute(
+            f"SELECT camera_id, SUM(count) AS count FROM incident_rollups{where_sql} "
+            "GROUP BY camera_id ORDER BY count DESC", params
+        )
+        return [dict(row) for row in rows]
+
+    def rollup_histogram(self, camera_id=None, start=None, end=None):
+        """Speed-excess histogram: dicts with bin_start (km/h) and count."""
+        where_sql, params = self._rollup_where(camera_id, start, end)
+        rows = self.connection().execute(
+            f"SELECT bin * {EXCESS_BIN_WIDTH} AS bin_start, SUM(count) AS count "
+            f"FROM incident_excess_histogram{where_sql} GROUP BY bin ORDER BY bin", params
+        )
+        return [dict(row) for row in rows]
+
+    def rollup_summary(self, camera_id=None, start=None, end=None):
+        """Count, mean and max speed excess over the selected buckets."""
+        where_sql, params = self._rollup_where(camera_id, start, end)
+        row = self.connection().execute(
+            "SELECT TOTAL(count) AS count, TOTAL(sum_excess) AS sum_excess, MAX(max_excess) AS max_excess "
+            f"FROM incident_rollups{where_sql}", params
+        ).fetchone()
+        count = int(row["count"])
+        return {
+            "count": count,
+            "mean_excess": row["sum_excess"] / count if count else None,
+            "max_excess": row["max_excess"],
+        }
+
+    # ---- one-time CSV import ------------------------------------------------
+
+    def get_meta(self, key, default=None):
+        row = self.connection().execute("SELECT value FROM meta WHERE key = ?", (key,)).fetchone()
+        return row[0] if row else default
+
+    def set_meta(self, key, value):
+        self.connection().execute(
+            "INSERT INTO meta (key, value) VALUES (?, ?) ON CONFLICT(key) DO UPDATE SET value=excluded.value",
+            (key, str(value)),
+        )
+
+    def import_csv(self, incidents_csv=None, cameras_csv=None, force=False):
+        """Import legacy CSV files once; later calls are no-ops unless force=True.
+
+        The "already imported" marker is checked and written inside the same
+        write transaction as the rows, so concurrent first opens import once.
+
+        Returns:
+            int: Number of incidents imported by this call.
+        """
+        imported = 0
+        if cameras_csv and os.path.isfile(cameras_csv):
+            key = "imported:" + os.path.realpath(cameras_csv)
+            with self.transaction():
+                if force or self.get_meta(key) is None:
+                    with open(cameras_csv, "r", encoding="utf-8", newline="") as f:
+                        for row in csv.DictReader(f):
+                            if row.get("camera_id"):
+                                self.upsert_camera(row)
+                    self.set_meta(key, datetime.now().strftime(TIMESTAMP_FORMAT))
+
+        if incidents_csv and os.path.isfile(incidents_csv):
+            key = "imported:" + os.path.realpath(incidents_csv)
+            with self.transaction() as conn:
+                if force or self.get_meta(key) is None:
+                    with open(incidents_csv, "r", encoding="utf-8", newline="") as f:
+                        rows = [row for row in csv.DictReader(f) if row.get("timestamp") and row.get("camera_id")]
+                    imported = len(self._insert_rows(conn, rows))
+                    self.set_meta(key, datetime.now().strftime(TIMESTAMP_FORMAT))
+        return imported
+
+
+_stores = {}
+_stores_lock = threading.Lock()
+
+
+def open_store(db_path, incidents_csv=None, cameras_csv=None):
+    """Return the process-wide store for db_path, importing legacy CSVs on first open."""
+    key = os.path.realpath(db_path)
+    with _stores_lock:
+        store = _stores.get(key)
+        if store is None:
+            store = IncidentStore(db_path)
+            store.import_csv(incidents_csv, cameras_csv)
+            _stores[key] = store
+        return store
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Import legacy incidents/cameras CSV files into SQLite.")
+    parser.add_argument("db_path")
+    parser.add_argument("--incidents", help="incidents.csv to import")
+    parser.add_argument("--cameras", help="cameras.csv to import")
+    parser.add_argument("--force", action="store_true", help="import again even if already imported")
+    args = parser.parse_args()
+
+    store = IncidentStore(args.db_path)
+    count = store.import_csv(args.incidents, args.cameras, force=args.force)
+    print(f"Imported {count} incidents into {args.db_path}")
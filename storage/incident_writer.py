@@ -0,0 +1,165 @@
+"""
+Background group-commit writer for the incident store.
+
+Producers hand incident dicts to submit() and return immediately. A single
+writer thread drains the queue, commits up to max_batch incidents per SQLite
+transaction (fsync'd on commit) at most max_latency seconds after the first
+one arrived, and then passes every committed batch to the subscribers.
+"""
+
+import atexit
+import logging
+import queue
+import threading
+import time
+from concurrent.futures import Future
+
+import metrics
+
+logger = logging.getLogger(__name__)
+
+_STOP = object()
+
+
+class _FlushMarker:
+    def __init__(self):
+        self.done = threading.Event()
+
+
+class IncidentWriter:
+    def __init__(self, store, max_batch=256, max_latency=0.05):
+        self.store = store
+        self.max_batch = max_batch
+        self.max_latency = max_latency
+        self._queue = queue.Queue()  # 无界队列：生产者永远不会因磁盘阻塞
+        self._subscribers = []
+        self._subscribers_lock = threading.Lock()
+        self._closed = False
+        self._thread = threading.Thread(target=self._run, name="incident-writer", daemon=True)
+        self._thread.start()
+        atexit.register(self.close)
+
+    # ---- producer side ------------------------------------------------------
+
+    def submit(self, incident):
+        """Queue one incident; the returned Future resolves to its row id once committed."""
+        if self._closed:
+            raise RuntimeError("IncidentWriter is closed")
+        future = Future()
+        self._queue.put((dict(incident), future))
+        return future
+
+    def submit_many(self, incidents):
+        return [self.submit(incident) for incident in incidents]
+
+    def subscribe(self, callback):
+        """Call callback(batch) after each commit; batch is a list of incident dicts with "id"."""
+        with self._subscribers_lock:
+            self._subscribers.append(callback)
+
+    def unsubscribe(self, callback):
+        with self._subscribers_lock:
+            if callback in self._subscribers:
+                self._subscribers.remove(callback)
+
+    def flush(self, timeout=None):
+        """Block until everything submitted before this call has been committed."""
+        if not self._thread.is_alive():
+            return True
+        marker = _FlushMarker()
+        self._queue.put(marker)
+        return marker.done.wait(timeout)
+
+    def pending(self):
+        return self._queue.qsize()
+
+    def close(self, timeout=10.0):
+        """Commit pending incidents and stop the writer thread."""
+        if self._closed:
+            return
+        self._closed = True
+        self._queue.put(_STOP)
+        self._thread.join(timeout)
+
+    # ---- writer thread ------------------------------------------------------
+
+    def _run(self):
+        # 写线程独占自己的连接：每个批次提交时 fsync WAL
+        self.store.connection().execute("PRAGMA synchronous=FULL")
+        stopping = False
+        while not stopping:
+            item = self._queue.get()
+            batch, markers = [], []
+            deadline = time.monotonic() + self.max_latency
+            while True:
+                if item is _STOP:
+                    stopping = True
+                elif isinstance(item, _FlushMarker):
+                    markers.append(item)
+                else:
+                    batch.append(item)
+                if stopping or len(batch) >= self.max_batch:
+                    break
+                remaining = deadline - time.monotonic()
+                try:
+                    item = self._queue.get(timeout=remaining) if remaining > 0 else self._queue.get_nowait()
+                except queue.Empty:
+                    break
+
+            if batch:
+                self._commit(batch)
+            for marker in markers:
+                marker.done.set()
+
+        # 关闭后仍可能有 put 进来的记录，尽量一并写完
+        leftovers = []
+        while True:
+            try:
+                item = self._queue.get_nowait()
+            except queue.Empty:
+                break
+            if isinstance(item, _FlushMarker):
+                item.done.set()
+            elif item is not _STOP:
+                leftovers.append(item)
+        if leftovers:
+            self._commit(leftovers)
+        self.store.close()
+
+    def _commit(self, batch):
+        incidents = [incident for incident, _ in batch]
+        try:
+            with metrics.stage("incident_write"):
+                ids = self.store.insert_incidents(incidents)
+        except Exception as e:
+            logger.exception("Incident writer failed to commit %d incidents", len(batch))
+            for _, future in batch:
+                future.set_exception(e)
+            return
+
+        committed = []
+        for (incident, future), row_id in zip(batch, ids):
+            incident["id"] = row_id
+            committed.append(incident)
+            future.set_result(row_id)
+
+        with self._subscribers_lock:
+            subscribers = list(self._subscribers)
+        for callback in subscribers:
+            try:
+                callback(committed)
+            except Exception:
+                logger.exception("Incident subscriber %r failed", callback)
+
+
+_writers = {}
+_writers_lock = threading.Lock()
+
+
+def get_writer(store, **kwargs):
+    """Return the process-wide writer for store, starting it on first use."""
+    with _writers_lock:
+        writer = _writers.get(id(store))
+        if writer is None or writer._closed:
+            writer = _writers[id(store)] = IncidentWriter(store, **kwargs)
+        return writer
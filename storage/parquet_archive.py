@@ -0,0 +1,195 @@
+"""
+Columnar incident archive partitioned by date and camera.
+
+compact() copies incidents that are not archived yet from the SQLite store into
+    <archive_dir>/date=YYYY-MM-DD/camera_id=<id>/data.parquet
+and records the highest archived row id in <archive_dir>/_manifest.json.
+load() only opens the partitions inside the requested date range and camera and
+only reads the requested columns; rows newer than the manifest are still in the
+store and are fetched from there by the caller (see data_handler.query_incidents).
+
+Requires pyarrow.
+"""
+
+import argparse
+import json
+import os
+from datetime import date, datetime
+from urllib.parse import quote
+
+import pandas as pd
+
+from .incident_store import INCIDENT_FIELDS, IncidentStore
+
+MANIFEST_NAME = "_manifest.json"
+PARTITION_FILE = "data.parquet"
+
+
+def _require_pyarrow():
+    try:
+        import pyarrow  # noqa: F401
+    except ImportError as e:
+        raise ImportError("The Parquet incident archive requires pyarrow (pip install pyarrow)") from e
+
+
+def read_manifest(archive_dir):
+    path = os.path.join(archive_dir, MANIFEST_NAME)
+    if not os.path.isfile(path):
+        return {"last_id": 0}
+    with open(path, "r", encoding="utf-8") as f:
+        return json.load(f)
+
+
+def _write_manifest(archive_dir, manifest):
+    path = os.path.join(archive_dir, MANIFEST_NAME)
+    tmp_path = path + ".tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(manifest, f)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp_path, path)
+
+
+def partition_dir(archive_dir, day, camera_id):
+    return os.path.join(archive_dir, f"date={day.isoformat()}", f"camera_id={quote(str(camera_id), safe='')}")
+
+
+def _merge_partition(path, new_rows):
+    """Append new_rows to the partition file, rewriting it atomically."""
+    os.makedirs(path, exist_ok=True)
+    file_path = os.path.join(path, PARTITION_FILE)
+    if os.path.isfile(file_path):
+        existing = pd.read_parquet(file_path)
+        new_rows = pd.concat([existing, new_rows], ignore_index=True)
+    # 若上次压缩在写 manifest 前中断，重复的行按 id 去重
+    new_rows = new_rows.drop_duplicates(subset="id", keep="last").sort_values("timestamp")
+    tmp_path = file_path + ".tmp"
+    new_rows.to_parquet(tmp_path, index=False)
+    os.replace(tmp_path, file_path)
+
+
+def compact(store, archive_dir, chunk_size=100000):
+    """Move incidents with id above the manifest's last_id into the archive.
+
+    Args:
+        store (IncidentStore): Source of the incidents.
+        archive_dir (str): Root directory of the archive.
+        chunk_size (int): Number of rows read from SQLite per pass.
+
+    Returns:
+        int: Number of incidents archived by this call.
+    """
+    _require_pyarrow()
+    os.makedirs(archive_dir, exist_ok=True)
+    manifest = read_manifest(archive_dir)
+    last_id = int(manifest.get("last_id", 0))
+    columns = ["id"] + INCIDENT_FIELDS
+    archived = 0
+
+    while True:
+        chunk = pd.read_sql_query(
+            f"SELECT {', '.join(columns)} FROM incidents WHERE id > ? ORDER BY id LIMIT ?",
+            store.connection(), params=[last_id, chunk_size], parse_dates=["timestamp"],
+        )
+        if chunk.empty:
+            break
+
+        for (day, camera_id), rows in chunk.groupby([chunk["timestamp"].dt.date, "camera_id"]):
+            _merge_partition(partition_dir(archive_dir, day, camera_id), rows)
+
+        last_id = int(chunk["id"].max())
+        archived += len(chunk)
+        manifest["last_id"] = last_id
+        manifest["updated"] = datetime.now().isoformat(timespec="seconds")
+        _write_manifest(archive_dir, manifest)
+
+        if len(chunk) < chunk_size:
+            break
+
+    return archived
+
+
+def _as_date(value):
+    if value is None:
+        return None
+    if isinstance(value, datetime):
+        return value.date()
+    if isinstance(value, date):
+        return value
+    return pd.Timestamp(value).date()
+
+
+def partition_files(archive_dir, start=None, end=None, camera_id=None):
+    """List the partition files that can contain incidents in [start, end] for camera_id."""
+    if not os.path.isdir(archive_dir):
+        return []
+    start_day, end_day = _as_date(start), _as_date(end)
+    files = []
+    for date_entry in sorted(os.listdir(archive_dir)):
+        if not date_entry.startswith("date="):
+            continue
+        day = date.fromisoformat(date_entry[len("date="):])
+        if (start_day and day < start_day) or (end_day and day > end_day):
+            continue
+        date_path = os.path.join(archive_dir, date_entry)
+        camera_entries = (
+            [f"camera_id={quote(str(camera_id), safe='')}"] if camera_id else sorted(os.listdir(date_path))
+        )
+        for camera_entry in camera_entries:
+            file_path = os.path.join(date_path, camera_entry, PARTITION_FILE)
+            if os.path.isfile(file_path):
+                files.append(file_path)
+    return files
+
+
+def load(archive_dir, columns=None, camera_id=None, start=None, end=None, min_speed=None, max_speed=None):
+    """Load archived incidents, reading only the needed partitions and columns.
+
+    Args:
+        archive_dir (str): Root directory of the archive.
+        columns (list): Columns to return (default: all).
+        camera_id, start, end, min_speed, max_speed: Same filters as
+            IncidentStore.query(); start/end are inclusive timestamps.
+
+    Returns:
+        pandas.DataFrame: Matching incidents, in no particular order.
+    """
+    _require_pyarrow()
+    columns = list(columns or ["id"] + INCIDENT_FIELDS)
+    # 过滤用到但调用方未请求的列只在读取时加入，返回前删掉
+    read_columns = list(columns)
+    if (start is not None or end is not None) and "timestamp" not in read_columns:
+        read_columns.append("timestamp")
+    if (min_speed is not None or max_speed is not None) and "actual_speed" not in read_columns:
+        read_columns.append("actual_speed")
+
+    files = partition_files(archive_dir, start=start, end=end, camera_id=camera_id)
+    if not files:
+        return pd.DataFrame(columns=columns)
+
+    df = pd.concat([pd.read_parquet(path, columns=read_columns) for path in files], ignore_index=True)
+
+    mask = pd.Series(True, index=df.index)
+    if start is not None:
+        mask &= df["timestamp"] >= pd.Timestamp(start)
+    if end is not None:
+        mask &= df["timestamp"] <= pd.Timestamp(end)
+    if min_speed is not None:
+        mask &= df["actual_speed"] >= min_speed
+    if max_speed is not None:
+        mask &= df["actual_speed"] <= max_speed
+    if not mask.all():
+        df = df[mask]
+
+    return df[columns].reset_index(drop=True)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Compact the SQLite incident store into the Parquet archive.")
+    parser.add_argument("db_path")
+    parser.add_argument("archive_dir")
+    parser.add_argument("--chunk-size", type=int, default=100000)
+    args = parser.parse_args()
+
+    count = compact(IncidentStore(args.db_path), args.archive_dir, chunk_size=args.chunk_size)
+    print(f"Archived {count} incidents into {args.archive_dir}")
@@ -0,0 +1,119 @@
+import random
+from datetime import datetime, timedelta
+
+import pytest
+
+from storage.incident_store import IncidentStore
+
+CAMERAS = {"CAM001": 50.0, "CAM002": 60.0, "CAM003": 80.0}
+
+
+def _incidents(count=500, seed=7):
+    rng = random.Random(seed)
+    start = datetime(2025, 3, 1)
+    incidents = []
+    for _ in range(count):
+        camera_id = rng.choice(list(CAMERAS))
+        speed = round(rng.uniform(30, 120), 1)
+        incidents.append({
+            "timestamp": start + timedelta(minutes=rng.randrange(7 * 24 * 60)),
+            "camera_id": camera_id,
+            "license_plate": f"AB{rng.randrange(1000):03d}",
+            "speed_limit": CAMERAS[camera_id],
+            "actual_speed": speed,
+            "speed_difference": round(speed - CAMERAS[camera_id], 1),
+        })
+    return incidents
+
+
+@pytest.fixture
+def store(tmp_path):
+    store = IncidentStore(str(tmp_path / "incidents.db"))
+    store.insert_incidents(_incidents())
+    yield store
+    store.close()
+
+
+@pytest.mark.parametrize("chunk_size", [1, 7, 100, 1000])
+def test_iter_by_id_pages_through_every_row_once(store, chunk_size):
+    rows = list(store.iter_by_id(chunk_size=chunk_size))
+    assert [row["id"] for row in rows] == list(range(1, 501))
+
+
+def test_iter_by_id_resumes_after_cursor_with_filters(store):
+    filters = {"camera_id": "CAM002", "min_speed": 70}
+    expected = sorted(row["id"] for row in store.query(**filters))
+    first = list(store.iter_by_id(limit=10, chunk_size=3, **filters))
+    rest = list(store.iter_by_id(after_id=first[-1]["id"], chunk_size=4, **filters))
+    assert [row["id"] for row in first + rest] == expected
+    assert all(row["camera_id"] == "CAM002" and row["actual_speed"] >= 70 for row in first + rest)
+
+
+def test_iter_by_id_adds_id_column(store):
+    row = next(store.iter_by_id(columns=["camera_id"]))
+    assert set(row) == {"id", "camera_id"}
+
+
+def test_overspeed_uses_each_rows_own_limit(store):
+    rows = store.query(overspeed=True)
+    assert rows and all(row["actual_speed"] > row["speed_limit"] for row in rows)
+    expected = sum(1 for incident in _incidents() if incident["actual_speed"] > incident["speed_limit"])
+    assert store.count(overspeed=True) == len(rows) == expected
+
+
+def _expected(incidents, camera_id=None, start=None, end=None):
+    return [
+        incident for incident in incidents
+        if (camera_id is None or incident["camera_id"] == camera_id)
+        and (start is None or incident["timestamp"] >= start) and (end is None or incident["timestamp"] < end)
+    ]
+
+
+@pytest.mark.parametrize("window", [
+    {},
+    {"camera_id": "CAM003"},
+    {"start": datetime(2025, 3, 2, 6), "end": datetime(2025, 3, 4, 18)},  # 整点边界：end 所在的桶不计入
+    {"camera_id": "CAM001", "start": datetime(2025, 3, 5)},
+])
+def test_rollups_match_incidents(store, window):
+    incidents = _expected(_incidents(), **window)
+
+    daily = {}
+    for incident in incidents:
+        day = incident["timestamp"].strftime("%Y-%m-%d 00:00:00")
+        daily[day] = daily.get(day, 0) + 1
+    assert {row["bucket"]: row["count"] for row in store.rollup_series(freq="day", **window)} == daily
+    assert sum(row["count"] for row in store.rollup_series(freq="hour", **window)) == len(incidents)
+
+    per_camera = {}
+    for incident in incidents:
+        per_camera[incident["camera_id"]] = per_camera.get(incident["camera_id"], 0) + 1
+    rows = store.rollup_by_camera(**window)
+    assert {row["camera_id"]: row["count"] for row in rows} == per_camera
+    assert [row["count"] for row in rows] == sorted(per_camera.values(), reverse=True)
+
+    bins = {}
+    for incident in incidents:
+        start = max(0, int(incident["speed_difference"] / 5)) * 5
+        bins[start] = bins.get(start, 0) + 1
+    assert {row["bin_start"]: row["count"] for row in store.rollup_histogram(**window)} == bins
+
+    summary = store.rollup_summary(**window)
+    excess = [incident["speed_difference"] for incident in incidents]
+    assert summary["count"] == len(incidents)
+    assert summary["mean_excess"] == pytest.approx(sum(excess) / len(excess))
+    assert summary["max_excess"] == max(excess)
+
+
+def test_rebuild_matches_trigger_maintained_rollups(store):
+    store.insert_incident({"timestamp": "2025-03-03 10:15:00", "camera_id": "CAM002"})  # 没有速度的旧记录
+    conn = store.connection()
+    histogram_sql = "SELECT * FROM incident_excess_histogram ORDER BY camera_id, hour, bin"
+    rollups_sql = "SELECT * FROM incident_rollups ORDER BY camera_id, hour"
+    histogram, rollups = conn.execute(histogram_sql).fetchall(), conn.execute(rollups_sql).fetchall()
+    store.rebuild_rollups()
+    assert [tuple(row) for row in conn.execute(histogram_sql)] == [tuple(row) for row in histogram]
+    rebuilt = conn.execute(rollups_sql).fetchall()
+    assert [row[:3] for row in rebuilt] == [row[:3] for row in rollups]
+    # 求和顺序不同，浮点列只做近似比较
+    assert [row[3:] for row in rebuilt] == [pytest.approx(tuple(row[3:])) for row in rollups]
@@ -0,0 +1,52 @@
+import logging
+
+import pytest
+
+from storage.incident_store import IncidentStore
+from storage.incident_writer import IncidentWriter
+
+
+class _BrokenStore(IncidentStore):
+    def insert_incidents(self, incidents):
+        raise OSError("disk full")
+
+
+def _incident(speed):
+    return {"timestamp": "2026-10-01 08:00:00", "camera_id": "CAM001", "speed_limit": 60,
+            "actual_speed": speed, "speed_difference": speed - 60}
+
+
+def test_commits_and_notifies_subscribers(tmp_path):
+    writer = IncidentWriter(IncidentStore(str(tmp_path / "incidents.db")))
+    seen = []
+    writer.subscribe(seen.extend)
+    futures = writer.submit_many([_incident(70), _incident(80)])
+    ids = [future.result(5) for future in futures]
+    writer.flush(5)
+    writer.close()
+    assert ids == sorted(ids) and [row["id"] for row in seen] == ids
+
+
+def test_commit_failure_is_logged_and_raised_to_submitters(tmp_path, caplog):
+    writer = IncidentWriter(_BrokenStore(str(tmp_path / "incidents.db")))
+    with caplog.at_level(logging.ERROR, logger="storage.incident_writer"):
+        future = writer.submit(_incident(70))
+        with pytest.raises(OSError):
+            future.result(5)
+        writer.close()
+    record, = [r for r in caplog.records if "failed to commit" in r.getMessage()]
+    assert record.exc_info is not None
+
+
+def test_subscriber_failure_is_logged(tmp_path, caplog):
+    writer = IncidentWriter(IncidentStore(str(tmp_path / "incidents.db")))
+
+    def broken(rows):
+        raise ValueError("boom")
+
+    writer.subscribe(broken)
+    with caplog.at_level(logging.ERROR, logger="storage.incident_writer"):
+        writer.submit(_incident(70)).result(5)
+        writer.flush(5)
+        writer.close()
+    assert any("subscriber" in r.getMessage() and r.exc_info for r in caplog.records)
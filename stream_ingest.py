@@ -0,0 +1,337 @@
+"""
+Continuous ingest of live camera streams.
+
+Every camera in cameras.csv with a stream_url (RTSP/HTTP URL, video file or
+named pipe) gets one long-running CameraWorker. A worker decodes on a reader
+thread into a small backlog; when inference falls behind, the oldest frames are
+dropped rather than queued, so latency stays bounded. The processing thread runs
+the frames through a TrackingJob (shared detector, per-camera tracker) and
+writes an incident as soon as an overspeeding track leaves the picture.
+
+StreamSupervisor starts, restarts and stops workers as cameras.csv changes.
+
+Run locally with a looping MP4 or a FIFO standing in for RTSP:
+    python stream_ingest.py --source CAM001=traffic.mp4
+    mkfifo /tmp/cam2 && ffmpeg -re -i traffic.mp4 -f mpegts /tmp/cam2 &
+    python stream_ingest.py --source CAM002=/tmp/cam2
+"""
+
+import argparse
+import logging
+import os
+import stat
+import threading
+import time
+import uuid
+from collections import deque
+
+import cv2
+
+import cpu_resources
+import metrics
+from pipeline import TrackingJob
+from yolo_tracker import DetectionSettings
+
+
+def is_regular_file(url):
+    try:
+        return stat.S_ISREG(os.stat(url).st_mode)
+    except OSError:
+        return False
+
+
+class CameraWorker:
+    def __init__(self, camera_id, url, detector, incident_writer=None, artifact_writer=None,
+                 speed_limit=60.0, latitude="", longitude="", loop=True, max_backlog=2,
+                 track_timeout=2.0, reconnect_delay=2.0, settings=None):
+        """
+        Args:
+            url (str): Stream URL, video file or named pipe.
+            settings (DetectionSettings): Camera's tuned detection knobs; batch_size is
+                ignored here, a live stream is detected frame by frame.
+            loop (bool): Restart regular files at EOF (for local testing).
+            max_backlog (int): Decoded frames kept while inference is busy; older ones are dropped.
+            track_timeout (float): Seconds a track may be missing before its incident is written.
+        """
+        self.camera_id = camera_id
+        self.url = url
+        self.detector = detector
+        self.incident_writer = incident_writer
+        self.artifact_writer = artifact_writer
+        self.speed_limit = speed_limit
+        self.latitude = latitude
+        self.longitude = longitude
+        self.loop = loop
+        self.track_timeout = track_timeout
+        self.reconnect_delay = reconnect_delay
+        self.settings = settings
+
+        # 每帧带上所属的源序号（每次重新打开源加一），换源信息不会随旧帧一起被挤掉
+        self._frames = deque(maxlen=max_backlog)
+        self._cond = threading.Condition()
+        self._stop = threading.Event()
+        self._fps = 30
+        self.finished = False  # 源正常结束（--no-loop 的文件播完），不应重启
+        self.stats = {"decoded": 0, "processed": 0, "dropped": 0, "incidents": 0, "restarts": 0}
+        self._reader = threading.Thread(target=self._read_loop, name=f"ingest-read-{camera_id}", daemon=True)
+        self._worker = threading.Thread(target=self._process_loop, name=f"ingest-{camera_id}", daemon=True)
+
+    def start(self):
+        self._reader.start()
+        self._worker.start()
+        return self
+
+    def stop(self, timeout=5.0):
+        self._stop.set()
+        with self._cond:
+            self._cond.notify_all()
+        self._reader.join(timeout)
+        self._worker.join(timeout)
+
+    def is_alive(self):
+        return self._reader.is_alive() and self._worker.is_alive()
+
+    # ---- reader thread ------------------------------------------------------
+
+    def _push(self, item):
+        with self._cond:
+            if len(self._frames) == self._frames.maxlen:
+                self.stats["dropped"] += 1  # deque 满时 append 会挤掉最旧的一帧
+                metrics.FRAMES_DROPPED.inc(camera_id=self.camera_id)
+            self._frames.append(item)
+            self._cond.notify()
+
+    def _read_loop(self):
+        cpu_resources.pin("decode")
+        source = 0
+        while not self._stop.is_set():
+            realtime = is_regular_file(self.url)
+            cap = cv2.VideoCapture(self.url)
+            if not cap.isOpened():
+                print(f"[WARN] Camera {self.camera_id}: cannot open {self.url}, retrying")
+                self._stop.wait(self.reconnect_delay)
+                continue
+
+            self._fps = cap.get(cv2.CAP_PROP_FPS) or 30
+            source += 1
+            frame_no = 0
+            started = time.monotonic()
+            while not self._stop.is_set():
+                ret, frame = cap.read()
+                if not ret:
+                    break
+                frame_no += 1
+                self.stats["decoded"] += 1
+                self._push((source, frame_no, frame))
+                if realtime:
+                    # 文件按原始帧率播放，模拟实时摄像头
+                    delay = started + frame_no / self._fps - time.monotonic()
+                    if delay > 0:
+                        self._stop.wait(delay)
+            cap.release()
+
+            if self._stop.is_set():
+                break
+            if realtime and not self.loop:
+                self.finished = True
+                break
+            self.stats["restarts"] += 1
+            if not realtime:
+                print(f"[WARN] Camera {self.camera_id}: stream ended, reconnecting")
+                self._stop.wait(self.reconnect_delay)
+
+        with self._cond:
+            self._cond.notify_all()
+
+    # ---- processing thread --------------------------------------------------
+
+    def _new_job(self):
+        return TrackingJob(
+            self.detector, self.camera_id, self.speed_limit, self.latitude, self.longitude,
+            fps=self._fps, job_id=uuid.uuid4().hex, artifact_writer=self.artifact_writer,
+            settings=self.settings
+        )
+
+    def _emit(self, incidents):
+        if incidents and self.incident_writer is not None:
+            self.incident_writer.submit_many(incidents)
+        self.stats["incidents"] += len(incidents)
+
+    def _next(self):
+        with self._cond:
+            while not self._frames:
+                if self._stop.is_set() or not self._reader.is_alive():
+                    return None
+                self._cond.wait(0.5)
+            return self._frames.popleft()
+
+    def _process_loop(self):
+        cpu_resources.pin("pipeline")
+        metrics.ACTIVE_JOBS.inc(kind="stream")
+        try:
+            self._track_frames()
+        finally:
+            metrics.ACTIVE_JOBS.dec(kind="stream")
+
+    def _track_frames(self):
+        job, current = self._new_job(), None
+        while True:
+            item = self._next()
+            if item is None:
+                break
+            source, frame_no, frame = item
+            if source != current:
+                # 源重新开始（循环播放或重连）：结束当前轨迹，换新的跟踪器
+                if current is not None:
+                    self._emit(job.collect_finished())
+                    job = self._new_job()
+                current, last_collect = source, 0
+            if job.wants_frame(frame_no):
+                job.fps = self._fps
+                job.process_frame(frame, frame_id=frame_no)
+                self.stats["processed"] += 1
+            # 大约每秒收集一次；帧会被丢弃或按步长跳过，不能依赖某个帧号恰好出现
+            if frame_no - last_collect >= self._fps:
+                last_collect = frame_no
+                self._emit(job.collect_finished(max_idle_frames=int(self.track_timeout * self._fps)))
+
+        self._emit(job.collect_finished())
+
+
+class StreamSupervisor:
+    """One CameraWorker per camera that has a stream URL, kept in sync with the registry."""
+
+    def __init__(self, registry, detector, incident_writer=None, artifact_writer=None,
+                 default_speed_limit=60.0, overrides=None, poll_interval=5.0, **worker_options):
+        """
+        Args:
+            registry (CameraRegistry): Source of cameras and their stream_url.
+            overrides (dict): camera_id -> url, taking precedence over cameras.csv.
+            worker_options: Passed on to every CameraWorker.
+        """
+        self.registry = registry
+        self.detector = detector
+        self.incident_writer = incident_writer
+        self.artifact_writer = artifact_writer
+        self.default_speed_limit = default_speed_limit
+        self.overrides = dict(overrides or {})
+        self.poll_interval = poll_interval
+        self.worker_options = worker_options
+        self.workers = {}
+        self._stop = threading.Event()
+        self._thread = None
+
+    def _desired(self):
+        desired = {}
+        for camera in self.registry.all():
+            url = self.overrides.get(camera.camera_id) or camera.stream_url
+            if url:
+                desired[camera.camera_id] = (camera, url)
+        for camera_id, url in self.overrides.items():
+            desired.setdefault(camera_id, (None, url))
+        return desired
+
+    def _start_worker(self, camera_id, camera, url):
+        speed_limit = camera.speed_limit if camera and camera.speed_limit is not None else self.default_speed_limit
+        worker = CameraWorker(
+            camera_id, url, self.detector, self.incident_writer, self.artifact_writer,
+            speed_limit=speed_limit,
+            latitude=camera.latitude if camera and camera.latitude is not None else "",
+            longitude=camera.longitude if camera and camera.longitude is not None else "",
+            settings=self._settings(camera),
+            **self.worker_options
+        )
+        print(f"[INFO] Starting ingest for camera {camera_id} from {url}")
+        self.workers[camera_id] = worker.start()
+
+    @staticmethod
+    def _settings(camera):
+        return DetectionSettings.from_config(camera.extra) if camera else DetectionSettings()
+
+    def sync(self):
+        """Start, restart or stop workers so they match the current camera list."""
+        desired = self._desired()
+        for camera_id in list(self.workers):
+            worker = self.workers[camera_id]
+            target = desired.get(camera_id)
+            if target is not None and worker.finished and target[1] == worker.url:
+                continue  # 文件已正常播完，不重放
+            if (target is None or target[1] != worker.url or not worker.is_alive()
+                    or self._settings(target[0]) != worker.settings):
+                print(f"[INFO] Stopping ingest for camera {camera_id}")
+                worker.stop()
+                del self.workers[camera_id]
+        for camera_id, (camera, url) in desired.items():
+            if camera_id not in self.workers:
+                self._start_worker(camera_id, camera, url)
+
+    def _run(self):
+        while not self._stop.is_set():
+            try:
+                self.sync()
+            except FileNotFoundError:
+                print(f"[WARN] Camera file {self.registry.path} not found")
+            self._stop.wait(self.poll_interval)
+
+    def start(self):
+        self._thread = threading.Thread(target=self._run, name="stream-supervisor", daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+        for worker in self.workers.values():
+            worker.stop()
+        self.workers.clear()
+
+
+def _parse_sources(values):
+    sources = {}
+    for value in values or []:
+        camera_id, sep, url = value.partition("=")
+        if not sep or not camera_id or not url:
+            raise argparse.ArgumentTypeError(f"Expected CAMERA_ID=URL, got {value!r}")
+        sources[camera_id] = url
+    return sources
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Run live ingest workers for cameras with a stream_url.")
+    parser.add_argument("--cameras", default=os.path.join("speed_monitor_dashboard", "data", "cameras.csv"))
+    parser.add_argument("--db", default=os.path.join("speed_monitor_dashboard", "data", "incidents.db"))
+    parser.add_argument("--source", action="append", metavar="CAMERA_ID=URL",
+                        help="stream for a camera, overriding cameras.csv (repeatable)")
+    parser.add_argument("--no-loop", action="store_true", help="do not restart video files at EOF")
+    parser.add_argument("--max-backlog", type=int, default=2)
+    parser.add_argument("--speed-limit", type=float, default=60.0, help="for cameras without one")
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s [%(levelname)s] %(name)s: %(message)s")
+
+    from artifacts import ArtifactWriter
+    from inference_scheduler import InferenceScheduler
+    from storage.camera_registry import get_registry
+    from storage.incident_store import open_store
+    from storage.incident_writer import get_writer
+    from yolo_tracker import YOLOVehicleDetector
+
+    cpu_resources.configure()
+    store = open_store(args.db, cameras_csv=args.cameras)
+    supervisor = StreamSupervisor(
+        get_registry(args.cameras),
+        InferenceScheduler(YOLOVehicleDetector()),
+        incident_writer=get_writer(store),
+        artifact_writer=ArtifactWriter(root="uploads"),
+        default_speed_limit=args.speed_limit,
+        overrides=_parse_sources(args.source),
+        loop=not args.no_loop,
+        max_backlog=args.max_backlog,
+    ).start()
+    try:
+        while True:
+            time.sleep(10)
+            for camera_id, worker in sorted(supervisor.workers.items()):
+                print(f"[INFO] {camera_id}: {worker.stats}")
+    except KeyboardInterrupt:
+        supervisor.stop()
@@ -0,0 +1,110 @@
+import threading
+import time
+from types import SimpleNamespace
+
+import pytest
+
+import admission
+from admission import AdmissionController, RateLimited, RateLimiter, Saturated
+
+
+def _wait_until(condition, timeout=5):
+    deadline = time.monotonic() + timeout
+    while not condition():
+        assert time.monotonic() < deadline, "condition not reached"
+        time.sleep(0.005)
+
+
+def test_waiters_start_by_priority_then_arrival():
+    controller = AdmissionController(max_in_flight=1, max_queue=8)
+    controller.acquire()
+    started, threads = [], []
+
+    def job(name, priority):
+        controller.acquire(priority=priority, timeout=5)
+        started.append(name)
+        controller.release()
+
+    for name, priority in [("manual-1", 2), ("live-1", 0), ("manual-2", 2), ("live-2", 0), ("camera", 1)]:
+        thread = threading.Thread(target=job, args=(name, priority))
+        thread.start()
+        threads.append(thread)
+        _wait_until(lambda: controller.queued == len(threads))  # 保证按这个顺序入队
+    controller.release()
+    for thread in threads:
+        thread.join(5)
+    assert started == ["live-1", "live-2", "camera", "manual-1", "manual-2"]
+    assert controller.in_flight == 0 and controller.queued == 0
+
+
+def test_full_queue_is_rejected_immediately():
+    controller = AdmissionController(max_in_flight=1, max_queue=1, default_job_seconds=10)
+    controller.acquire()
+    waiter = threading.Thread(target=lambda: (controller.acquire(timeout=5), controller.release()))
+    waiter.start()
+    _wait_until(lambda: controller.queued == 1)
+    with pytest.raises(Saturated) as info:
+        controller.acquire(timeout=5)
+    assert info.value.retry_after == 20  # 排在第二轮：两个任务时长
+    controller.release()
+    waiter.join(5)
+    assert controller.in_flight == 0
+
+
+def test_timed_out_waiter_leaves_the_queue():
+    controller = AdmissionController(max_in_flight=1, max_queue=4, default_job_seconds=3)
+    controller.acquire()
+    with pytest.raises(Saturated, match="Timed out") as info:
+        controller.acquire(timeout=0.05)
+    assert info.value.retry_after == 3
+    assert controller.queued == 0
+    controller.release()
+    controller.acquire(timeout=0)  # 超时的请求没有占住队首
+    controller.release()
+
+
+def test_release_updates_retry_after_estimate():
+    controller = AdmissionController(max_in_flight=2, default_job_seconds=30)
+    controller.acquire()
+    controller.release(job_seconds=80)
+    assert controller.estimated_wait() == pytest.approx(40)
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = SimpleNamespace(now=1000.0)
+    monkeypatch.setattr(admission, "time", SimpleNamespace(monotonic=lambda: clock.now))
+    return clock
+
+
+def test_rate_limiter_allows_burst_then_refills(clock):
+    limiter = RateLimiter(rate_per_minute=6, burst=2)
+    limiter.check("CAM001")
+    limiter.check("CAM001")
+    with pytest.raises(RateLimited) as info:
+        limiter.check("CAM001")
+    assert info.value.retry_after == 10
+    limiter.check("CAM002")  # 每个摄像头各有一个桶
+
+    clock.now += 10
+    limiter.check("CAM001")
+    with pytest.raises(RateLimited):
+        limiter.check("CAM001")
+
+
+def test_rate_limiter_drops_refilled_buckets(clock):
+    limiter = RateLimiter(rate_per_minute=60, burst=3)
+    for key in ("CAM001", "CAM002", "CAM003"):
+        limiter.check(key)
+    clock.now += 2
+    limiter.check("CAM004")
+    assert set(limiter._buckets) == {"CAM001", "CAM002", "CAM003", "CAM004"}
+    clock.now += 2.5  # CAM001-003 空闲 4.5 秒、已经回满（3 个令牌 / 每秒 1 个）；CAM004 只过了 2.5 秒
+    limiter.check("CAM005")
+    assert set(limiter._buckets) == {"CAM004", "CAM005"}
+
+
+def test_zero_rate_disables_limit(clock):
+    limiter = RateLimiter(rate_per_minute=0, burst=0)
+    for _ in range(10):
+        limiter.check("CAM001")
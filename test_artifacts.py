@@ -0,0 +1,41 @@
+import os
+import threading
+
+import numpy as np
+
+from artifacts import ArtifactWriter, thumbnail_path
+
+
+def test_pending_counts_running_snapshots(tmp_path):
+    writer = ArtifactWriter(root=str(tmp_path), max_workers=1)
+    started, proceed = threading.Event(), threading.Event()
+
+    def annotate(image):
+        started.set()
+        proceed.wait(5)
+
+    try:
+        path = writer.snapshot_path("cd" * 16, "1")
+        future = writer.submit_snapshot(np.zeros((40, 60, 3), np.uint8), path, annotate)
+        writer.submit_snapshot(np.zeros((40, 60, 3), np.uint8), writer.snapshot_path("cd" * 16, "2"))
+        assert started.wait(5)
+        assert writer.pending() == 2  # 一个正在写，一个在排队
+        proceed.set()
+        assert future.result(5) == path
+        writer.flush(5)
+        assert writer.pending() == 0
+        assert os.path.exists(path) and os.path.exists(thumbnail_path(path))
+    finally:
+        proceed.set()
+        writer.shutdown()
+
+
+def test_failed_snapshot_is_not_pending(tmp_path):
+    writer = ArtifactWriter(root=str(tmp_path), max_workers=1)
+    try:
+        future = writer.submit_snapshot(np.zeros((0, 0, 3), np.uint8), writer.snapshot_path("ef" * 16, "1"))
+        assert future.exception(5) is not None
+        writer.flush(5)
+        assert writer.pending() == 0
+    finally:
+        writer.shutdown()
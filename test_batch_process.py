@@ -0,0 +1,71 @@
+import os
+
+import pytest
+
+from batch_process import Manifest, find_videos, main
+
+
+@pytest.fixture
+def videos(tmp_path):
+    paths = []
+    for name in ("CAM001/a.mp4", "CAM001/b.mp4", "CAM002/c.MKV", "CAM002/notes.txt"):
+        path = tmp_path / "recordings" / name
+        path.parent.mkdir(parents=True, exist_ok=True)
+        path.write_bytes(b"x" * 10)
+        paths.append(str(path))
+    return paths
+
+
+def test_find_videos_walks_directories_and_globs(tmp_path, videos):
+    root = str(tmp_path / "recordings")
+    assert find_videos([root]) == sorted(videos[:3])
+    assert find_videos([os.path.join(root, "CAM001", "*.mp4"), videos[0]]) == videos[:2]
+
+
+def test_manifest_resumes_from_disk(tmp_path, videos):
+    path = str(tmp_path / "manifest.jsonl")
+    manifest = Manifest(path)
+    manifest.record(videos[0], "failed", error="boom")
+    manifest.record(videos[0], "done", incidents=3)  # 最后一行为准
+    manifest.record(videos[1], "failed", error="boom")
+    with open(path, "a", encoding="utf-8") as f:
+        f.write('{"path": "' + videos[2])  # 中断时写了一半的行
+
+    reloaded = Manifest(path)
+    assert reloaded.status(videos[0]) == "done"
+    assert reloaded.status(videos[1]) == "failed"
+    assert reloaded.status(videos[2]) is None
+
+
+def test_changed_video_is_processed_again(tmp_path, videos):
+    manifest = Manifest(str(tmp_path / "manifest.jsonl"))
+    manifest.record(videos[0], "done")
+    with open(videos[0], "ab") as f:
+        f.write(b"more")
+    assert manifest.status(videos[0]) is None
+
+
+def test_removed_video_keeps_its_status(tmp_path, videos):
+    manifest = Manifest(str(tmp_path / "manifest.jsonl"))
+    manifest.record(videos[0], "done")
+    os.remove(videos[0])
+    assert manifest.status(videos[0]) == "done"
+
+
+@pytest.mark.parametrize("flags, expected", [
+    ([], ["b.mp4", "c.MKV"]),
+    (["--skip-failed"], ["c.MKV"]),
+    (["--force"], ["a.mp4", "b.mp4", "c.MKV"]),
+])
+def test_dry_run_skips_processed_videos(tmp_path, capsys, videos, flags, expected):
+    manifest_path = str(tmp_path / "manifest.jsonl")
+    manifest = Manifest(manifest_path)
+    manifest.record(videos[0], "done")
+    manifest.record(videos[1], "failed")
+    cameras = tmp_path / "cameras.csv"
+    cameras.write_text("camera_id,latitude,longitude,location_name,speed_limit\nCAM001,1,2,A,50\nCAM002,3,4,B,70\n")
+
+    main([str(tmp_path / "recordings"), "--manifest", manifest_path, "--cameras", str(cameras), "--dry-run"] + flags)
+    listed = [line.split("\t") for line in capsys.readouterr().out.splitlines() if "\t" in line]
+    assert [os.path.basename(path) for _, path in listed] == expected
+    assert all(camera_id == os.path.basename(os.path.dirname(path)) for camera_id, path in listed)
@@ -0,0 +1,74 @@
+import io
+
+import cv2
+import numpy as np
+import pytest
+
+import frame_ring
+from frame_ring import END, FRAME, GRANT, FrameRing, decode_to_ring, iter_frames
+
+
+@pytest.fixture
+def video(tmp_path):
+    path = str(tmp_path / "clip.mp4")
+    writer = cv2.VideoWriter(path, cv2.VideoWriter_fourcc(*"mp4v"), 10, (64, 48))
+    for i in range(12):
+        writer.write(np.full((48, 64, 3), i * 20, dtype=np.uint8))
+    writer.release()
+    return path
+
+
+def _records(data):
+    return [FRAME.unpack(data[i:i + FRAME.size]) for i in range(0, len(data), FRAME.size)]
+
+
+def test_iter_frames_yields_every_frame_in_order(video):
+    seen = []
+    for frame_id, frame, release in iter_frames(video, slots=3):
+        seen.append((frame_id, frame.shape))
+        release()
+    assert seen == [(i, (48, 64, 3)) for i in range(1, 13)]
+
+
+def test_decoder_ends_stream_after_last_frame(video):
+    ring = FrameRing(2, (48, 64, 3))
+    try:
+        grants = io.BytesIO(b"".join(GRANT.pack(i % 2) for i in range(20)))
+        out = io.BytesIO()
+        decode_to_ring(video, ring, grants, out)
+        records = _records(out.getvalue())
+        assert [r[1] for r in records[:-1]] == list(range(1, 13))
+        assert records[-1][0] == END
+    finally:
+        ring.unlink()
+
+
+class _BrokenRing(FrameRing):
+    def slot(self, index):
+        if index == 1:
+            raise IndexError("bad slot")
+        return super().slot(index)
+
+
+def test_decoder_error_does_not_look_like_end_of_video(video):
+    ring = _BrokenRing(2, (48, 64, 3))
+    try:
+        grants = io.BytesIO(b"".join(GRANT.pack(i % 2) for i in range(20)))
+        out = io.BytesIO()
+        with pytest.raises(IndexError):
+            decode_to_ring(video, ring, grants, out)
+        assert all(index != END for index, _, _ in _records(out.getvalue()))
+    finally:
+        ring.unlink()
+
+
+@pytest.mark.parametrize("script", [
+    "import sys; sys.exit(1)",  # 没有结束记录就退出
+    "import struct, sys; sys.stdout.buffer.write(struct.pack('<iqd', -1, 0, 0.0)); sys.stdout.flush(); sys.exit(3)",
+])
+def test_iter_frames_raises_when_decoder_fails(tmp_path, monkeypatch, video, script):
+    fake = tmp_path / "decoder.py"
+    fake.write_text(script)
+    monkeypatch.setattr(frame_ring, "__file__", str(fake))
+    with pytest.raises(RuntimeError, match="exited with code"):
+        list(iter_frames(video, slots=2))
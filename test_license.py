@@ -0,0 +1,62 @@
+from functools import partial
+
+import cv2
+import numpy as np
+import pytest
+
+import license
+from license import (HUE_LUT, HUE_NAMES, color_features, extract_vehicle_features, extract_vehicle_features_batch,
+                     interpret_hue)
+
+
+class _SizeOCR:
+    """Reads the crop size as the plate, so the test sees which crop OCR got."""
+
+    def readtext(self, crop):
+        return [(None, f"{crop.shape[1]}x{crop.shape[0]}", 0.9)]
+
+
+@pytest.fixture(autouse=True)
+def ocr(monkeypatch):
+    monkeypatch.setattr(license, "reader", _SizeOCR())
+
+
+BOXES = [(10, 20, 40, 30), (0, 0, 1, 1), (150, 90, 60, 50), (300, 10, 20, 20), (50, 50, 0, 10), (5, 100, 190, 19)]
+
+
+def test_hue_lut_matches_interpret_hue():
+    for hue in np.arange(0, 180, 0.25):
+        assert HUE_NAMES[HUE_LUT[int(hue)]] == interpret_hue(hue), hue
+
+
+def test_batch_matches_single_box_features_without_sampling(monkeypatch):
+    frame = np.random.default_rng(1).integers(0, 256, (120, 200, 3), dtype=np.uint8)
+    # 不抽样时必须与逐个提取完全一致
+    monkeypatch.setattr(license, "color_features", partial(color_features, sample_side=10_000))
+    batch = extract_vehicle_features_batch(frame, BOXES, ["car"] * len(BOXES))
+    assert batch == [extract_vehicle_features(frame, box, "car") for box in BOXES]
+    assert batch[3] == {} and batch[4] == {}  # 框在画面外或宽度为 0
+
+
+@pytest.mark.parametrize("hue", range(0, 180, 6))
+def test_sampled_features_of_solid_vehicle_match(hue):
+    frame = np.full((240, 320, 3), 40, dtype=np.uint8)
+    color = cv2.cvtColor(np.uint8([[[hue, 200, 200]]]), cv2.COLOR_HSV2BGR)[0, 0]
+    frame[50:170, 60:260] = color
+    box = (60, 50, 200, 120)
+
+    record = color_features(frame, [box])[0]
+    single = extract_vehicle_features(frame, box, "car")
+    assert record["valid"]
+    assert str(record["dominant_color"]) == single["dominant_color"]
+    assert tuple(record["color_rgb"]) == single["color_rgb"]
+    assert tuple(record["center"]) == single["center"]
+
+
+def test_sampling_stays_close_on_noisy_crops():
+    frame = np.random.default_rng(2).integers(0, 256, (1080, 1920, 3), dtype=np.uint8)
+    box = (100, 200, 700, 400)
+    record = color_features(frame, [box])[0]
+    crop = frame[200:600, 100:800]
+    assert np.abs(record["color_rgb"] - crop.reshape(-1, 3).mean(axis=0)[::-1]).max() < 3
+    assert abs(record["hue"] - cv2.cvtColor(crop, cv2.COLOR_BGR2HSV)[:, :, 0].mean()) < 3
@@ -0,0 +1,51 @@
+import cv2
+import numpy as np
+import pytest
+
+from artifacts import ArtifactWriter
+from pipeline import process_video
+
+
+class _FailingDetector:
+    names = {}
+
+    def __init__(self, fail_at):
+        self.fail_at = fail_at
+        self.calls = 0
+
+    def detect(self, frame, stream_id=None, imgsz=None, threshold=None):
+        self.calls += 1
+        if self.calls == self.fail_at:
+            raise RuntimeError("inference failed")
+        return []
+
+    def detect_batch(self, frames, stream_id=None, imgsz=None, threshold=None):
+        return [self.detect(frame) for frame in frames]
+
+
+@pytest.fixture
+def video(tmp_path):
+    path = str(tmp_path / "clip.mp4")
+    writer = cv2.VideoWriter(path, cv2.VideoWriter_fourcc(*"mp4v"), 10, (64, 48))
+    for i in range(20):
+        writer.write(np.full((48, 64, 3), i * 10, dtype=np.uint8))
+    writer.release()
+    return path
+
+
+@pytest.mark.parametrize("decode_process", [False, True])
+def test_clip_is_finished_when_detection_fails(tmp_path, video, decode_process):
+    artifact_writer = ArtifactWriter(root=str(tmp_path / "uploads"))
+    try:
+        with pytest.raises(RuntimeError, match="inference failed"):
+            process_video(video, _FailingDetector(fail_at=8), "CAM_TEST", 60.0, artifact_writer=artifact_writer,
+                          job_id="ab" * 16, decode_process=decode_process)
+        clips = list(artifact_writer._clips)
+        assert len(clips) == 1 and clips[0].closed
+        clips[0].join(5)
+        assert not clips[0].is_alive()
+        cap = cv2.VideoCapture(artifact_writer.clip_path("ab" * 16))
+        assert cap.get(cv2.CAP_PROP_FRAME_COUNT) == 7
+        cap.release()
+    finally:
+        artifact_writer.shutdown()
@@ -0,0 +1,55 @@
+import os
+import threading
+
+from profiling import JobProfiler, parse_mode
+
+
+def _busy(seconds=0.05):
+    import time
+    end = time.perf_counter() + seconds
+    while time.perf_counter() < end:
+        sum(range(1000))
+
+
+def test_parse_mode():
+    assert parse_mode(None) is None and parse_mode("0") is None
+    assert parse_mode("1") == "cprofile" and parse_mode("sample") == "sample"
+
+
+def test_cprofile_report(tmp_path):
+    base = str(tmp_path / "ab" / "job")
+    with JobProfiler("job", "cprofile", base) as profiler:
+        _busy()
+    assert profiler.report["mode"] == "cprofile" and "fallback" not in profiler.report
+    assert os.path.exists(base + ".prof") and os.path.exists(base + ".json")
+
+
+def test_concurrent_cprofile_falls_back_to_sampling(tmp_path):
+    entered, leave = threading.Event(), threading.Event()
+    reports = {}
+
+    def first():
+        with JobProfiler("first", "cprofile", str(tmp_path / "first")) as profiler:
+            entered.set()
+            leave.wait(5)
+        reports["first"] = profiler.report
+
+    thread = threading.Thread(target=first)
+    thread.start()
+    try:
+        assert entered.wait(5)
+        with JobProfiler("second", "cprofile", str(tmp_path / "second")) as profiler:
+            _busy()
+        reports["second"] = profiler.report
+    finally:
+        leave.set()
+        thread.join(5)
+
+    assert reports["first"]["mode"] == "cprofile"
+    assert reports["second"]["mode"] == "sample" and "fallback" in reports["second"]
+    assert os.path.exists(str(tmp_path / "second") + ".folded")
+
+    # 锁已释放，下一个任务又能用 cProfile
+    with JobProfiler("third", "cprofile", str(tmp_path / "third")) as profiler:
+        _busy()
+    assert profiler.report["mode"] == "cprofile"
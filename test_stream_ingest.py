@@ -0,0 +1,80 @@
+import cv2
+import pytest
+
+import license
+from benchmarks.synthetic_video import ColorBoxDetector, generate
+from stream_ingest import CameraWorker
+from yolo_tracker import DetectionSettings
+
+FPS = 30
+
+
+class _NoOCR:
+    def readtext(self, crop):
+        return []
+
+
+class _Writer:
+    """Incident writer that remembers how many frames were still queued at each submit."""
+
+    def __init__(self, worker):
+        self.worker = worker
+        self.calls = []
+
+    def submit_many(self, incidents):
+        self.calls.append((len(self.worker._frames), len(incidents)))
+
+
+@pytest.fixture(scope="module")
+def frames(tmp_path_factory):
+    path = str(tmp_path_factory.mktemp("stream") / "traffic.mp4")
+    generate(path, width=320, height=480, fps=FPS, seconds=6, vehicles_per_lane_minute=30, seed=3)
+    cap = cv2.VideoCapture(path)
+    decoded = []
+    while True:
+        ret, frame = cap.read()
+        if not ret:
+            break
+        decoded.append(frame)
+    cap.release()
+    return decoded
+
+
+def _run(frames, keep, settings=None):
+    worker = CameraWorker("CAM_TEST", "unused", ColorBoxDetector(), speed_limit=1.0, track_timeout=0.5,
+                          max_backlog=len(frames), settings=settings)
+    worker.incident_writer = writer = _Writer(worker)
+    worker._fps = FPS
+    for frame_no, frame in enumerate(frames, 1):
+        if keep(frame_no):
+            worker._frames.append((1, frame_no, frame))
+    worker._track_frames()  # 读线程未启动，队列取空后处理线程自然结束
+    return writer.calls
+
+
+@pytest.mark.parametrize("settings, keep", [
+    (None, lambda n: n % FPS != 0),  # 恰好是 fps 整数倍的帧都被丢弃
+    (DetectionSettings(stride=2), lambda n: n % FPS != 0 and n % 3 != 0),  # 步长 2 再加上丢帧
+])
+def test_finished_tracks_are_collected_while_frames_are_dropped(monkeypatch, frames, settings, keep):
+    monkeypatch.setattr(license, "reader", _NoOCR())
+    calls = _run(frames, keep, settings)
+
+    during_stream = [count for remaining, count in calls if remaining > 0]
+    assert sum(during_stream) > 0, "incidents were only written when the stream ended"
+
+
+def test_new_source_starts_a_new_tracker(monkeypatch, frames):
+    monkeypatch.setattr(license, "reader", _NoOCR())
+    worker = CameraWorker("CAM_TEST", "unused", ColorBoxDetector(), speed_limit=1.0, max_backlog=2 * len(frames))
+    worker.incident_writer = _Writer(worker)
+    jobs = []
+    new_job = worker._new_job
+    worker._new_job = lambda: jobs.append(new_job()) or jobs[-1]
+    for source in (1, 2):
+        for frame_no, frame in enumerate(frames[:10], 1):
+            worker._frames.append((source, frame_no, frame))
+    worker._track_frames()
+
+    assert len(jobs) == 2
+    assert all(job.frame_id == 10 for job in jobs)
@@ -0,0 +1,70 @@
+import numpy as np
+import pytest
+
+from inference_scheduler import InferenceScheduler
+from tiled_detection import TiledDetector, merge_detections, nms, tile_layout
+
+
+class _RecordingDetector:
+    names = {2: "car", 7: "truck"}
+
+    def __init__(self):
+        self.calls = []
+
+    def detect_batch(self, frames, stream_id=None, imgsz=None, threshold=None):
+        self.calls.append((len(frames), stream_id, imgsz))
+        return [[] for _ in frames]
+
+
+@pytest.mark.parametrize("width, height, tile_size", [(1920, 1080, 640), (3840, 2160, 640), (700, 500, 640)])
+def test_tile_layout_covers_frame(width, height, tile_size):
+    tiles = tile_layout(width, height, tile_size)
+    covered = np.zeros((height, width), dtype=bool)
+    for x1, y1, x2, y2 in tiles:
+        assert 0 <= x1 < x2 <= width and 0 <= y1 < y2 <= height
+        assert x2 - x1 <= tile_size and y2 - y1 <= tile_size
+        covered[y1:y2, x1:x2] = True
+    assert covered.all()
+    assert max(x2 for _, _, x2, _ in tiles) == width and max(y2 for _, _, _, y2 in tiles) == height
+
+
+def test_tile_layout_is_clipped_to_roi():
+    assert tile_layout(1920, 1080, 640, roi=(1500, 100, 1000, 400)) == ((1500, 100, 1920, 500),)
+
+
+def test_nms_is_class_aware():
+    boxes = np.array([[0, 0, 100, 100], [5, 5, 100, 100], [0, 0, 100, 100]], dtype=float)
+    keep = nms(boxes, np.array([0.9, 0.8, 0.7]), np.array([2, 2, 7]))
+    assert list(keep) == [0, 2]
+
+
+def test_merge_drops_truncated_box_covered_by_whole_one():
+    detections = np.array([
+        [600, 100, 640, 140, 0.95, 2],  # 被切块右边缘截断
+        [590, 100, 680, 140, 0.80, 2],  # 相邻切块里完整的同一辆车
+        [600, 300, 640, 340, 0.90, 2],  # 截断但没有完整框覆盖：保留
+    ])
+    merged = merge_detections(detections, np.array([True, False, True]))
+    assert [box[:4] for box in merged] == [[600, 300, 640, 340], [590, 100, 680, 140]]
+
+
+def test_stream_id_reaches_tile_and_full_frame_passes():
+    inner = _RecordingDetector()
+    tiled = TiledDetector(inner, tile_size=640)
+    tiled.detect(np.zeros((1080, 1920, 3), np.uint8), stream_id="CAM001", imgsz=960)
+    tiled.detect_batch([np.zeros((1080, 1920, 3), np.uint8)] * 2, stream_id="CAM002")
+    assert inner.calls == [(8, "CAM001", 640), (1, "CAM001", 960), (16, "CAM002", 640), (2, "CAM002", None)]
+
+
+def test_scheduler_batches_tiles_of_one_frame_together():
+    inner = _RecordingDetector()
+    scheduler = InferenceScheduler(inner, max_batch=8, max_latency=0.05)
+    try:
+        tiled = TiledDetector(scheduler, tile_size=640)
+        tiled.detect(np.zeros((1080, 1920, 3), np.uint8), stream_id="CAM001")
+        # 同一路流的单帧提交仍然每批一帧
+        futures = [scheduler.submit(np.zeros((8, 8, 3), np.uint8), "CAM001") for _ in range(3)]
+        [future.result(5) for future in futures]
+    finally:
+        scheduler.close()
+    assert [size for size, _, _ in inner.calls] == [8, 1, 1, 1, 1]
@@ -0,0 +1,194 @@
+"""
+Tiled inference for high-resolution cameras.
+
+YOLO letterboxes every frame down to its input size, so on a 4K camera a
+distant car is only a few pixels tall and is found late, which shortens its
+trajectory. TiledDetector cuts the frame (or a region of interest, e.g. the
+far end of the road) into overlapping tiles at the detector's native size,
+detects all tiles of all frames in one detect_batch() call, maps the boxes back
+to frame coordinates and merges them:
+
+  * a box cut off by a tile edge that lies inside the frame is dropped when a
+    complete box of the same class from a neighbouring tile covers it;
+  * the rest goes through class-aware NMS across tiles.
+
+By default the whole frame is detected as well (at the usual input size), so
+vehicles bigger than the tile overlap near the camera are still found whole.
+The tile layout depends only on the frame size and the tiling options and is
+cached, so every camera resolution is computed once.
+"""
+
+from functools import lru_cache
+
+import numpy as np
+
+DEFAULT_OVERLAP = 0.2
+NMS_IOU = 0.5
+COVER_RATIO = 0.6  # 被截断的框有这么大比例落在完整框内时视为同一辆车
+EDGE_MARGIN = 2  # px
+
+
+@lru_cache(maxsize=64)
+def tile_layout(width, height, tile_size, overlap=DEFAULT_OVERLAP, roi=None):
+    """
+    Overlapping tiles covering roi (default: the whole frame).
+
+    Args:
+        tile_size (int): Tile side in pixels.
+        overlap (float): Fraction of a tile shared with its neighbour.
+        roi (tuple): (x, y, w, h) region to cover, clipped to the frame.
+
+    Returns:
+        tuple: (x1, y1, x2, y2) per tile.
+    """
+    rx, ry, rw, rh = roi if roi else (0, 0, width, height)
+    rx, ry = max(0, rx), max(0, ry)
+    rx2, ry2 = min(width, rx + rw), min(height, ry + rh)
+    step = max(1, int(tile_size * (1 - overlap)))
+
+    def starts(lo, hi):
+        if hi - lo <= tile_size:
+            return [lo]
+        positions = list(range(lo, hi - tile_size, step))
+        positions.append(hi - tile_size)  # 最后一块贴齐边界，不留空隙
+        return positions
+
+    return tuple(
+        (x, y, min(x + tile_size, rx2), min(y + tile_size, ry2))
+        for y in starts(ry, ry2) for x in starts(rx, rx2)
+    )
+
+
+def _iou_matrix(a, b):
+    x1 = np.maximum(a[:, None, 0], b[None, :, 0])
+    y1 = np.maximum(a[:, None, 1], b[None, :, 1])
+    x2 = np.minimum(a[:, None, 2], b[None, :, 2])
+    y2 = np.minimum(a[:, None, 3], b[None, :, 3])
+    inter = np.clip(x2 - x1, 0, None) * np.clip(y2 - y1, 0, None)
+    area_a = (a[:, 2] - a[:, 0]) * (a[:, 3] - a[:, 1])
+    area_b = (b[:, 2] - b[:, 0]) * (b[:, 3] - b[:, 1])
+    return inter, area_a, area_b
+
+
+def nms(boxes, scores, classes, iou_threshold=NMS_IOU):
+    """Class-aware non-maximum suppression; returns the indices to keep, best first."""
+    if len(boxes) == 0:
+        return np.empty(0, dtype=int)
+    # 按类别平移坐标，使不同类别的框互不重叠，一次 NMS 即可
+    offset = (boxes.max() + 1) * classes[:, None]
+    shifted = boxes + offset
+    order = np.argsort(-scores, kind="stable")
+    keep = []
+    while order.size:
+        best = order[0]
+        keep.append(best)
+        if order.size == 1:
+            break
+        inter, area_best, area_rest = _iou_matrix(shifted[best:best + 1], shifted[order[1:]])
+        iou = inter[0] / (area_best[0] + area_rest - inter[0] + 1e-9)
+        order = order[1:][iou <= iou_threshold]
+    return np.array(keep, dtype=int)
+
+
+def merge_detections(detections, truncated, iou_threshold=NMS_IOU, cover_ratio=COVER_RATIO):
+    """
+    Merge boxes from overlapping tiles (and the full-frame pass).
+
+    Args:
+        detections (np.ndarray): N x 6 [x1, y1, x2, y2, conf, cls_id] in frame coordinates.
+        truncated (np.ndarray): N bools, True for boxes touching an inner tile edge.
+
+    Returns:
+        list: Merged [x1, y1, x2, y2, conf, cls_id] lists.
+    """
+    if len(detections) == 0:
+        return []
+    boxes, scores, classes = detections[:, :4], detections[:, 4], detections[:, 5]
+
+    drop = np.zeros(len(detections), dtype=bool)
+    cut, whole = np.flatnonzero(truncated), np.flatnonzero(~truncated)
+    if len(cut) and len(whole):
+        inter, area_cut, _ = _iou_matrix(boxes[cut], boxes[whole])
+        covered = (inter / (area_cut[:, None] + 1e-9) >= cover_ratio) & (classes[cut, None] == classes[None, whole])
+        drop[cut[covered.any(axis=1)]] = True
+
+    kept = np.flatnonzero(~drop)
+    order = kept[nms(boxes[kept], scores[kept], classes[kept], iou_threshold)]
+    return [
+        [int(x1), int(y1), int(x2), int(y2), float(conf), int(cls_id)]
+        for x1, y1, x2, y2, conf, cls_id in detections[order]
+    ]
+
+
+class TiledDetector:
+    """
+    Detector wrapper running YOLO on overlapping tiles; same interface as YOLOVehicleDetector.
+
+    Args:
+        detector: YOLOVehicleDetector or InferenceScheduler.
+        tile_size (int): Tile side in pixels; also the inference size used for tiles.
+        overlap (float): Fraction of a tile shared with its neighbour.
+        roi (tuple): (x, y, w, h) to tile; the rest of the frame only gets the full-frame pass.
+        full_frame (bool): Also detect on the whole frame at the normal inference size.
+    """
+
+    def __init__(self, detector, tile_size=640, overlap=DEFAULT_OVERLAP, roi=None, full_frame=True,
+                 iou_threshold=NMS_IOU):
+        self.detector = detector
+        self.tile_size = tile_size
+        self.overlap = overlap
+        self.roi = tuple(roi) if roi else None
+        self.full_frame = full_frame
+        self.iou_threshold = iou_threshold
+
+    @property
+    def names(self):
+        return self.detector.names
+
+    @property
+    def model(self):
+        return getattr(self.detector, "model", None)
+
+    def detect(self, frame, stream_id=None, imgsz=None, threshold=None):
+        return self.detect_batch([frame], stream_id=stream_id, imgsz=imgsz, threshold=threshold)[0]
+
+    def detect_batch(self, frames, stream_id=None, imgsz=None, threshold=None):
+        """
+        Args:
+            stream_id: Passed on with both the tile and the full-frame pass, so a scheduler keeps
+                counting the camera or job as one stream.
+            imgsz (int): Inference size of the full-frame pass; tiles always use tile_size.
+        """
+        frames = list(frames)
+        crops, owners = [], []
+        for index, frame in enumerate(frames):
+            height, width = frame.shape[:2]
+            for tile in tile_layout(width, height, self.tile_size, self.overlap, self.roi):
+                x1, y1, x2, y2 = tile
+                crops.append(np.ascontiguousarray(frame[y1:y2, x1:x2]))
+                owners.append((index, tile))
+
+        # 所有帧的所有切块一次送入检测器，整帧检测单独一批（输入尺寸不同）
+        tile_results = (self.detector.detect_batch(crops, stream_id=stream_id, imgsz=self.tile_size, threshold=threshold)
+                        if crops else [])
+        full_results = (self.detector.detect_batch(frames, stream_id=stream_id, imgsz=imgsz, threshold=threshold)
+                        if self.full_frame else [[] for _ in frames])
+
+        per_frame = [([], []) for _ in frames]
+        for (index, (tx1, ty1, tx2, ty2)), detections in zip(owners, tile_results):
+            height, width = frames[index].shape[:2]
+            for x1, y1, x2, y2, conf, cls_id in detections:
+                truncated = ((x1 <= EDGE_MARGIN and tx1 > 0) or (y1 <= EDGE_MARGIN and ty1 > 0)
+                             or (x2 >= tx2 - tx1 - EDGE_MARGIN and tx2 < width)
+                             or (y2 >= ty2 - ty1 - EDGE_MARGIN and ty2 < height))
+                per_frame[index][0].append([x1 + tx1, y1 + ty1, x2 + tx1, y2 + ty1, conf, cls_id])
+                per_frame[index][1].append(truncated)
+        for index, detections in enumerate(full_results):
+            per_frame[index][0].extend(detections)
+            per_frame[index][1].extend([False] * len(detections))
+
+        return [
+            merge_detections(np.array(boxes, dtype=float).reshape(-1, 6), np.array(truncated, dtype=bool),
+                             self.iou_threshold)
+            for boxes, truncated in per_frame
+        ]
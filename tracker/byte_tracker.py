@@ -1,3 +1,4 @@
+import itertools
 import numpy as np
 from .utils import STrack
 
@@ -6,12 +7,14 @@ class BYTETracker:
         self.tracked_stracks = []
         self.frame_id = 0
         self.frame_rate = frame_rate
+        # 每个 tracker 独立的 ID 空间，互不干扰
+        self._next_id = itertools.count(1)
 
     def update(self, detections, img_size, ori_img_size):
         self.frame_id += 1
         activated_tracks = []
 
-        new_stracks = [STrack(tlbr, cls_id=int(cls)) for *tlbr, score, cls in detections]
+        new_stracks = [STrack(tlbr, cls_id=int(cls), track_id=0) for *tlbr, score, cls in detections]
 
         for track in new_stracks:
             matched = False
@@ -23,6 +26,7 @@ class BYTETracker:
                     matched = True
                     break
             if not matched:
+                track.track_id = next(self._next_id)
                 activated_tracks.append(track)
 
         self.tracked_stracks = activated_tracks
@@ -1,8 +1,9 @@
 class STrack:
-    def __init__(self, tlbr, cls_id):
+    def __init__(self, tlbr, cls_id, track_id=None):
         self.tlbr = tlbr  # (x1, y1, x2, y2)
         self.class_id = cls_id
-        self.track_id = STrack.next_id()
+        # track_id 由所属的 BYTETracker 分配；未指定时退回进程级计数器
+        self.track_id = STrack.next_id() if track_id is None else track_id
         self.tlwh = self._tlbr_to_tlwh(tlbr)
 
     def update(self, other):
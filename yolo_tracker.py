@@ -1,6 +1,10 @@
+import threading
+from dataclasses import asdict, dataclass
 import numpy as np
+import metrics
 from tracker.byte_tracker import BYTETracker
 from tracker.byte_tracker import STrack
+from tiled_detection import TiledDetector
 from ultralytics import YOLO
 import torch
 
@@ -34,34 +38,164 @@ def estimate_speed_by_length(position_history, bbox_history, fps, vehicle_class)
     speed = dist_m / dt * 3.6
     return round(speed, 1)
 
-class YOLOByteTrackWrapper:
-    def __init__(self, model_path="yolov8n.pt", threshold=0.5, frame_rate=30):
+@dataclass(frozen=True)
+class DetectionSettings:
+    """
+    Per-camera detection knobs, stored as optional columns of cameras.csv
+    (written by tune_cameras.py).
+
+    Attributes:
+        imgsz (int): Inference size; None keeps the model's default (640).
+        threshold (float): Minimum confidence of a vehicle detection.
+        batch_size (int): Frames of one video detected per forward pass.
+        stride (int): Detect and track every stride-th frame only.
+        tile_size (int): Detect on overlapping tiles of this size (tiled_detection.py); None disables tiling.
+        tile_roi (tuple): (x, y, w, h) region to tile, e.g. the far end of the road; None tiles the whole frame.
+    """
+
+    imgsz: int = None
+    threshold: float = 0.5
+    batch_size: int = 1
+    stride: int = 1
+    tile_size: int = None
+    tile_roi: tuple = None
+
+    # 属性名 -> cameras.csv 列名
+    COLUMNS = {"imgsz": "imgsz", "threshold": "conf_threshold", "batch_size": "batch_size", "stride": "detect_stride",
+               "tile_size": "tile_size", "tile_roi": "tile_roi"}
+
+    @classmethod
+    def from_config(cls, config):
+        """Build settings from a camera's extra columns; empty or invalid values keep the default."""
+        values = {}
+        for name, column in cls.COLUMNS.items():
+            raw = (config or {}).get(column)
+            if raw is None or str(raw).strip() == "":
+                continue
+            try:
+                if name == "tile_roi":
+                    value = tuple(int(float(v)) for v in str(raw).split(","))
+                    if len(value) != 4:
+                        raise ValueError(raw)
+                elif name == "threshold":
+                    value = float(raw)
+                else:
+                    value = int(float(raw))
+            except ValueError:
+                print(f"[WARN] Ignoring invalid {column}={raw!r}")
+                continue
+            if name in ("threshold", "tile_roi") or value > 0:
+                values[name] = value
+        return cls(**values)
+
+    def to_config(self):
+        """Column -> value, for writing back to cameras.csv."""
+        config = {}
+        for name, column in self.COLUMNS.items():
+            value = getattr(self, name)
+            if value is None:
+                value = ""
+            elif name == "tile_roi":
+                value = ",".join(str(v) for v in value)
+            config[column] = value
+        return config
+
+    def detect_options(self):
+        """Keyword arguments for detect()/detect_batch()."""
+        return {"imgsz": self.imgsz, "threshold": self.threshold}
+
+    def to_dict(self):
+        return asdict(self)
+
+
+class YOLOVehicleDetector:
+    """Shared YOLO model; safe to call from several request threads at once."""
+
+    def __init__(self, model_path="yolov8n.pt", threshold=0.5):
         self.model = YOLO(model_path)
         self.device = "cuda" if torch.cuda.is_available() else "cpu"
         self.model.to(self.device)
         print(f"✅ YOLOv8 loaded on {self.device.upper()}")
         self.threshold = threshold
-        self.byte_tracker = BYTETracker(frame_rate=frame_rate)
+        self.names = self.model.names
+        # ultralytics 的 predictor 不是线程安全的，推理时串行化
+        self._lock = threading.Lock()
 
-    def detect_and_track(self, frame):
-        result = self.model(frame, verbose=False)[0]
-        detections = []
+    def detect(self, frame, stream_id=None, imgsz=None, threshold=None):
+        """Return vehicle detections as [x1, y1, x2, y2, conf, cls_id] lists."""
+        return self.detect_batch([frame], imgsz=imgsz, threshold=threshold)[0]
 
+    def detect_batch(self, frames, stream_id=None, imgsz=None, threshold=None):
+        """
+        Run one forward pass over several frames; returns one detection list per frame.
+
+        Args:
+            stream_id: Ignored; accepted for interface parity with InferenceScheduler.
+            imgsz (int): Inference size (None: the model's default).
+            threshold (float): Confidence threshold (None: self.threshold).
+        """
+        frames = list(frames)
+        options = {"imgsz": imgsz} if imgsz else {}
+        metrics.INFERENCE_BATCH_SIZE.observe(len(frames))
+        with self._lock, metrics.stage("inference"):
+            results = self.model(frames, verbose=False, **options)
+        threshold = self.threshold if threshold is None else threshold
+        return [self._vehicle_detections(result, threshold) for result in results]
+
+    def _vehicle_detections(self, result, threshold):
+        detections = []
         for box, cls_id, conf in zip(result.boxes.xyxy, result.boxes.cls, result.boxes.conf):
-            class_name = self.model.names[int(cls_id)]
-            if class_name in VEHICLE_CLASSES and conf > self.threshold:
+            class_name = self.names[int(cls_id)]
+            if class_name in VEHICLE_CLASSES and conf > threshold:
                 x1, y1, x2, y2 = map(int, box.tolist())
                 detections.append([x1, y1, x2, y2, conf.item(), int(cls_id)])
 
+        return detections
+
+
+class YOLOByteTrackWrapper:
+    """Per-job tracker state on top of a (possibly shared) detector.
+
+    Each wrapper owns its own BYTETracker and therefore its own track ID
+    namespace; pass detector= to share one loaded model (or an
+    InferenceScheduler in front of it) between jobs.
+    """
+
+    def __init__(self, model_path="yolov8n.pt", threshold=0.5, frame_rate=30, detector=None, stream_id=None,
+                 settings=None):
+        """
+        Args:
+            settings (DetectionSettings): Per-camera knobs; defaults to threshold with the model's input size.
+        """
+        self.settings = settings or DetectionSettings(threshold=threshold)
+        self.detector = detector or YOLOVehicleDetector(model_path, self.settings.threshold)
+        if self.settings.tile_size:
+            # 高分辨率摄像头：切块检测后合并，远处的小目标不会被缩没
+            self.detector = TiledDetector(self.detector, tile_size=self.settings.tile_size, roi=self.settings.tile_roi)
+        self.stream_id = stream_id
+        self.model = getattr(self.detector, "model", None)
+        # 隔帧检测时跟踪器看到的帧率相应降低
+        self.byte_tracker = BYTETracker(frame_rate=max(1, round(frame_rate / self.settings.stride)))
+
+    def detect_and_track(self, frame):
+        detections = self.detector.detect(frame, stream_id=self.stream_id, **self.settings.detect_options())
+        return self.track(detections, frame.shape[:2])
+
+    def detect_batch(self, frames):
+        """Detections for several consecutive frames of this job (one forward pass when possible)."""
+        return self.detector.detect_batch(frames, stream_id=self.stream_id, **self.settings.detect_options())
+
+    def track(self, detections, frame_shape):
+        """Feed one frame's detections to this job's tracker."""
         tracks = []
-        if detections:
-            dets_for_byte = np.array(detections)
-            online_targets = self.byte_tracker.update(dets_for_byte, frame.shape[:2], frame.shape[:2])
+        if len(detections):
+            with metrics.stage("tracking"):
+                online_targets = self.byte_tracker.update(np.array(detections), frame_shape, frame_shape)
 
             for t in online_targets:
                 x, y, w, h = map(int, t.tlwh)
                 track_id = t.track_id
-                class_name = self.model.names[t.class_id]
+                class_name = self.detector.names[t.class_id]
                 tracks.append({
                     "id": track_id,
                     "bbox": (x, y, w, h),